@@ -0,0 +1,56 @@
+import time, threading
+from typing import Any, Hashable, Optional
+import numpy as np
+
+
+class AnswerCache:
+    """Semantic cache of full answers, matched by query-embedding cosine.
+
+    Entries only match within the same scope (k, session filters, ...) and
+    the same index version; seeing a newer version drops everything, so an
+    ingest that changes the index invalidates all cached answers.
+    """
+
+    def __init__(self, threshold: float, maxsize: int, ttl: float):
+        self.threshold = threshold
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._version: Optional[int] = None
+        self._entries: list[tuple[float, Hashable, np.ndarray, Any]] = []
+        self._lock = threading.Lock()
+
+    def _check_version(self, version: int):
+        if version != self._version:
+            self._entries.clear()
+            self._version = version
+
+    def lookup(self, vector: list[float], scope: Hashable, version: int) -> Optional[Any]:
+        now = time.monotonic()
+        with self._lock:
+            self._check_version(version)
+            self._entries = [e for e in self._entries if now - e[0] <= self.ttl]
+            candidates = [e for e in self._entries if e[1] == scope]
+            if candidates:
+                # Vectors are L2-normalized, so the dot product is the cosine
+                sims = np.stack([e[2] for e in candidates]) @ np.asarray(vector, dtype=np.float32)
+                best = int(np.argmax(sims))
+                if sims[best] >= self.threshold:
+                    self.hits += 1
+                    return candidates[best][3]
+            self.misses += 1
+            return None
+
+    def store(self, vector: list[float], scope: Hashable, version: int, value: Any):
+        with self._lock:
+            self._check_version(version)
+            self._entries.append((time.monotonic(), scope, np.asarray(vector, dtype=np.float32), value))
+            if len(self._entries) > self.maxsize:
+                del self._entries[:len(self._entries) - self.maxsize]
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {"size": len(self._entries), "index_version": self._version,
+                "hits": self.hits, "misses": self.misses,
+                "hit_ratio": round(self.hits / total, 3) if total else 0.0}
\ No newline at end of file
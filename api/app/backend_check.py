@@ -0,0 +1,130 @@
+"""Compare the configured inference backend against the fp32 torch models.
+
+Embeds a sample of note chunks with both, then reports the speedup, how far
+the vectors moved, and how much retrieval changes (top-k overlap and score
+drift for pseudo-queries taken from the notes). Does the same for the
+reranker when RERANKER_BACKEND is not torch.
+
+    python -m app.backend_check --sample 300 --queries 30 --k 10
+"""
+import argparse, json, random, time
+import numpy as np
+from sentence_transformers import SentenceTransformer, CrossEncoder
+from app.config import settings
+from app.chunker import chunk_markdown
+from app.embeddings import load_model, count_tokens, chunk_token_limit
+from app.ingest import iter_note_files
+
+
+def sample_chunks(n: int, seed: int) -> list[str]:
+    # Chunked exactly as ingest chunks them
+    texts = []
+    limit = chunk_token_limit()
+    for _, path, *_ in iter_note_files():
+        with open(path, "r", encoding="utf-8") as f:
+            md = f.read()
+        for _, chunks in chunk_markdown(md, count_tokens, limit, min(settings.chunk_overlap_tokens, limit // 2)):
+            texts.extend(c.text for c in chunks if c.text.strip())
+    random.Random(seed).shuffle(texts)
+    return texts[:n]
+
+
+def pseudo_queries(texts: list[str], n: int, seed: int) -> list[str]:
+    # The opening words of a chunk make a reasonable stand-in for a question about it
+    picked = random.Random(seed + 1).sample(texts, min(n, len(texts)))
+    return [" ".join(t.split()[:12]) for t in picked]
+
+
+def _encode(model, texts: list[str]) -> tuple[np.ndarray, float]:
+    t0 = time.perf_counter()
+    vecs = model.encode(texts, batch_size=settings.embed_batch_size,
+                        normalize_embeddings=True, convert_to_numpy=True)
+    return vecs.astype(np.float32), time.perf_counter() - t0
+
+
+def _topk(scores: np.ndarray, k: int) -> list[set]:
+    return [set(row) for row in np.argsort(-scores, axis=1)[:, :k]]
+
+
+def check_embedder(texts: list[str], queries: list[str], k: int) -> dict:
+    ref = load_model(SentenceTransformer, settings.embed_model_name)
+    cand = load_model(SentenceTransformer, settings.embed_model_name, settings.embed_backend,
+                      settings.embed_onnx_file, settings.embed_quantization)
+    for model in (ref, cand):
+        model.encode(texts[:4])  # warm up
+
+    ref_docs, ref_seconds = _encode(ref, texts)
+    cand_docs, cand_seconds = _encode(cand, texts)
+    ref_q, _ = _encode(ref, queries)
+    cand_q, _ = _encode(cand, queries)
+
+    vector_cos = np.sum(ref_docs * cand_docs, axis=1)
+    ref_scores, cand_scores = ref_q @ ref_docs.T, cand_q @ cand_docs.T
+    overlap = [len(a & b) / k for a, b in zip(_topk(ref_scores, k), _topk(cand_scores, k))]
+    drift = np.abs(ref_scores - cand_scores)
+    return {
+        "backend": settings.embed_backend,
+        "variant": settings.embed_quantization or settings.embed_onnx_file or "default",
+        "fp32_seconds": round(ref_seconds, 3),
+        "backend_seconds": round(cand_seconds, 3),
+        "speedup": round(ref_seconds / cand_seconds, 2) if cand_seconds else None,
+        "vector_cosine_mean": round(float(vector_cos.mean()), 5),
+        "vector_cosine_min": round(float(vector_cos.min()), 5),
+        f"top{k}_overlap_mean": round(float(np.mean(overlap)), 4),
+        "score_drift_mean": round(float(drift.mean()), 5),
+        "score_drift_max": round(float(drift.max()), 5),
+    }
+
+
+def check_reranker(texts: list[str], queries: list[str], k: int) -> dict:
+    ref = load_model(CrossEncoder, settings.reranker_model_name)
+    cand = load_model(CrossEncoder, settings.reranker_model_name, settings.reranker_backend,
+                      settings.reranker_onnx_file, settings.reranker_quantization)
+    pairs = [(q, t) for q in queries for t in texts[:k]]
+    for model in (ref, cand):
+        model.predict(pairs[:4])  # warm up
+
+    t0 = time.perf_counter()
+    ref_scores = np.asarray(ref.predict(pairs), dtype=np.float32).reshape(len(queries), -1)
+    ref_seconds = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    cand_scores = np.asarray(cand.predict(pairs), dtype=np.float32).reshape(len(queries), -1)
+    cand_seconds = time.perf_counter() - t0
+
+    drift = np.abs(ref_scores - cand_scores)
+    top1 = np.mean(np.argmax(ref_scores, axis=1) == np.argmax(cand_scores, axis=1))
+    return {
+        "backend": settings.reranker_backend,
+        "variant": settings.reranker_quantization or settings.reranker_onnx_file or "default",
+        "pairs": len(pairs),
+        "fp32_seconds": round(ref_seconds, 3),
+        "backend_seconds": round(cand_seconds, 3),
+        "speedup": round(ref_seconds / cand_seconds, 2) if cand_seconds else None,
+        "top1_agreement": round(float(top1), 4),
+        "score_drift_mean": round(float(drift.mean()), 5),
+        "score_drift_max": round(float(drift.max()), 5),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sample", type=int, default=300, help="chunks to embed")
+    parser.add_argument("--queries", type=int, default=30, help="pseudo-queries for retrieval drift")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    texts = sample_chunks(args.sample, args.seed)
+    if not texts:
+        raise SystemExit("No note chunks found; check the NOTES_*_DIR settings")
+    queries = pseudo_queries(texts, args.queries, args.seed)
+    k = min(args.k, len(texts))
+
+    report = {"chunks": len(texts), "queries": len(queries), "embedder": check_embedder(texts, queries, k)}
+    if settings.reranker_backend != "torch":
+        report["reranker"] = check_reranker(texts, queries, k)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,142 @@
+import time, queue, threading
+from collections import OrderedDict
+from concurrent.futures import Future, InvalidStateError
+from typing import Any, Callable, Hashable, Optional
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries also expire after `ttl` seconds."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or (self.ttl and time.monotonic() - item[0] > self.ttl):
+                if item is not None:
+                    del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def put(self, key: Hashable, value: Any):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic(), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def discard(self, key: Hashable):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {"size": len(self._data), "hits": self.hits, "misses": self.misses,
+                "hit_ratio": round(self.hits / total, 3) if total else 0.0}
+
+
+class MicroBatcher:
+    """Merges items submitted from many threads into batched calls of `fn`.
+
+    A background thread waits for the first item, then keeps collecting for
+    up to `max_wait_ms` (or until `max_batch` items) and calls `fn(items)`,
+    which must return one result per item. Each caller gets a Future.
+    """
+
+    def __init__(self, fn: Callable[[list], list], max_batch: int, max_wait_ms: float, name: str):
+        self.fn = fn
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.name = name
+        self._queue: queue.Queue = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._batches = 0
+        self._items = 0
+        self._max_batch_seen = 0
+        self._wait_total = 0.0
+
+    def submit(self, item: Any) -> Future:
+        fut: Future = Future()
+        self._ensure_started()
+        self._queue.put((time.perf_counter(), item, fut))
+        return fut
+
+    def __call__(self, item: Any) -> Any:
+        return self.submit(item).result()
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.perf_counter() + self.max_wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            # Waiters that gave up (a cancelled request) are dropped; claimed ones can no longer be cancelled
+            batch = [entry for entry in batch if entry[2].set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            started = time.perf_counter()
+            futures = [fut for _, _, fut in batch]
+            try:
+                results = self.fn([item for _, item, _ in batch])
+            except BaseException as e:
+                for fut in futures:
+                    _settle(fut.set_exception, e)
+            else:
+                for fut, result in zip(futures, results):
+                    _settle(fut.set_result, result)
+
+            with self._lock:
+                self._batches += 1
+                self._items += len(batch)
+                self._max_batch_seen = max(self._max_batch_seen, len(batch))
+                self._wait_total += sum(started - t for t, _, _ in batch)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "batches": self._batches,
+                "items": self._items,
+                "avg_batch_size": round(self._items / self._batches, 2) if self._batches else 0.0,
+                "max_batch_size": self._max_batch_seen,
+                "avg_queue_wait_ms": round(self._wait_total * 1000 / self._items, 2) if self._items else 0.0,
+                "queued": self._queue.qsize(),
+            }
+
+
+def _settle(setter: Callable[[Any], None], value: Any):
+    # One future already finished must not take the worker thread down with it
+    try:
+        setter(value)
+    except InvalidStateError:
+        pass
@@ -0,0 +1,82 @@
+"""Compare hybrid-search latency of the local index against Weaviate.
+
+Both indexes must hold the same notes: scan with the usual backend, then
+pass --build-local (or scan with RETRIEVAL_BACKEND=local) to fill the local
+one. Queries are embedded up front, so only the search itself is timed.
+Also reports how many of Weaviate's top-k chunks the local index returns.
+
+    python -m app.bench_retrieval --build-local --queries 50 --k 30
+"""
+import argparse, json, time
+import numpy as np
+from app.backend_check import sample_chunks, pseudo_queries
+from app.embeddings import embed_texts
+from app.ingest import scan_once
+from app.retrieval import hybrid_search
+
+
+def _latency(seconds: list[float]) -> dict:
+    ms = np.asarray(seconds) * 1000
+    return {
+        "mean_ms": round(float(ms.mean()), 2),
+        "p50_ms": round(float(np.percentile(ms, 50)), 2),
+        "p95_ms": round(float(np.percentile(ms, 95)), 2),
+        "max_ms": round(float(ms.max()), 2),
+    }
+
+
+def run(backend: str, queries: list[str], vectors: list[list[float]], k: int, repeat: int):
+    hybrid_search(queries[0], k=k, query_vector=vectors[0], backend=backend)  # warm up
+    seconds, results = [], []
+    for _ in range(repeat):
+        for query, vec in zip(queries, vectors):
+            t0 = time.perf_counter()
+            items = hybrid_search(query, k=k, query_vector=vec, backend=backend)
+            seconds.append(time.perf_counter() - t0)
+            results.append(items)
+    return _latency(seconds), results[:len(queries)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queries", type=int, default=50, help="pseudo-queries taken from the notes")
+    parser.add_argument("--k", type=int, default=30)
+    parser.add_argument("--repeat", type=int, default=3, help="passes over the query set")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--build-local", action="store_true", help="scan the notes into the local index first")
+    args = parser.parse_args()
+
+    report = {}
+    if args.build_local:
+        stats = scan_once(backend="local")
+        report["local_scan"] = {key: stats[key] for key in ("indexed_docs", "indexed_chunks", "skipped", "deleted")}
+
+    texts = sample_chunks(max(args.queries * 4, 200), args.seed)
+    if not texts:
+        raise SystemExit("No note chunks found; check the NOTES_*_DIR settings")
+    queries = pseudo_queries(texts, args.queries, args.seed)
+    vectors = embed_texts(queries, use_cache=False)
+
+    weaviate_latency, weaviate_results = run("weaviate", queries, vectors, args.k, args.repeat)
+    local_latency, local_results = run("local", queries, vectors, args.k, args.repeat)
+
+    # Chunk ids differ between backends (document ids do not), so match chunks by document and text
+    overlap = []
+    for ref, cand in zip(weaviate_results, local_results):
+        ref_keys = {(it["doc_id"], it["text"]) for it in ref}
+        if ref_keys:
+            overlap.append(len(ref_keys & {(it["doc_id"], it["text"]) for it in cand}) / len(ref_keys))
+
+    report.update({
+        "queries": len(queries),
+        "k": args.k,
+        "weaviate": weaviate_latency,
+        "local": local_latency,
+        "speedup_p50": round(weaviate_latency["p50_ms"] / local_latency["p50_ms"], 2) if local_latency["p50_ms"] else None,
+        f"top{args.k}_overlap_mean": round(float(np.mean(overlap)), 4) if overlap else None,
+    })
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,138 @@
+import time, threading
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Optional
+from weaviate.classes.data import DataObject
+from weaviate.classes.query import Filter
+from app.config import settings
+from app.weaviate_client import get_client
+
+
+class BulkWriter:
+    """Buffers objects per collection and writes them with `insert_many`.
+
+    Safe to feed from several threads. Full batches are written by a small
+    thread pool. Objects that fail are retried with backoff; anything still
+    failing ends up in `failed_objects` and in the per-batch `errors` report.
+    """
+
+    def __init__(self,
+                 batch_size: Optional[int] = None,
+                 concurrency: Optional[int] = None,
+                 max_retries: Optional[int] = None):
+        self.batch_size = batch_size or settings.write_batch_size
+        self.max_retries = settings.write_max_retries if max_retries is None else max_retries
+        concurrency = concurrency or settings.write_concurrency
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="weaviate-writer")
+        # Bound batches in flight so callers block (backpressure) instead of buffering without limit
+        self._in_flight = threading.BoundedSemaphore(concurrency * 2)
+        self._buffers: dict[str, list[DataObject]] = {}
+        self._futures: list[Future] = []
+        self._lock = threading.Lock()
+        self._buffer_lock = threading.Lock()
+        self._batch_no = 0
+        self.failed_objects: list[tuple[str, DataObject]] = []
+        self.errors: list[dict] = []
+        self.stats = {"written": 0, "failed": 0, "retried": 0, "batches": 0,
+                      "write_seconds": 0.0, "max_batch_ms": 0.0}
+
+    def add(self, collection: str, properties: dict, uuid: Optional[str] = None,
+            references: Optional[dict] = None, vector: Optional[list[float]] = None):
+        obj = DataObject(properties=properties, uuid=uuid, references=references, vector=vector)
+        with self._buffer_lock:
+            buf = self._buffers.setdefault(collection, [])
+            buf.append(obj)
+            full = self._buffers.pop(collection) if len(buf) >= self.batch_size else None
+        if full:
+            self._submit(collection, full)
+
+    def _submit(self, collection: str, objects: list[DataObject]):
+        with self._lock:
+            self._batch_no += 1
+            batch_no = self._batch_no
+        self._in_flight.acquire()
+        fut = self._executor.submit(self._write_batch, collection, objects, batch_no)
+        fut.add_done_callback(lambda _: self._in_flight.release())
+        self._futures.append(fut)
+
+    def _write_batch(self, collection: str, objects: list[DataObject], batch_no: int):
+        coll = get_client().collections.get(collection)
+        pending, attempt, messages = objects, 0, []
+        t0 = time.perf_counter()
+        while True:
+            try:
+                result = coll.data.insert_many(pending)
+                failed = [pending[i] for i in sorted(result.errors)]
+                messages = [err.message for err in result.errors.values()]
+            except Exception as e:
+                # Whole request failed (timeout, connection reset): retry all of it
+                failed, messages = pending, [str(e)]
+            if not failed or attempt >= self.max_retries:
+                break
+            attempt += 1
+            with self._lock:
+                self.stats["retried"] += len(failed)
+            time.sleep(min(0.5 * 2 ** (attempt - 1), 5.0))
+            pending = failed
+        elapsed = time.perf_counter() - t0
+
+        with self._lock:
+            self.stats["batches"] += 1
+            self.stats["written"] += len(objects) - len(failed)
+            self.stats["failed"] += len(failed)
+            self.stats["write_seconds"] += elapsed
+            self.stats["max_batch_ms"] = max(self.stats["max_batch_ms"], elapsed * 1000)
+            if failed:
+                self.failed_objects.extend((collection, obj) for obj in failed)
+                self.errors.append({
+                    "batch": batch_no,
+                    "collection": collection,
+                    "size": len(objects),
+                    "failed": len(failed),
+                    "attempts": attempt + 1,
+                    "messages": sorted(set(messages))[:5],
+                })
+
+    def delete_document_chunks(self, doc_uuid: str):
+        # Deletes are not batched; they run before the document's new chunks are added
+        chunks = get_client().collections.get("Chunk")
+        chunks.data.delete_many(where=Filter.by_ref(link_on="ofDoc").by_id().equal(doc_uuid))
+
+    def delete_document(self, doc_uuid: str):
+        self.delete_document_chunks(doc_uuid)
+        get_client().collections.get("Document").data.delete_by_id(doc_uuid)
+
+    def flush(self):
+        with self._buffer_lock:
+            buffers, self._buffers = self._buffers, {}
+        for collection, objects in buffers.items():
+            if objects:
+                self._submit(collection, objects)
+        futures, self._futures = self._futures, []
+        for fut in futures:
+            fut.result()
+
+    def close(self):
+        self.flush()
+        self._executor.shutdown(wait=True)
+
+    def report(self) -> dict:
+        batches = self.stats["batches"]
+        return {
+            "write_seconds": round(self.stats["write_seconds"], 3),
+            "write_batches": batches,
+            "write_avg_batch_ms": round(self.stats["write_seconds"] * 1000 / batches, 1) if batches else 0.0,
+            "write_max_batch_ms": round(self.stats["max_batch_ms"], 1),
+            "write_retried": self.stats["retried"],
+            "write_failed": self.stats["failed"],
+            "write_errors": self.errors,
+        }
+
+    def failed_doc_uuids(self) -> set[str]:
+        # Documents whose own object or any of whose chunks did not make it in
+        out = set()
+        for collection, obj in self.failed_objects:
+            if collection == "Document" and obj.uuid:
+                out.add(str(obj.uuid))
+            elif collection == "Chunk" and obj.references and obj.references.get("ofDoc"):
+                out.add(str(obj.references["ofDoc"]))
+        return out
\ No newline at end of file
@@ -0,0 +1,124 @@
+import re
+from typing import Callable, NamedTuple, Optional
+from app.utils import HEADING_RE
+
+
+# Split points, coarsest first: blank lines, sentence ends, whitespace
+PARAGRAPH_RE = re.compile(r"\n[ \t]*\n\s*")
+SENTENCE_RE = re.compile(r"(?:(?<=[.!?])|(?<=[.!?][\"')\]]))\s+")
+WORD_RE = re.compile(r"\S+")
+# Sentence ends or line breaks (bullet lists rarely end in punctuation)
+CLAUSE_RE = re.compile(SENTENCE_RE.pattern + r"|\s*\n\s*")
+
+TokenCounter = Callable[[list[str]], list[int]]
+
+
+class Chunk(NamedTuple):
+    text: str
+    start: int  # offsets into the whole document
+    end: int
+
+
+def _trim(text: str, start: int, end: int) -> tuple[int, int]:
+    while start < end and text[start].isspace():
+        start += 1
+    while end > start and text[end - 1].isspace():
+        end -= 1
+    return start, end
+
+
+def _split(text: str, start: int, end: int, pattern: re.Pattern) -> list[tuple[int, int]]:
+    spans, pos = [], start
+    for m in pattern.finditer(text, start, end):
+        spans.append((pos, m.start()))
+        pos = m.end()
+    spans.append((pos, end))
+    spans = [_trim(text, s, e) for s, e in spans]
+    return [(s, e) for s, e in spans if s < e]
+
+
+def sentence_spans(text: str) -> list[tuple[int, int]]:
+    """(start, end) of each sentence or list line in `text`."""
+    return _split(text, 0, len(text), CLAUSE_RE)
+
+
+def sections(md: str) -> list[tuple[Optional[str], int, int]]:
+    """(heading, body start, body end) per H2+ section; text before the first heading is its own section."""
+    matches = list(HEADING_RE.finditer(md))
+    bounds = [(None, 0, matches[0].start() if matches else len(md))]
+    for i, m in enumerate(matches):
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(md)
+        bounds.append((m.group(2).strip(), m.end(), end))
+    out = []
+    for heading, start, end in bounds:
+        start, end = _trim(md, start, end)
+        if start < end:
+            out.append((heading, start, end))
+    return out
+
+
+def _units(text: str, start: int, end: int, count: TokenCounter, limit: int) -> list[tuple[int, int, int]]:
+    # (start, end, tokens) pieces no bigger than `limit`, split as coarsely as possible
+    units = []
+    paragraphs = _split(text, start, end, PARAGRAPH_RE)
+    for (ps, pe), n in zip(paragraphs, count([text[s:e] for s, e in paragraphs])):
+        if n <= limit:
+            units.append((ps, pe, n))
+            continue
+        sentences = _split(text, ps, pe, SENTENCE_RE)
+        for (ss, se), sn in zip(sentences, count([text[s:e] for s, e in sentences])):
+            if sn <= limit:
+                units.append((ss, se, sn))
+                continue
+            # A single huge "sentence" (tables, lists without punctuation): fall back to words
+            words = [(m.start(), m.end()) for m in WORD_RE.finditer(text, ss, se)]
+            run, run_tokens = None, 0
+            for (ws, we), wn in zip(words, count([text[s:e] for s, e in words])):
+                if run is not None and run_tokens + wn > limit:
+                    units.append((run, prev_end, run_tokens))
+                    run = None
+                if run is None:
+                    run, run_tokens = ws, 0
+                run_tokens += wn
+                prev_end = we
+            if run is not None:
+                units.append((run, prev_end, run_tokens))
+    return units
+
+
+def _pack(units: list[tuple[int, int, int]], limit: int, overlap: int) -> list[tuple[int, int]]:
+    # Greedily fill chunks up to `limit` tokens; each new chunk repeats the
+    # trailing units of the previous one, up to `overlap` tokens
+    out, current, tokens = [], [], 0
+    for unit in units:
+        if current and tokens + unit[2] > limit:
+            out.append((current[0][0], current[-1][1]))
+            carried, carried_tokens = [], 0
+            for u in reversed(current[1:]):
+                if carried_tokens + u[2] > overlap:
+                    break
+                carried.insert(0, u)
+                carried_tokens += u[2]
+            current, tokens = carried, carried_tokens
+            while current and tokens + unit[2] > limit:
+                tokens -= current.pop(0)[2]
+        current.append(unit)
+        tokens += unit[2]
+    if current:
+        out.append((current[0][0], current[-1][1]))
+    return out
+
+
+def chunk_markdown(md: str, count: TokenCounter, max_tokens: int,
+                   overlap_tokens: int = 0) -> list[tuple[Optional[str], list[Chunk]]]:
+    """Split a note into (heading, chunks) per section.
+
+    Chunks hold at most `max_tokens` tokens as counted by `count` (the
+    embedding model's tokenizer), break at paragraph, then sentence, then
+    word boundaries, and carry their offsets in `md`.
+    """
+    out = []
+    for heading, start, end in sections(md):
+        units = _units(md, start, end, count, max_tokens)
+        out.append((heading, [Chunk(md[s:e], s, e) for s, e in _pack(units, max_tokens, overlap_tokens)]))
+    return out
\ No newline at end of file
@@ -0,0 +1,15 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable
+from app.config import settings
+
+
+# CPU-bound model work (embedding, reranking) runs here so the event loop
+# stays free and at most `cpu_workers` requests compete for the CPU at once.
+cpu_executor = ThreadPoolExecutor(max_workers=settings.cpu_workers, thread_name_prefix="cpu")
+
+
+async def run_cpu(fn: Callable[..., Any], *args, **kwargs) -> Any:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(cpu_executor, partial(fn, *args, **kwargs))
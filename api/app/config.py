@@ -11,14 +11,116 @@ class Settings(BaseModel):
     embed_model_name: str = os.getenv("EMBED_MODEL_NAME", "BAAI/bge-small-en-v1.5")
     reranker_model_name: str = os.getenv("RERANKER_MODEL_NAME", "BAAI/bge-reranker-base")
     enable_reranker: bool = os.getenv("ENABLE_RERANKER", "false").lower() == "true"
+
+    # Inference backend: "torch" (fp32), "onnx" or "openvino". With onnx, *_QUANTIZATION
+    # (avx512_vnni, avx512, avx2, arm64) exports and loads a dynamic int8 model.
+    embed_backend: str = os.getenv("EMBED_BACKEND", "torch")
+    embed_onnx_file: str = os.getenv("EMBED_ONNX_FILE", "")  # e.g. onnx/model_O3.onnx from the model repo
+    embed_quantization: str = os.getenv("EMBED_QUANTIZATION", "")
+    reranker_backend: str = os.getenv("RERANKER_BACKEND", "torch")
+    reranker_onnx_file: str = os.getenv("RERANKER_ONNX_FILE", "")
+    reranker_quantization: str = os.getenv("RERANKER_QUANTIZATION", "")
     max_context_chunks: int = int(os.getenv("MAX_CONTEXT_CHUNKS", "8"))
-    
+
+    # Prompt context packing: tokens allowed for the [Context] section, 0 = MAX_CONTEXT_CHUNKS whole chunks
+    context_token_budget: int = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500"))
+    context_full_chunks: int = int(os.getenv("CONTEXT_FULL_CHUNKS", "3"))  # top chunks never trimmed
+    context_trim_tokens: int = int(os.getenv("CONTEXT_TRIM_TOKENS", "96"))  # per trimmed chunk
+    context_dedupe_similarity: float = float(os.getenv("CONTEXT_DEDUPE_SIMILARITY", "0.95"))  # 0 = off
+
+    # Ingest tuning
+    chunk_max_tokens: int = int(os.getenv("CHUNK_MAX_TOKENS", "0"))  # 0 = the embedding model's limit
+    chunk_overlap_tokens: int = int(os.getenv("CHUNK_OVERLAP_TOKENS", "48"))
+    embed_batch_size: int = int(os.getenv("EMBED_BATCH_SIZE", "32"))
+    ingest_flush_chunks: int = int(os.getenv("INGEST_FLUSH_CHUNKS", "128"))  # max chunks per embedding pass
+    ingest_parse_workers: int = int(os.getenv("INGEST_PARSE_WORKERS", "4"))
+    ingest_queue_size: int = int(os.getenv("INGEST_QUEUE_SIZE", "1024"))  # chunks buffered between stages
+    write_batch_size: int = int(os.getenv("WRITE_BATCH_SIZE", "200"))
+    write_concurrency: int = int(os.getenv("WRITE_CONCURRENCY", "2"))
+    write_max_retries: int = int(os.getenv("WRITE_MAX_RETRIES", "3"))
+
+    # Background watcher: poll the notes dirs and ingest changed files after a quiet period
+    watch_notes: bool = os.getenv("WATCH_NOTES", "false").lower() == "true"
+    watch_interval_seconds: float = float(os.getenv("WATCH_INTERVAL_SECONDS", "2"))
+    watch_debounce_seconds: float = float(os.getenv("WATCH_DEBOUNCE_SECONDS", "3"))
+
+    # Threads for CPU-bound embedding/reranking on the async request path
+    cpu_workers: int = int(os.getenv("CPU_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+    # Query embedding: LRU cache plus micro-batching of concurrent misses
+    query_cache_size: int = int(os.getenv("QUERY_CACHE_SIZE", "2048"))
+    query_cache_ttl_seconds: float = float(os.getenv("QUERY_CACHE_TTL_SECONDS", "3600"))
+    query_batch_wait_ms: float = float(os.getenv("QUERY_BATCH_WAIT_MS", "5"))
+    query_batch_max: int = int(os.getenv("QUERY_BATCH_MAX", "32"))
+
+    # Semantic answer cache for /ask (invalidated by ingest)
+    answer_cache_enabled: bool = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+    answer_cache_threshold: float = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.97"))  # min query cosine
+    answer_cache_size: int = int(os.getenv("ANSWER_CACHE_SIZE", "512"))
+    answer_cache_ttl_seconds: float = float(os.getenv("ANSWER_CACHE_TTL_SECONDS", "86400"))
+
+    # "full" reranks every hybrid candidate; "cascade" prunes with cheap scores first
+    rerank_mode: str = os.getenv("RERANK_MODE", "full")
+    cascade_top_n: int = int(os.getenv("CASCADE_TOP_N", "12"))  # candidates sent to the cross-encoder
+    rerank_budget_ms: float = float(os.getenv("RERANK_BUDGET_MS", "0"))  # default per-request budget, 0 = none
+    rerank_default_ms_per_pair: float = float(os.getenv("RERANK_DEFAULT_MS_PER_PAIR", "15"))  # until measured
+
+    # Reranker: cross-request batching and (query, chunk) score cache
+    rerank_batch_max: int = int(os.getenv("RERANK_BATCH_MAX", "128"))
+    rerank_batch_wait_ms: float = float(os.getenv("RERANK_BATCH_WAIT_MS", "10"))
+    rerank_cache_size: int = int(os.getenv("RERANK_CACHE_SIZE", "20000"))
+    rerank_cache_ttl_seconds: float = float(os.getenv("RERANK_CACHE_TTL_SECONDS", "86400"))
+
+    # Generation admission control: concurrent generations, waiting requests, and how long
+    # each priority may wait before it is rejected with 429
+    generation_concurrency: int = int(os.getenv("GENERATION_CONCURRENCY", "2"))
+    generation_queue_max: int = int(os.getenv("GENERATION_QUEUE_MAX", "16"))
+    generation_max_wait_seconds: float = float(os.getenv("GENERATION_MAX_WAIT_SECONDS", "30"))
+    generation_batch_max_wait_seconds: float = float(os.getenv("GENERATION_BATCH_MAX_WAIT_SECONDS", "600"))
+    generation_default_seconds: float = float(os.getenv("GENERATION_DEFAULT_SECONDS", "10"))  # until measured
+
+    # /ask/batch: requests retrieving / generating at once
+    batch_retrieve_concurrency: int = int(os.getenv("BATCH_RETRIEVE_CONCURRENCY", "8"))
+    batch_generate_concurrency: int = int(os.getenv("BATCH_GENERATE_CONCURRENCY", "2"))
+
+    # Conversations: follow-up /ask turns that share state server-side
+    conversation_ttl_seconds: float = float(os.getenv("CONVERSATION_TTL_SECONDS", "1800"))  # idle time before eviction
+    conversation_max: int = int(os.getenv("CONVERSATION_MAX", "1000"))
+    conversation_max_turns: int = int(os.getenv("CONVERSATION_MAX_TURNS", "6"))  # older turns leave the history
+    conversation_history_tokens: int = int(os.getenv("CONVERSATION_HISTORY_TOKENS", "3000"))  # cap on resent turns
+    conversation_query_carry: float = float(os.getenv("CONVERSATION_QUERY_CARRY", "0.5"))  # previous query vector weight
+
+    # /ask filters: `recent_only` keeps the last RECENT_SESSIONS sessions
+    recent_sessions: int = int(os.getenv("RECENT_SESSIONS", "3"))
+
+    # Entity routing: known character/location/organization names in the query either
+    # "boost" chunks linking them, "filter" the search to those chunks, or "off"
+    entity_routing: str = os.getenv("ENTITY_ROUTING", "boost")
+    entity_boost: float = float(os.getenv("ENTITY_BOOST", "0.2"))  # added to the hybrid score
+    entity_filter_min_results: int = int(os.getenv("ENTITY_FILTER_MIN_RESULTS", "5"))  # else search unfiltered
+
+    # "weaviate", or "local" for the embedded NumPy + BM25 index (no Weaviate needed)
+    retrieval_backend: str = os.getenv("RETRIEVAL_BACKEND", "weaviate")
+    local_index_dir: str = os.getenv("LOCAL_INDEX_DIR", "")  # default: CACHE_DIR/local_index
+
+    # Local state (ingest manifest, caches). Point at a persistent volume.
+    cache_dir: str = os.getenv("CACHE_DIR", "./.cache")
+    embed_cache_enabled: bool = os.getenv("EMBED_CACHE_ENABLED", "true").lower() == "true"
+    embed_cache_max_entries: int = int(os.getenv("EMBED_CACHE_MAX_ENTRIES", "200000"))
+
     # Generator settings
     generator_provider: str = os.getenv("GENERATOR_PROVIDER", "ollama")  # "ollama" or "gemini"
     
     # Ollama settings
     ollama_base_url: str = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
     ollama_model_name: str = os.getenv("OLLAMA_MODEL_NAME", "llama3.1:8b-instruct-q4_K_M")
+    ollama_api: str = os.getenv("OLLAMA_API", "chat")  # "chat" (/api/chat) or "generate" (flat prompt)
+    ollama_keep_alive: str = os.getenv("OLLAMA_KEEP_ALIVE", "30m")  # how long Ollama keeps the model loaded
+    ollama_num_ctx: int = int(os.getenv("OLLAMA_NUM_CTX", "8192"))  # context window; 0 keeps the model's default
+    ollama_pool_size: int = int(os.getenv("OLLAMA_POOL_SIZE", "8"))  # keep-alive HTTP connections
+    ollama_keepalive_expiry: float = float(os.getenv("OLLAMA_KEEPALIVE_EXPIRY", "60"))  # idle seconds before closing one
+    ollama_timeout: float = float(os.getenv("OLLAMA_TIMEOUT", "120"))
+    ollama_connect_timeout: float = float(os.getenv("OLLAMA_CONNECT_TIMEOUT", "5"))
     
     # Gemini settings
     gemini_api_key: str = os.getenv("GEMINI_API_KEY", "")
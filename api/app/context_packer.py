@@ -0,0 +1,174 @@
+import re
+from typing import Any, Dict, List, Optional
+import numpy as np
+from app.config import settings
+from app.chunker import sentence_spans
+from app.embeddings import count_tokens, get_embedding_cache
+from app.generator import build_prompt, context_header
+from app import metrics
+
+
+_TERM_RE = re.compile(r"\w{3,}")
+# Marks sentences left out of a trimmed chunk
+ELLIPSIS = " … "
+
+
+def _block(item: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "text": item["text"],
+        "heading": item["heading"],
+        "doc_title": item["doc_title"],
+        "path": item["path"],
+        "sessionNo": item["sessionNo"],
+        "sessionDate": item["sessionDate"],
+        "chunk_id": item["chunk_id"],
+        "startChar": item.get("startChar"),
+        "endChar": item.get("endChar"),
+        # Resolved to titles and names by resolve_context_async
+        "doc_id": item.get("doc_id"),
+        "refs": {ref: list(ids) for ref, ids in item.get("refs", {}).items()},
+    }
+
+
+def _overlaps(block: Dict[str, Any], item: Dict[str, Any]) -> bool:
+    if block["doc_id"] is None or block["doc_id"] != item.get("doc_id"):
+        return False
+    if block["startChar"] is None or item.get("startChar") is None:
+        return False
+    first, second = (block, item) if block["startChar"] <= item["startChar"] else (item, block)
+    offset = second["startChar"] - first["startChar"]
+    shared = min(first["endChar"], second["endChar"]) - second["startChar"]
+    if shared < 0:
+        return False
+    # Chunks indexed before offsets were stored all claim to start at 0
+    return first["text"][offset:offset + shared] == second["text"][:shared]
+
+
+def _merge_into(block: Dict[str, Any], item: Dict[str, Any]):
+    # Both texts are slices of the same note, so the union can be rebuilt from their offsets
+    first, second = (block, item) if block["startChar"] <= item["startChar"] else (item, block)
+    text = first["text"]
+    if second["endChar"] > first["endChar"]:
+        text += second["text"][first["endChar"] - second["startChar"]:]
+    block["text"] = text
+    block["startChar"] = first["startChar"]
+    block["endChar"] = max(first["endChar"], second["endChar"])
+    for ref, ids in item.get("refs", {}).items():
+        block["refs"].setdefault(ref, [])
+        block["refs"][ref] += [i for i in ids if i not in block["refs"][ref]]
+
+
+def merge_overlapping(items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Fold chunks that overlap or touch a better-ranked chunk of the same note into it."""
+    blocks = []
+    for item in items:
+        target = next((b for b in blocks if _overlaps(b, item)), None)
+        if target is None:
+            block = _block(item)
+            block["vector"] = item.get("vector")
+            blocks.append(block)
+        else:
+            _merge_into(target, item)
+            metrics.inc("context.merged")
+    return blocks
+
+
+def with_cached_vectors(items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Fill in missing chunk vectors from the embedding cache, which ingest keys by chunk text."""
+    cache = get_embedding_cache()
+    missing = [i for i, item in enumerate(items) if item.get("vector") is None]
+    if cache is None or not missing:
+        return items
+    items = list(items)
+    for i, vec in zip(missing, cache.get_many([items[i]["text"] for i in missing], count=False)):
+        if vec is not None:
+            items[i] = {**items[i], "vector": vec}
+    return items
+
+
+def drop_near_duplicates(blocks: List[Dict[str, Any]], threshold: float) -> List[Dict[str, Any]]:
+    """Drop blocks whose vector is within `threshold` cosine of a better-ranked one.
+
+    Copies of the same passage across notes (recaps, pasted NPC blurbs)
+    otherwise fill the prompt with the same facts. Blocks without a vector
+    are always kept.
+    """
+    kept, kept_vecs = [], []
+    for block in blocks:
+        vec = block.get("vector")
+        if vec is not None and threshold > 0:
+            v = np.asarray(vec, dtype=np.float32)
+            v /= np.linalg.norm(v) or 1.0
+            if kept_vecs and float(np.max(np.stack(kept_vecs) @ v)) >= threshold:
+                metrics.inc("context.near_duplicates")
+                continue
+            kept_vecs.append(v)
+        kept.append(block)
+    return kept
+
+
+def trim_to_sentences(query: str, text: str, max_tokens: int) -> Optional[str]:
+    """The sentences of `text` sharing the most words with `query`, in their original order, within `max_tokens`."""
+    spans = sentence_spans(text)
+    if not spans:
+        return None
+    sentences = [text[s:e] for s, e in spans]
+    terms = set(_TERM_RE.findall(query.lower()))
+    overlap = [len(terms.intersection(_TERM_RE.findall(s.lower()))) for s in sentences]
+    # Most query words first; ties (and chunks with no overlap at all) keep their lead sentences
+    sizes = count_tokens(sentences)
+    chosen, used = [], 0
+    for i in sorted(range(len(sentences)), key=lambda i: (-overlap[i], i)):
+        if used + sizes[i] <= max_tokens:
+            chosen.append(i)
+            used += sizes[i]
+    if not chosen:
+        return None
+    chosen.sort()
+    out = sentences[chosen[0]]
+    for prev, i in zip(chosen, chosen[1:]):
+        out += (" " if i == prev + 1 else ELLIPSIS) + sentences[i]
+    return out
+
+
+def pack_context(query: str, items: List[Dict[str, Any]], budget: int, max_chunks: int) -> List[Dict[str, Any]]:
+    """Fit ranked chunks into a prompt budget of `budget` tokens.
+
+    Overlapping windows of a note are merged and near-duplicates dropped.
+    The top CONTEXT_FULL_CHUNKS blocks go in whole while they fit; the rest,
+    and any block that no longer fits, are cut down to their sentences that
+    best match the query (at most CONTEXT_TRIM_TOKENS each). Tokens are
+    counted with the embedding model's tokenizer, close enough to the
+    generator's for budgeting.
+    """
+    if settings.context_dedupe_similarity > 0:
+        items = with_cached_vectors(items)
+    blocks = drop_near_duplicates(merge_overlapping(items), settings.context_dedupe_similarity)[:max_chunks]
+    if not blocks:
+        return []
+    sizes = count_tokens([context_header(b) + "\n" + b["text"] for b in blocks])
+    headers = count_tokens([context_header(b) for b in blocks])
+    out, used = [], 0
+    for rank, (block, size, header) in enumerate(zip(blocks, sizes, headers)):
+        block.pop("vector", None)
+        remaining = budget - used
+        if size <= remaining and (rank < settings.context_full_chunks
+                                  or size - header <= settings.context_trim_tokens):
+            block["trimmed"] = False
+            used += size
+            out.append(block)
+            continue
+        room = min(remaining - header, settings.context_trim_tokens)
+        text = trim_to_sentences(query, block["text"], room) if room > 0 else None
+        if text is None:
+            continue
+        block["text"], block["trimmed"] = text, True
+        used += header + count_tokens([text])[0]
+        out.append(block)
+        metrics.inc("context.trimmed")
+    return out
+
+
+def prompt_token_count(query: str, context_blocks: List[Dict], history: Optional[List[Dict]] = None) -> int:
+    # Embedding-tokenizer estimate of the full generator prompt
+    return count_tokens([build_prompt(query, context_blocks, history)])[0]
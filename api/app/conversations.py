@@ -0,0 +1,103 @@
+import time, uuid, asyncio
+from typing import Optional
+import numpy as np
+from app.config import settings
+from app.batching import TTLCache
+from app.embeddings import count_tokens
+from app.generator import user_message
+from app import metrics
+
+
+class Conversation:
+    """Server-side state of one /ask conversation.
+
+    Each turn keeps the question, its query vector, the chunks it was given
+    and the exact messages sent and received. A follow-up resends those
+    messages as history, so Ollama can serve the whole earlier conversation
+    from its KV cache. Retrieval for the follow-up skips chunks already in
+    the history and leans on the previous question, since follow-ups
+    ("and what did she do next?") rarely name what they are about.
+    """
+
+    def __init__(self):
+        self.id = uuid.uuid4().hex
+        self.created_at = time.time()
+        self.turns: list[dict] = []
+        # One turn at a time: the next one needs this one's answer
+        self.lock = asyncio.Lock()
+
+    def history(self) -> list[dict]:
+        return [m for turn in self.turns for m in turn["messages"]]
+
+    def seen_chunk_ids(self) -> set[str]:
+        return {cid for turn in self.turns for cid in turn["chunk_ids"]}
+
+    def search_query(self, query: str) -> str:
+        # BM25 and entity routing get the names the previous question used
+        return f"{self.turns[-1]['query']} {query}" if self.turns else query
+
+    def search_vector(self, vector: list[float]) -> list[float]:
+        if not self.turns or settings.conversation_query_carry <= 0:
+            return vector
+        v = (np.asarray(vector, dtype=np.float32)
+             + settings.conversation_query_carry * np.asarray(self.turns[-1]["vector"], dtype=np.float32))
+        return (v / (np.linalg.norm(v) or 1.0)).tolist()
+
+    def history_tokens(self) -> int:
+        return sum(turn["tokens"] for turn in self.turns)
+
+    def add_turn(self, query: str, vector: list[float], context: list[dict], answer: str):
+        # Tokenizes the turn; callers on the event loop run it in a worker thread
+        seen = self.seen_chunk_ids()
+        context = [c for c in context if c["chunk_id"] not in seen]  # earlier turns already carry the rest
+        messages = [user_message(query, context), {"role": "assistant", "content": answer}]
+        self.turns.append({
+            "query": query,
+            "vector": vector,
+            "chunk_ids": [c["chunk_id"] for c in context],
+            "messages": messages,
+            "tokens": sum(count_tokens([m["content"] for m in messages])),
+            "at": time.time(),
+        })
+        # Dropping the oldest turn changes the prefix once; its chunks become retrievable again
+        del self.turns[:max(len(self.turns) - settings.conversation_max_turns, 0)]
+        while self.turns and self.history_tokens() > settings.conversation_history_tokens:
+            del self.turns[0]
+            metrics.inc("conversations.turns_dropped")
+
+    def to_dict(self) -> dict:
+        return {
+            "conversation_id": self.id,
+            "created_at": self.created_at,
+            "turns": [{"query": t["query"], "answer": t["messages"][1]["content"],
+                       "chunk_ids": t["chunk_ids"], "tokens": t["tokens"], "at": t["at"]} for t in self.turns],
+        }
+
+
+class ConversationStore:
+    # Entries expire CONVERSATION_TTL_SECONDS after their last turn (each turn re-puts them)
+
+    def __init__(self, maxsize: int, ttl: float):
+        self._cache = TTLCache(maxsize, ttl)
+
+    def create(self) -> Conversation:
+        conv = Conversation()
+        self._cache.put(conv.id, conv)
+        metrics.inc("conversations.created")
+        return conv
+
+    def get(self, conversation_id: str) -> Optional[Conversation]:
+        return self._cache.get(conversation_id)
+
+    def touch(self, conv: Conversation):
+        self._cache.put(conv.id, conv)
+
+    def delete(self, conversation_id: str):
+        self._cache.discard(conversation_id)
+
+    def stats(self) -> dict:
+        return self._cache.stats()
+
+
+conversations = ConversationStore(settings.conversation_max, settings.conversation_ttl_seconds)
+metrics.register("conversations", conversations.stats)
@@ -0,0 +1,168 @@
+import os, json, hashlib, threading
+from typing import Optional
+import numpy as np
+
+
+KEY_BYTES = 32  # sha256 digest
+
+
+def text_key(text: str) -> bytes:
+    return hashlib.sha256(text.encode("utf-8")).digest()
+
+
+class EmbeddingCache:
+    """Content-addressed embedding store on disk.
+
+    Layout in `directory`:
+      meta.json     model name and vector dimension
+      keys.bin      sha256(text) digests, 32 bytes per row
+      vectors.f32   float32 vectors, `dim` per row, memory-mapped for reads
+
+    Both data files are append-only, so a crash mid-write at worst leaves a
+    partial tail row, which is dropped on load. A different model name wipes
+    the cache. Past `max_entries` the least recently used rows are dropped,
+    down to half of `max_entries` or whatever leaves room for the new batch;
+    rows are rewritten in recency order, so after a restart file order stands
+    in for it.
+    """
+
+    def __init__(self, directory: str, model_name: str, max_entries: int):
+        self.directory = directory
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._index: dict[bytes, int] = {}
+        # Per row: tick of its last insert or hit
+        self._last_used: list[int] = []
+        self._tick = 0
+        self._dim: Optional[int] = None
+        self._vectors: Optional[np.memmap] = None
+        os.makedirs(directory, exist_ok=True)
+        self._meta_path = os.path.join(directory, "meta.json")
+        self._keys_path = os.path.join(directory, "keys.bin")
+        self._vectors_path = os.path.join(directory, "vectors.f32")
+        self._load()
+
+    def _load(self):
+        meta = None
+        if os.path.exists(self._meta_path):
+            try:
+                with open(self._meta_path, "r", encoding="utf-8") as f:
+                    meta = json.load(f)
+            except (OSError, ValueError):
+                meta = None
+        if not meta or meta.get("model") != self.model_name or not meta.get("dim"):
+            self._reset()
+            return
+
+        self._dim = int(meta["dim"])
+        keys = b""
+        if os.path.exists(self._keys_path):
+            with open(self._keys_path, "rb") as f:
+                keys = f.read()
+        vec_rows = os.path.getsize(self._vectors_path) // (4 * self._dim) if os.path.exists(self._vectors_path) else 0
+        rows = min(len(keys) // KEY_BYTES, vec_rows)
+        self._index = {keys[i * KEY_BYTES:(i + 1) * KEY_BYTES]: i for i in range(rows)}
+        self._last_used, self._tick = list(range(rows)), rows
+        # Drop any torn tail left by an interrupted append
+        if os.path.exists(self._keys_path):
+            os.truncate(self._keys_path, rows * KEY_BYTES)
+        if os.path.exists(self._vectors_path):
+            os.truncate(self._vectors_path, rows * 4 * self._dim)
+        self._remap()
+
+    def _reset(self, dim: Optional[int] = None):
+        for path in (self._keys_path, self._vectors_path):
+            if os.path.exists(path):
+                os.remove(path)
+        self._index = {}
+        self._last_used, self._tick = [], 0
+        self._vectors = None
+        self._dim = dim
+        with open(self._meta_path, "w", encoding="utf-8") as f:
+            json.dump({"model": self.model_name, "dim": dim}, f)
+
+    def _remap(self):
+        rows = len(self._index)
+        self._vectors = (np.memmap(self._vectors_path, dtype=np.float32, mode="r", shape=(rows, self._dim))
+                         if rows else None)
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def get_many(self, texts: list[str], count: bool = True) -> list[Optional[list[float]]]:
+        # count=False leaves the hit/miss stats (which measure embedding work saved) untouched
+        out: list[Optional[list[float]]] = []
+        with self._lock:
+            for text in texts:
+                row = self._index.get(text_key(text))
+                if row is None:
+                    if count:
+                        self.misses += 1
+                    out.append(None)
+                    continue
+                if self._vectors is None or row >= self._vectors.shape[0]:
+                    self._remap()
+                if count:
+                    self.hits += 1
+                self._last_used[row] = self._tick
+                self._tick += 1
+                out.append(self._vectors[row].tolist())
+        return out
+
+    def put_many(self, texts: list[str], vectors: list[list[float]]):
+        if not texts:
+            return
+        arr = np.asarray(vectors, dtype=np.float32)
+        with self._lock:
+            if self._dim is None:
+                self._reset(arr.shape[1])
+            fresh: dict[bytes, int] = {}
+            for i, text in enumerate(texts):
+                key = text_key(text)
+                if key not in self._index and key not in fresh:
+                    fresh[key] = i
+            if not fresh:
+                return
+            if len(fresh) > self.max_entries:
+                # Only the last max_entries of an oversized batch fit
+                fresh = dict(list(fresh.items())[-self.max_entries:])
+            if len(self._index) + len(fresh) > self.max_entries:
+                # Halving leaves headroom so the next puts don't compact again
+                self._compact(min(self.max_entries // 2, self.max_entries - len(fresh)))
+
+            rows = arr[list(fresh.values())]
+            with open(self._vectors_path, "ab") as f:
+                f.write(rows.tobytes())
+            with open(self._keys_path, "ab") as f:
+                f.write(b"".join(fresh))
+            base = len(self._index)
+            for offset, key in enumerate(fresh):
+                self._index[key] = base + offset
+                self._last_used.append(self._tick)
+                self._tick += 1
+
+    def _compact(self, keep: int):
+        # Keep the `keep` most recently used rows, least recent first
+        by_use = sorted(self._index.items(), key=lambda kv: self._last_used[kv[1]])
+        by_row = by_use[len(by_use) - keep:] if keep > 0 else []
+        if self._vectors is None or self._vectors.shape[0] < len(self._index):
+            self._remap()
+        kept_vectors = (np.asarray(self._vectors[[row for _, row in by_row]], dtype=np.float32)
+                        if by_row else np.empty((0, self._dim), dtype=np.float32))
+        self._vectors = None
+        tmp_vectors, tmp_keys = self._vectors_path + ".tmp", self._keys_path + ".tmp"
+        with open(tmp_vectors, "wb") as f:
+            f.write(kept_vectors.tobytes())
+        with open(tmp_keys, "wb") as f:
+            f.write(b"".join(key for key, _ in by_row))
+        os.replace(tmp_vectors, self._vectors_path)
+        os.replace(tmp_keys, self._keys_path)
+        self._last_used = [self._last_used[row] for _, row in by_row]
+        self._index = {key: i for i, (key, _) in enumerate(by_row)}
+        self._remap()
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self._index)}
\ No newline at end of file
@@ -1,19 +1,169 @@
+import os, copy, time, asyncio, hashlib, threading
 from sentence_transformers import SentenceTransformer
 from functools import lru_cache
 import numpy as np
 from app.config import settings
+from app.utils import slugify
+from app.embedding_cache import EmbeddingCache
+from app.batching import TTLCache, MicroBatcher
+from app import metrics
+
+
+def load_model(cls, model_name: str, backend: str = "torch", onnx_file: str = "", quantization: str = ""):
+    """Load a SentenceTransformer or CrossEncoder on the given inference backend.
+
+    `quantization` (e.g. "avx512_vnni", "avx2", "arm64") exports a dynamically
+    quantized int8 ONNX copy of the model into CACHE_DIR once and loads that.
+    """
+    if backend == "torch":
+        return cls(model_name)
+    if quantization:
+        if backend != "onnx":
+            raise ValueError("int8 quantization is only supported with the onnx backend")
+        local_dir = os.path.join(settings.cache_dir, "onnx", slugify(model_name))
+        file_name = f"onnx/model_qint8_{quantization}.onnx"
+        if not os.path.exists(os.path.join(local_dir, file_name)):
+            from sentence_transformers import export_dynamic_quantized_onnx_model
+            model = cls(model_name, backend="onnx")
+            model.save_pretrained(local_dir)
+            export_dynamic_quantized_onnx_model(model, quantization, local_dir)
+        return cls(local_dir, backend="onnx", model_kwargs={"file_name": file_name})
+    return cls(model_name, backend=backend, model_kwargs={"file_name": onnx_file} if onnx_file else None)
+
+
+def embedder_signature() -> str:
+    # Vectors from different backends/quantizations drift apart, so anything
+    # persisted alongside vectors (embedding cache, ingest manifest) keys on this
+    if settings.embed_backend == "torch":
+        return settings.embed_model_name
+    variant = settings.embed_quantization or settings.embed_onnx_file or "default"
+    return f"{settings.embed_model_name}|{settings.embed_backend}|{variant}"
 
 
 @lru_cache(maxsize=1)
 def get_embedder():
-    model = SentenceTransformer(settings.embed_model_name) # CPU OK
+    model = load_model(SentenceTransformer, settings.embed_model_name, settings.embed_backend,
+                       settings.embed_onnx_file, settings.embed_quantization) # CPU OK
     return model
- 
 
-def embed_texts(texts: list[str]) -> list[list[float]]:
+
+_tokenizers = threading.local()
+
+
+def get_tokenizer():
+    # A fast tokenizer is not safe to share between threads ("Already borrowed"),
+    # and encode() keeps using the embedder's own, so each thread counts with a copy
+    tokenizer = getattr(_tokenizers, "tokenizer", None)
+    if tokenizer is None:
+        tokenizer = _tokenizers.tokenizer = copy.deepcopy(get_embedder().tokenizer)
+    return tokenizer
+
+
+def count_tokens(texts: list[str]) -> list[int]:
+    # Same tokenizer the embedder truncates with, without [CLS]/[SEP]
+    if not texts:
+        return []
+    ids = get_tokenizer()(texts, add_special_tokens=False)["input_ids"]
+    return [len(x) for x in ids]
+
+
+def chunk_token_limit() -> int:
+    # Tokens the embedder actually sees per chunk, minus the two special tokens
+    limit = get_embedder().max_seq_length - 2
+    if settings.chunk_max_tokens > 0:
+        limit = min(limit, settings.chunk_max_tokens)
+    return limit
+
+
+@lru_cache(maxsize=1)
+def get_embedding_cache() -> EmbeddingCache | None:
+    if not settings.embed_cache_enabled:
+        return None
+    return EmbeddingCache(os.path.join(settings.cache_dir, "embeddings"),
+                          embedder_signature(),
+                          settings.embed_cache_max_entries)
+
+
+def embed_texts(texts: list[str], batch_size: int | None = None, use_cache: bool = True) -> list[list[float]]:
+    cache = get_embedding_cache() if use_cache else None
+    if cache is None:
+        return _encode(texts, batch_size)
+    out = cache.get_many(texts)
+    missing = [i for i, vec in enumerate(out) if vec is None]
+    if missing:
+        vecs = _encode([texts[i] for i in missing], batch_size)
+        for i, vec in zip(missing, vecs):
+            out[i] = vec
+        cache.put_many([texts[i] for i in missing], vecs)
+    return out
+
+
+def normalize_query(query: str) -> str:
+    # bge models are uncased, so case and spacing never change the vector
+    return " ".join(query.lower().split())
+
+
+def _embed_query_batch(queries: list[str]) -> list[list[float]]:
+    unique = list(dict.fromkeys(queries))
+    vecs = dict(zip(unique, _encode(unique)))
+    return [vecs[q] for q in queries]
+
+
+_query_cache = TTLCache(settings.query_cache_size, settings.query_cache_ttl_seconds)
+_query_batcher = MicroBatcher(_embed_query_batch,
+                              max_batch=settings.query_batch_max,
+                              max_wait_ms=settings.query_batch_wait_ms,
+                              name="query-embedder")
+
+
+def embed_query(query: str) -> list[float]:
+    # LRU first; misses from concurrent requests share one encode() call
+    key = normalize_query(query)
+    vec = _query_cache.get(key)
+    if vec is None:
+        vec = _query_batcher(key)
+        _query_cache.put(key, vec)
+    return vec
+
+
+def embed_queries(queries: list[str]) -> list[list[float]]:
+    # Bulk callers: every cache miss goes into one embed_texts call, bypassing the batcher
+    keys = [normalize_query(q) for q in queries]
+    vecs = {key: _query_cache.get(key) for key in dict.fromkeys(keys)}
+    missing = [key for key, vec in vecs.items() if vec is None]
+    if missing:
+        for key, vec in zip(missing, embed_texts(missing, use_cache=False)):
+            vecs[key] = vec
+            _query_cache.put(key, vec)
+    return [vecs[key] for key in keys]
+
+
+metrics.register("query_embedding", lambda: {"cache": _query_cache.stats(), "batcher": _query_batcher.stats()})
+
+
+async def embed_query_async(query: str) -> list[float]:
+    # Same as embed_query, but awaits the batcher instead of blocking a thread
+    key = normalize_query(query)
+    vec = _query_cache.get(key)
+    if vec is None:
+        vec = await asyncio.wrap_future(_query_batcher.submit(key))
+        _query_cache.put(key, vec)
+    return vec
+
+
+def _encode(texts: list[str], batch_size: int | None = None) -> list[list[float]]:
     model = get_embedder()
-    vecs = model.encode(texts, normalize_embeddings=True, convert_to_numpy=True)
-    return vecs.astype(np.float32).tolist()
+    batch_size = batch_size or settings.embed_batch_size
+    # Bucket by length so each batch pads to similar sizes, then restore input order
+    order = sorted(range(len(texts)), key=lambda i: len(texts[i]), reverse=True)
+    out: list[list[float]] = [None] * len(texts)
+    for start in range(0, len(order), batch_size):
+        idx = order[start:start + batch_size]
+        vecs = model.encode([texts[i] for i in idx], batch_size=batch_size,
+                            normalize_embeddings=True, convert_to_numpy=True)
+        for i, vec in zip(idx, vecs.astype(np.float32).tolist()):
+            out[i] = vec
+    return out
 
 
 # Optional reranker
@@ -24,6 +174,7 @@ except Exception:
 
 
 _reranker = None
+_reranker_lock = threading.Lock()
 
 
 def get_reranker():
@@ -33,5 +184,66 @@ def get_reranker():
     if CrossEncoder is None:
         return None
     if _reranker is None:
-        _reranker = CrossEncoder(settings.reranker_model_name)
-    return _reranker
\ No newline at end of file
+        with _reranker_lock:
+            if _reranker is None:
+                _reranker = load_model(CrossEncoder, settings.reranker_model_name, settings.reranker_backend,
+                                       settings.reranker_onnx_file, settings.reranker_quantization)
+    return _reranker
+
+
+_rerank_ms_per_pair: float | None = None
+
+
+def _rerank_batch(pairs: list[tuple[str, str]]) -> list[float]:
+    global _rerank_ms_per_pair
+    t0 = time.perf_counter()
+    scores = get_reranker().predict(pairs, batch_size=settings.rerank_batch_max)
+    per_pair = (time.perf_counter() - t0) * 1000 / len(pairs)
+    # Moving average of cross-encoder cost; the cascade budgets pairs with it
+    _rerank_ms_per_pair = per_pair if _rerank_ms_per_pair is None else 0.8 * _rerank_ms_per_pair + 0.2 * per_pair
+    return [float(score) for score in scores]
+
+
+def rerank_ms_per_pair() -> float:
+    return _rerank_ms_per_pair or settings.rerank_default_ms_per_pair
+
+
+# Pairs from concurrent requests are merged into one predict() call, and
+# (query, chunk_id) scores are cached so repeated questions skip the model.
+_rerank_batcher = MicroBatcher(_rerank_batch,
+                               max_batch=settings.rerank_batch_max,
+                               max_wait_ms=settings.rerank_batch_wait_ms,
+                               name="reranker")
+_rerank_cache = TTLCache(settings.rerank_cache_size, settings.rerank_cache_ttl_seconds)
+
+metrics.register("reranker", lambda: {"cache": _rerank_cache.stats(), "batcher": _rerank_batcher.stats()})
+
+
+def _rerank_query_key(query: str) -> str:
+    return hashlib.sha1(" ".join(query.split()).encode("utf-8")).hexdigest()
+
+
+def _rerank_lookup(query: str, chunks: list[tuple[str, str]]) -> tuple[str, list[float | None]]:
+    query_key = _rerank_query_key(query)
+    return query_key, [_rerank_cache.get((query_key, chunk_id)) for chunk_id, _ in chunks]
+
+
+def cached_rerank_scores(query: str, chunks: list[tuple[str, str]]) -> list[float | None]:
+    return _rerank_lookup(query, chunks)[1]
+
+
+async def rerank_scores_async(query: str,
+                              chunks: list[tuple[str, str]],
+                              cached: list[float | None] | None = None) -> list[float]:
+    # `cached` lets callers that already looked up the cache skip a second lookup
+    if cached is not None:
+        query_key, scores = _rerank_query_key(query), list(cached)
+    else:
+        query_key, scores = _rerank_lookup(query, chunks)
+    missing = [i for i, s in enumerate(scores) if s is None]
+    results = await asyncio.gather(*(asyncio.wrap_future(_rerank_batcher.submit((query, chunks[i][1])))
+                                     for i in missing))
+    for i, score in zip(missing, results):
+        scores[i] = score
+        _rerank_cache.put((query_key, chunks[i][0]), score)
+    return scores
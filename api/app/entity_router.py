@@ -0,0 +1,145 @@
+import threading
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Iterable, Optional
+from app.ingest import (_char_name_to_id, _location_name_to_id, _organization_name_to_id,
+                        entity_ids_from_notes, index_version)
+
+
+class AhoCorasick:
+    """Multi-pattern matcher: one pass over the text finds every pattern in it."""
+
+    def __init__(self, patterns: Iterable[tuple[str, Any]]):
+        self._goto: list[dict[str, int]] = [{}]
+        self._fail: list[int] = [0]
+        self._out: list[list[tuple[int, Any]]] = [[]]  # (pattern length, value)
+        for pattern, value in patterns:
+            self._add(pattern, value)
+        self._link()
+
+    def _add(self, pattern: str, value: Any):
+        state = 0
+        for ch in pattern:
+            nxt = self._goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            state = nxt
+        self._out[state].append((len(pattern), value))
+
+    def _link(self):
+        # Breadth-first, so a state's failure target is always finished before it
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                fail = self._fail[state]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(ch, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+                queue.append(nxt)
+
+    def find(self, text: str) -> list[tuple[int, int, Any]]:
+        """All (start, end, value) occurrences, overlapping ones included."""
+        hits = []
+        state = 0
+        for i, ch in enumerate(text):
+            while state and ch not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(ch, 0)
+            for length, value in self._out[state]:
+                hits.append((i + 1 - length, i + 1, value))
+        return hits
+
+
+@dataclass(frozen=True)
+class EntityMatch:
+    ref: str  # Chunk reference: "characters", "locations" or "organizations"
+    id: str
+    name: str
+
+
+def _is_word_boundary(text: str, start: int, end: int) -> bool:
+    before = text[start - 1] if start > 0 else " "
+    after = text[end] if end < len(text) else " "
+    return not before.isalnum() and not after.isalnum()
+
+
+class EntityRouter:
+    """Finds known entity names in a query.
+
+    Patterns come from ingest's name -> id maps. A fresh API process has not
+    scanned yet, so until it does the names are read from the note
+    directories (ids are deterministic, so they match what ingest wrote).
+    The automaton is rebuilt when the maps or the index change.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._key: Optional[tuple] = None
+        self._matcher: Optional[AhoCorasick] = None
+        self._by_name: dict[str, list[EntityMatch]] = {}
+
+    def _sources(self) -> dict[str, dict[str, str]]:
+        maps = {"characters": _char_name_to_id,
+                "locations": _location_name_to_id,
+                "organizations": _organization_name_to_id}
+        if any(maps.values()):
+            return {ref: dict(name_to_id) for ref, name_to_id in maps.items()}
+        return entity_ids_from_notes()
+
+    def _get_matcher(self) -> AhoCorasick:
+        key = (index_version(), len(_char_name_to_id), len(_location_name_to_id), len(_organization_name_to_id))
+        with self._lock:
+            if self._matcher is None or key != self._key:
+                entities = [EntityMatch(ref, entity_id, name)
+                            for ref, name_to_id in self._sources().items()
+                            for name, entity_id in name_to_id.items() if name]
+                self._matcher = AhoCorasick((e.name.lower(), e) for e in entities)
+                self._by_name = {}
+                for e in entities:
+                    self._by_name.setdefault(e.name.lower(), []).append(e)
+                self._key = key
+            return self._matcher
+
+    def resolve(self, names: list[str]) -> tuple[list[EntityMatch], list[str]]:
+        """Exact (case-insensitive) lookup of entity names: (found, unknown names)."""
+        self._get_matcher()
+        found, unknown = [], []
+        for name in names:
+            hits = self._by_name.get(name.strip().lower())
+            if hits:
+                found.extend(hits)
+            else:
+                unknown.append(name)
+        return found, unknown
+
+    def match(self, query: str) -> list[EntityMatch]:
+        text = query.lower()
+        hits = [h for h in self._get_matcher().find(text) if _is_word_boundary(text, h[0], h[1])]
+        # Leftmost-longest: "Ice Village" wins over "Ice" at the same place
+        hits.sort(key=lambda h: (h[0], h[0] - h[1]))
+        out, end = [], -1
+        for start, stop, entity in hits:
+            if start >= end and entity not in out:
+                out.append(entity)
+                end = stop
+        return out
+
+
+entity_router = EntityRouter()
+
+
+def match_entities(query: str) -> list[EntityMatch]:
+    return entity_router.match(query)
+
+
+def group_by_ref(matches: list[EntityMatch]) -> dict[str, list[str]]:
+    out: dict[str, list[str]] = {}
+    for m in matches:
+        out.setdefault(m.ref, []).append(m.id)
+    return out
\ No newline at end of file
@@ -0,0 +1,90 @@
+import datetime
+from dataclasses import dataclass
+from typing import Any, Mapping, Optional
+from weaviate.classes.query import Filter
+
+
+@dataclass
+class SearchFilters:
+    """Restrictions on which chunks a search may return.
+
+    Backend-neutral: `to_weaviate()` builds the filter passed as `filters=`
+    to the hybrid query (so `limit` counts only matching chunks), and
+    `matches()` applies the same rules to a chunk of the local index.
+    """
+    from_session: Optional[int] = None
+    to_session: Optional[int] = None
+    from_date: Optional[str] = None  # YYYY-MM-DD, inclusive, on the chunk's sessionDate
+    to_date: Optional[str] = None
+    doc_types: Optional[list[str]] = None  # Document.type: session, character, location, organization
+    # Chunk reference ("characters", ...) -> entity ids; a chunk must link at least one
+    entities: Optional[dict[str, list[str]]] = None
+
+    @classmethod
+    def from_request(cls, req) -> "SearchFilters":
+        return cls(from_session=req.from_session,
+                   to_session=req.to_session,
+                   from_date=req.from_date.isoformat() if req.from_date else None,
+                   to_date=req.to_date.isoformat() if req.to_date else None,
+                   doc_types=list(req.doc_types) if req.doc_types else None)
+
+    def is_empty(self) -> bool:
+        return (self.from_session is None and self.to_session is None
+                and self.from_date is None and self.to_date is None
+                and not self.doc_types and not self.entities)
+
+    def to_weaviate(self) -> Optional[Filter]:
+        parts = []
+        if self.from_session is not None:
+            parts.append(Filter.by_property("sessionNo").greater_or_equal(self.from_session))
+        if self.to_session is not None:
+            parts.append(Filter.by_property("sessionNo").less_or_equal(self.to_session))
+        if self.from_date is not None:
+            parts.append(Filter.by_property("sessionDate").greater_or_equal(_day_start(self.from_date)))
+        if self.to_date is not None:
+            # Inclusive: anything before the start of the following day
+            parts.append(Filter.by_property("sessionDate").less_than(
+                _day_start(self.to_date) + datetime.timedelta(days=1)))
+        if self.doc_types:
+            by_type = [Filter.by_ref(link_on="ofDoc").by_property("type").equal(t) for t in self.doc_types]
+            parts.append(_any(by_type))
+        if self.entities:
+            parts.append(_any([Filter.by_ref(link_on=ref).by_id().contains_any(ids)
+                               for ref, ids in self.entities.items()]))
+        if not parts:
+            return None
+        return parts[0] if len(parts) == 1 else Filter.all_of(parts)
+
+    def matches(self,
+                props: dict[str, Any],
+                refs: Optional[Mapping[str, list[str]]] = None,
+                doc: Optional[dict[str, Any]] = None) -> bool:
+        # `refs` maps reference names to the chunk's linked ids; `doc` is its Document's properties
+        session_no = props.get("sessionNo")
+        if self.from_session is not None and (session_no is None or session_no < self.from_session):
+            return False
+        if self.to_session is not None and (session_no is None or session_no > self.to_session):
+            return False
+        if self.from_date is not None or self.to_date is not None:
+            day = str(props.get("sessionDate") or "")[:10]
+            if not day:
+                return False
+            if self.from_date is not None and day < self.from_date:
+                return False
+            if self.to_date is not None and day > self.to_date:
+                return False
+        if self.doc_types and (doc or {}).get("type") not in self.doc_types:
+            return False
+        if self.entities:
+            refs = refs or {}
+            if not any(set(ids) & set(refs.get(ref) or ()) for ref, ids in self.entities.items()):
+                return False
+        return True
+
+
+def _day_start(day: str) -> datetime.datetime:
+    return datetime.datetime.fromisoformat(day).replace(tzinfo=datetime.timezone.utc)
+
+
+def _any(filters: list) -> Filter:
+    return filters[0] if len(filters) == 1 else Filter.any_of(filters)
\ No newline at end of file
@@ -1,73 +1,365 @@
-import requests
+import httpx
 import json
-import textwrap
+import time
+import heapq
+import asyncio
+import itertools
+import threading
+from contextlib import asynccontextmanager
 from abc import ABC, abstractmethod
-from typing import List, Dict
+from typing import List, Dict, AsyncIterator
 import google.generativeai as genai
 from app.config import settings
+from app import metrics
 
 SYS_PROMPT = """You are a lore-accurate RPG archivist. Use ONLY the provided context. 
 Cite like [Session {sessionNo} §{heading}] or [Character {doc_title}] after claims.
 If the context is insufficient, say so and ask a follow-up question."""
 
-def build_prompt(query: str, context_blocks: List[Dict]) -> str:
-    parts = [f"[System]\n{SYS_PROMPT}", "\n[Context]"]
-    for c in context_blocks:
-        ses = f"Session {c.get('sessionNo')}" if c.get("sessionNo") else c.get("doc_title","")
-        heading = c.get("heading") or "(no heading)"
-        parts.append(textwrap.dedent(f"""
-        --- {ses} · {c.get('doc_title','')} · {heading}
-        {c['text'].strip()}
-        """).strip())
-    parts += ["\n[User Question]", query.strip()]
-    return "\n\n".join(parts).strip()
+def context_header(c: Dict) -> str:
+    ses = f"Session {c.get('sessionNo')}" if c.get("sessionNo") else c.get("doc_title","")
+    heading = c.get("heading") or "(no heading)"
+    return f"--- {ses} · {c.get('doc_title','')} · {heading}"
+
+def order_context(context_blocks: List[Dict]) -> List[Dict]:
+    # Rank order changes with every question; a fixed order lets requests that
+    # retrieve the same blocks share a prompt prefix (and Ollama's KV cache).
+    # Entity notes first, then sessions in order, each note top to bottom.
+    return sorted(context_blocks, key=lambda c: (c.get("sessionNo") is not None, c.get("sessionNo") or 0,
+                                                 c.get("doc_title") or "", c.get("startChar") or 0,
+                                                 c.get("chunk_id") or ""))
+
+def user_message(query: str, context_blocks: List[Dict]) -> Dict[str, str]:
+    parts = ["[Context]"]
+    for c in order_context(context_blocks):
+        parts.append(f"{context_header(c)}\n{c['text'].strip()}")
+    parts += ["[User Question]", query.strip()]
+    return {"role": "user", "content": "\n\n".join(parts)}
+
+def build_messages(query: str, context_blocks: List[Dict], history: List[Dict] | None = None) -> List[Dict]:
+    """Chat messages for one question: the fixed system message, earlier turns, then context and question.
+
+    `history` holds the user/assistant messages of earlier turns exactly as
+    they were sent and answered, so a follow-up repeats the previous
+    request byte for byte before its new message.
+    """
+    return [{"role": "system", "content": SYS_PROMPT}, *(history or []), user_message(query, context_blocks)]
+
+def render_prompt(messages: List[Dict]) -> str:
+    # Flat prompt for completion-style endpoints
+    labels = {"system": "[System]\n", "user": "", "assistant": "[Answer]\n"}
+    return "\n\n".join(labels[m["role"]] + m["content"] for m in messages)
+
+def build_prompt(query: str, context_blocks: List[Dict], history: List[Dict] | None = None) -> str:
+    return render_prompt(build_messages(query, context_blocks, history))
 
 class GeneratorProvider(ABC):
+    # `messages` are chat messages from build_messages (system, earlier turns, question)
     @abstractmethod
-    def generate(self, prompt: str, max_tokens: int = 400) -> str:
+    async def agenerate(self, messages: List[Dict], max_tokens: int = 400) -> str:
+        pass
+
+    @abstractmethod
+    def agenerate_stream(self, messages: List[Dict], max_tokens: int = 400) -> AsyncIterator[str]:
+        """Yield answer text incrementally as the model produces it."""
+        pass
+
+    def pool_stats(self) -> dict:
+        return {}
+
+    async def aclose(self):
         pass
 
 class OllamaProvider(GeneratorProvider):
-    def __init__(self, base_url: str, model_name: str):
+    # Created once per process (see get_generator_provider) so the client
+    # keeps its keep-alive connections to Ollama between requests.
+    def __init__(self, base_url: str, model_name: str, api: str = "chat"):
         self.base_url = base_url
         self.model_name = model_name
-    
-    def generate(self, prompt: str, max_tokens: int = 400) -> str:
-        resp = requests.post(f"{self.base_url}/api/generate", json={
+        # "chat" sends messages to /api/chat; "generate" a flat prompt to /api/generate
+        self.api = api
+        self.async_client = httpx.AsyncClient(
+            timeout=httpx.Timeout(settings.ollama_timeout, connect=settings.ollama_connect_timeout),
+            limits=httpx.Limits(max_connections=settings.ollama_pool_size,
+                                max_keepalive_connections=settings.ollama_pool_size,
+                                keepalive_expiry=settings.ollama_keepalive_expiry),
+        )
+        self.requests = 0
+        self.connections_opened = 0
+
+    @property
+    def _url(self) -> str:
+        return f"{self.base_url}/api/{self.api}"
+
+    def _payload(self, messages: List[Dict], max_tokens: int, stream: bool) -> dict:
+        payload = {
             "model": self.model_name,
-            "prompt": prompt,
-            "stream": False,
+            "stream": stream,
+            # Keep the model loaded between requests instead of Ollama's 5 min default
+            "keep_alive": settings.ollama_keep_alive,
             "options": {"num_predict": max_tokens}
-        }, timeout=120)
+        }
+        if settings.ollama_num_ctx > 0:
+            # Ollama silently truncates prompts past its default window, history first
+            payload["options"]["num_ctx"] = settings.ollama_num_ctx
+        if self.api == "chat":
+            payload["messages"] = messages
+        else:
+            payload["prompt"] = render_prompt(messages)
+        return payload
+
+    def _text(self, data: dict) -> str:
+        if self.api == "chat":
+            return (data.get("message") or {}).get("content", "")
+        return data.get("response", "")
+
+    def _record(self, data: dict):
+        # Final response: Ollama's own timings (ns). prompt_eval_count shrinks when
+        # a prompt prefix was still in the KV cache from an earlier request.
+        metrics.inc("ollama.prompt_eval_tokens", data.get("prompt_eval_count") or 0)
+        metrics.inc("ollama.eval_tokens", data.get("eval_count") or 0)
+        if data.get("prompt_eval_duration"):
+            metrics.observe("ollama.prompt_eval", data["prompt_eval_duration"] / 1e9)
+        if data.get("eval_duration"):
+            metrics.observe("ollama.eval", data["eval_duration"] / 1e9)
+        if data.get("load_duration"):
+            metrics.observe("ollama.load", data["load_duration"] / 1e9)
+
+    def _line(self, line: str) -> tuple[str, bool]:
+        # One NDJSON line of a streamed response: (text, done)
+        data = json.loads(line)
+        if data.get("error"):
+            raise RuntimeError(data["error"])
+        if data.get("done"):
+            self._record(data)
+        return self._text(data), bool(data.get("done"))
+
+    async def _trace(self, event_name: str, info: dict):
+        # httpx trace hook: fires only when a new TCP connection is opened
+        if event_name == "connection.connect_tcp.complete":
+            self.connections_opened += 1
+
+    async def agenerate(self, messages: List[Dict], max_tokens: int = 400) -> str:
+        self.requests += 1
+        resp = await self.async_client.post(self._url,
+                                            json=self._payload(messages, max_tokens, False),
+                                            extensions={"trace": self._trace})
         resp.raise_for_status()
-        return resp.json().get("response", "").strip()
+        data = resp.json()
+        self._record(data)
+        return self._text(data).strip()
+
+    async def agenerate_stream(self, messages: List[Dict], max_tokens: int = 400) -> AsyncIterator[str]:
+        self.requests += 1
+        async with self.async_client.stream("POST", self._url,
+                                            json=self._payload(messages, max_tokens, True),
+                                            extensions={"trace": self._trace}) as resp:
+            resp.raise_for_status()
+            async for line in resp.aiter_lines():
+                if not line:
+                    continue
+                text, done = self._line(line)
+                if text:
+                    yield text
+                if done:
+                    break
+
+    def pool_stats(self) -> dict:
+        # Fewer connections opened than requests sent means keep-alive reuse
+        return {"requests": self.requests, "connections_opened": self.connections_opened,
+                "connections_reused": max(self.requests - self.connections_opened, 0), "api": self.api}
+
+    async def aclose(self):
+        await self.async_client.aclose()
 
 class GeminiProvider(GeneratorProvider):
     def __init__(self, api_key: str, model_name: str):
         if not api_key:
             raise ValueError("GEMINI_API_KEY is required when using Gemini provider")
         genai.configure(api_key=api_key)
-        self.model = genai.GenerativeModel(model_name)
-    
-    def generate(self, prompt: str, max_tokens: int = 400) -> str:
-        generation_config = genai.types.GenerationConfig(
+        # SYS_PROMPT is constant, so it is set once as the model's system instruction
+        self.model = genai.GenerativeModel(model_name, system_instruction=SYS_PROMPT)
+
+    def _config(self, max_tokens: int):
+        return genai.types.GenerationConfig(
             max_output_tokens=max_tokens,
             temperature=0.1,
         )
-        
-        response = self.model.generate_content(
-            prompt,
-            generation_config=generation_config
+
+    def _contents(self, messages: List[Dict]) -> List[Dict]:
+        roles = {"user": "user", "assistant": "model"}
+        return [{"role": roles[m["role"]], "parts": [m["content"]]} for m in messages if m["role"] in roles]
+
+    async def agenerate(self, messages: List[Dict], max_tokens: int = 400) -> str:
+        response = await self.model.generate_content_async(
+            self._contents(messages),
+            generation_config=self._config(max_tokens)
         )
         return response.text.strip()
 
+    async def agenerate_stream(self, messages: List[Dict], max_tokens: int = 400) -> AsyncIterator[str]:
+        response = await self.model.generate_content_async(
+            self._contents(messages),
+            generation_config=self._config(max_tokens),
+            stream=True
+        )
+        async for chunk in response:
+            if chunk.parts:
+                yield chunk.text
+
+_provider: GeneratorProvider | None = None
+_provider_lock = threading.Lock()
+
 def get_generator_provider() -> GeneratorProvider:
-    if settings.generator_provider.lower() == "gemini":
-        return GeminiProvider(settings.gemini_api_key, settings.gemini_model_name)
-    else:  # Default to ollama
-        return OllamaProvider(settings.ollama_base_url, settings.ollama_model_name)
+    global _provider
+    if _provider is None:
+        with _provider_lock:
+            if _provider is None:
+                t0 = time.perf_counter()
+                if settings.generator_provider.lower() == "gemini":
+                    _provider = GeminiProvider(settings.gemini_api_key, settings.gemini_model_name)
+                else:  # Default to ollama
+                    _provider = OllamaProvider(settings.ollama_base_url, settings.ollama_model_name, settings.ollama_api)
+                metrics.inc("generator.provider_setups")
+                metrics.observe("generator.provider_setup", time.perf_counter() - t0)
+    return _provider
+
+async def close_generator_provider():
+    global _provider
+    if _provider is not None:
+        await _provider.aclose()
+        _provider = None
+
+def _provider_stats() -> dict:
+    stats = {"provider": type(_provider).__name__ if _provider else None}
+    if _provider is not None:
+        stats.update(_provider.pool_stats())
+    return stats
+
+metrics.register("generator", _provider_stats)
+
+class GenerationRejected(Exception):
+    """Raised instead of queueing a generation that would wait past its deadline (served as 429)."""
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.retry_after = retry_after
+
+# Lower runs first
+PRIORITIES = {"interactive": 0, "batch": 1}
+
+class GenerationScheduler:
+    """Admission control in front of the provider.
+
+    At most `concurrency` generations run at once; the rest wait in a
+    priority queue (interactive before batch, FIFO within a priority).
+    A request is rejected up front, before any retrieval work, when more
+    than `max_queue` requests of its priority or higher are waiting or
+    when its estimated wait exceeds its priority's deadline. The estimate
+    is queue position times a moving average of generation time. A
+    request still waiting at its deadline is rejected too.
+    Lives on the event loop; not thread-safe.
+    """
+
+    def __init__(self, concurrency: int, max_queue: int, max_wait: Dict[str, float], initial_seconds: float):
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.avg_seconds = initial_seconds
+        self._running = 0
+        self._queue: list[tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self.stats = {"admitted": 0, "rejected": 0, "timed_out": 0, "max_queued": 0}
+
+    def _ahead(self, priority: int) -> int:
+        return sum(1 for p, _, fut in self._queue if p <= priority and not fut.done())
+
+    def estimated_wait(self, priority: str = "interactive") -> float:
+        if self._running < self.concurrency and not self._queue:
+            return 0.0
+        return (self._ahead(PRIORITIES[priority]) + 1) / self.concurrency * self.avg_seconds
+
+    def admit(self, priority: str = "interactive"):
+        """Raise GenerationRejected if a request of this priority should not queue now."""
+        wait = self.estimated_wait(priority)
+        if self._ahead(PRIORITIES[priority]) >= self.max_queue:
+            reason = "Generator busy: queue full"
+        elif wait > self.max_wait[priority]:
+            reason = f"Generator busy: estimated wait {wait:.0f}s"
+        else:
+            return
+        self.stats["rejected"] += 1
+        metrics.inc(f"generation.rejected.{priority}")
+        raise GenerationRejected(reason, retry_after=wait)
+
+    async def acquire(self, priority: str = "interactive"):
+        self.admit(priority)
+        self.stats["admitted"] += 1
+        t0 = time.monotonic()
+        if self._running < self.concurrency and not self._queue:
+            self._running += 1
+        else:
+            fut = asyncio.get_running_loop().create_future()
+            entry = (PRIORITIES[priority], next(self._seq), fut)
+            heapq.heappush(self._queue, entry)
+            self.stats["max_queued"] = max(self.stats["max_queued"], len(self._queue))
+            try:
+                await asyncio.wait_for(fut, self.max_wait[priority])
+            except BaseException as e:
+                if fut.done() and not fut.cancelled():
+                    # Handed a slot just as we gave up: pass it on
+                    self.release(None)
+                elif entry in self._queue:
+                    # A release() racing the timeout may already have popped it
+                    self._queue.remove(entry)
+                    heapq.heapify(self._queue)
+                if isinstance(e, asyncio.TimeoutError):
+                    self.stats["timed_out"] += 1
+                    metrics.inc(f"generation.timed_out.{priority}")
+                    raise GenerationRejected("Generator busy: queued past the deadline",
+                                             retry_after=self.avg_seconds) from None
+                raise
+        metrics.observe(f"generation.queue_wait.{priority}", time.monotonic() - t0)
+
+    def release(self, seconds: float | None):
+        if seconds is not None:
+            self.avg_seconds = 0.8 * self.avg_seconds + 0.2 * seconds
+        while self._queue:
+            _, _, fut = heapq.heappop(self._queue)
+            if not fut.done():
+                fut.set_result(None)  # the slot passes straight to the waiter
+                return
+        self._running -= 1
+
+    @asynccontextmanager
+    async def slot(self, priority: str = "interactive"):
+        await self.acquire(priority)
+        t0 = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(time.monotonic() - t0)
+
+    def info(self) -> dict:
+        return {**self.stats, "running": self._running, "queued": len(self._queue),
+                "avg_generation_seconds": round(self.avg_seconds, 2)}
+
+generation_scheduler = GenerationScheduler(
+    settings.generation_concurrency, settings.generation_queue_max,
+    {"interactive": settings.generation_max_wait_seconds, "batch": settings.generation_batch_max_wait_seconds},
+    settings.generation_default_seconds)
+metrics.register("generation_scheduler", generation_scheduler.info)
+
+async def generate_answer_async(query: str, context_blocks: List[Dict], max_tokens: int = 400,
+                                history: List[Dict] | None = None, priority: str = "interactive") -> str:
+    provider = get_generator_provider()
+    async with generation_scheduler.slot(priority):
+        return await provider.agenerate(build_messages(query, context_blocks, history), max_tokens)
 
-def generate_answer(query: str, context_blocks: List[Dict], max_tokens: int = 400) -> str:
-    prompt = build_prompt(query, context_blocks)
+async def generate_answer_stream_async(query: str, context_blocks: List[Dict], max_tokens: int = 400,
+                                       history: List[Dict] | None = None,
+                                       priority: str = "interactive") -> AsyncIterator[str]:
     provider = get_generator_provider()
-    return provider.generate(prompt, max_tokens)
+    # The slot is held until the stream ends
+    async with generation_scheduler.slot(priority):
+        async for text in provider.agenerate_stream(build_messages(query, context_blocks, history), max_tokens):
+            yield text
\ No newline at end of file
@@ -1,9 +1,17 @@
-import os, json, datetime
-from typing import Optional
+import os, json, time, datetime, threading
+from typing import Iterable, Optional
+from weaviate.util import generate_uuid5
+from weaviate.classes.query import Filter
 from app.config import settings
 from app.weaviate_client import get_client, ensure_schema
-from app.utils import extract_wikilinks, split_into_sections, window_chunks, slugify
-from app.embeddings import embed_texts
+from app.utils import extract_wikilinks, slugify, file_sha
+from app.embeddings import embed_texts, get_embedding_cache, embedder_signature, count_tokens, chunk_token_limit
+from app.chunker import chunk_markdown
+from app.bulk_writer import BulkWriter
+from app.local_index import LocalIndex, get_local_index
+from app.pipeline import Stage, Pipeline
+from app.object_cache import object_cache
+from app.manifest import load_manifest, save_manifest, reset_manifest, is_unchanged, manifest_path
 
 CHAR_DIR = settings.characters_dir
 SESS_DIR = settings.sessions_dir
@@ -14,61 +22,71 @@ ORG_DIR = settings.organizations_dir
 _char_name_to_id: dict[str, str] = {}
 _location_name_to_id: dict[str, str] = {}
 _organization_name_to_id: dict[str, str] = {}
+# Backend the maps above were written to; entities must be re-added to a new or other index
+_entity_maps_backend: Optional[str] = None
 
-def upsert_character(name: str, path: str) -> str:
-    client = get_client()
-    key = name.strip()
-    if key in _char_name_to_id:
-        return _char_name_to_id[key]
-    
-    characters = client.collections.get("Character")
-    uuid = characters.data.insert({
-        "name": name,
-        "aliases": [],
-        "path": path
-    })
-    _char_name_to_id[key] = str(uuid)
-    return str(uuid)
+def _reset_entity_maps(backend: Optional[str]):
+    global _entity_maps_backend
+    for name_to_id in (_char_name_to_id, _location_name_to_id, _organization_name_to_id):
+        name_to_id.clear()
+    _entity_maps_backend = backend
 
-def upsert_location(name: str, path: str) -> str:
-    client = get_client()
-    key = name.strip()
-    if key in _location_name_to_id:
-        return _location_name_to_id[key]
-    
-    locations = client.collections.get("Location")
-    uuid = locations.data.insert({
-        "name": name,
-        "aliases": [],
-        "path": path
-    })
-    _location_name_to_id[key] = str(uuid)
-    return str(uuid)
+# Bumped whenever a scan changes the index; answer caches key on it
+_index_version = 0
 
-def upsert_organization(name: str, path: str) -> str:
-    client = get_client()
+def index_version() -> int:
+    return _index_version
+
+def bump_index_version():
+    global _index_version
+    _index_version += 1
+
+def _upsert_entity(collection_name: str,
+                   name_to_id: dict[str, str],
+                   name: str,
+                   path: str,
+                   writer: Optional[BulkWriter | LocalIndex] = None) -> str:
     key = name.strip()
-    if key in _organization_name_to_id:
-        return _organization_name_to_id[key]
-    
-    organizations = client.collections.get("Organization")
-    uuid = organizations.data.insert({
+    if key in name_to_id:
+        return name_to_id[key]
+
+    # Deterministic ids keep entities stable across restarts and rescans
+    uuid = generate_uuid5(key, collection_name)
+    props = {
         "name": name,
         "aliases": [],
         "path": path
-    })
-    _organization_name_to_id[key] = str(uuid)
+    }
+    if writer is not None:
+        # Batch inserts overwrite by uuid, so no existence check is needed
+        writer.add(collection_name, props, uuid=uuid)
+    else:
+        collection = get_client().collections.get(collection_name)
+        if not collection.data.exists(uuid):
+            collection.data.insert(props, uuid=uuid)
+    name_to_id[key] = str(uuid)
+    # Keeps the request path from asking Weaviate for entity names
+    object_cache.put(str(uuid), {"name": name, "path": path})
     return str(uuid)
 
-def sync_characters():
+def upsert_character(name: str, path: str, writer: Optional[BulkWriter | LocalIndex] = None) -> str:
+    return _upsert_entity("Character", _char_name_to_id, name, path, writer)
+
+def upsert_location(name: str, path: str, writer: Optional[BulkWriter | LocalIndex] = None) -> str:
+    return _upsert_entity("Location", _location_name_to_id, name, path, writer)
+
+def upsert_organization(name: str, path: str, writer: Optional[BulkWriter | LocalIndex] = None) -> str:
+    return _upsert_entity("Organization", _organization_name_to_id, name, path, writer)
+
+def sync_characters(writer: Optional[BulkWriter | LocalIndex] = None):
     # Create Character objects from files in character dir
     for fn in os.listdir(CHAR_DIR):
         if not fn.lower().endswith(".md"): continue
         name = os.path.splitext(fn)[0]
         path = os.path.join(CHAR_DIR, fn)
-        upsert_character(name, path)
+        upsert_character(name, path, writer)
 
-def sync_locations():
+def sync_locations(writer: Optional[BulkWriter | LocalIndex] = None):
     # Create Location objects from files in location dir
     if not os.path.exists(LOC_DIR):
         return
@@ -76,9 +94,9 @@ def sync_locations():
         if not fn.lower().endswith(".md"): continue
         name = os.path.splitext(fn)[0]
         path = os.path.join(LOC_DIR, fn)
-        upsert_location(name, path)
+        upsert_location(name, path, writer)
 
-def sync_organizations():
+def sync_organizations(writer: Optional[BulkWriter | LocalIndex] = None):
     # Create Organization objects from files in organization dir
     if not os.path.exists(ORG_DIR):
         return
@@ -86,7 +104,28 @@ def sync_organizations():
         if not fn.lower().endswith(".md"): continue
         name = os.path.splitext(fn)[0]
         path = os.path.join(ORG_DIR, fn)
-        upsert_organization(name, path)
+        upsert_organization(name, path, writer)
+
+def entity_ids_from_notes() -> dict[str, dict[str, str]]:
+    # Chunk reference -> {name: id} for every entity note, with the ids
+    # _upsert_entity would give them, without touching the index
+    out = {}
+    for ref, collection_name, directory in (("characters", "Character", CHAR_DIR),
+                                            ("locations", "Location", LOC_DIR),
+                                            ("organizations", "Organization", ORG_DIR)):
+        name_to_id = out[ref] = {}
+        if not os.path.exists(directory):
+            continue
+        for fn in os.listdir(directory):
+            if not fn.lower().endswith(".md"): continue
+            key = os.path.splitext(fn)[0].strip()
+            name_to_id[key] = str(generate_uuid5(key, collection_name))
+    return out
+
+def latest_session_no() -> Optional[int]:
+    numbers = [parse_session_filename(fn)[0] for fn in os.listdir(SESS_DIR) if fn.lower().endswith(".md")]
+    numbers = [n for n in numbers if n is not None]
+    return max(numbers) if numbers else None
 
 def parse_session_filename(fn: str) -> tuple[Optional[int], Optional[str]]:
     # e.g., "Session 14.md" or "2024-12-30 - Session 14.md"
@@ -98,7 +137,8 @@ def parse_session_filename(fn: str) -> tuple[Optional[int], Optional[str]]:
     date = None
     m2 = re.match(r"(\d{4}-\d{2}-\d{2})", fn)
     if m2:
-        date = m2.group(1)
+        # Weaviate DATE properties (and date filters) need RFC 3339
+        date = f"{m2.group(1)}T00:00:00Z"
     return session_no, date
 
 
@@ -106,19 +146,43 @@ def upsert_document(doc_type: str,
                     title: str,
                     path: str,
                     session_no: Optional[int],
-                    session_date: Optional[str]) -> str:
-    client = get_client()
-    documents = client.collections.get("Document")
-    uuid = documents.data.insert({
+                    session_date: Optional[str],
+                    writer: Optional[BulkWriter | LocalIndex] = None) -> str:
+    # One Document per path: replace any previous version and its chunks
+    uuid = generate_uuid5(path, "Document")
+    props = {
         "type": doc_type,
         "title": title,
         "path": path,
         "sessionNo": session_no,
         "sessionDate": session_date,
-    })
+    }
+    object_cache.put(str(uuid), props)
+    if writer is not None:
+        # The batch insert overwrites the Document; only old chunks need clearing
+        writer.delete_document_chunks(uuid)
+        writer.add("Document", props, uuid=uuid)
+        return str(uuid)
+    documents = get_client().collections.get("Document")
+    if documents.data.exists(uuid):
+        delete_document(uuid)
+    documents.data.insert(props, uuid=uuid)
     return str(uuid)
 
 
+def delete_document_chunks(doc_uuid: str):
+    chunks = get_client().collections.get("Chunk")
+    chunks.data.delete_many(where=Filter.by_ref(link_on="ofDoc").by_id().equal(doc_uuid))
+
+
+def delete_document(doc_uuid: str):
+    client = get_client()
+    delete_document_chunks(doc_uuid)
+    documents = client.collections.get("Document")
+    documents.data.delete_by_id(doc_uuid)
+    object_cache.discard(doc_uuid)
+
+
 def upsert_chunk(text: str,
                  heading: Optional[str],
                  of_doc_uuid: str,
@@ -127,103 +191,301 @@ def upsert_chunk(text: str,
                  session_date: Optional[str],
                  char_uuids: list[str],
                  location_uuids: list[str] = [],
-                 organization_uuids: list[str] = []):
-    client = get_client()
-    vec = embed_texts([text])[0]
-    
-    chunks = client.collections.get("Chunk")
-    chunks.data.insert(
-        properties={
-            "text": text,
-            "heading": heading or "",
-            "startChar": 0,
-            "endChar": len(text),
-            "sessionNo": session_no,
-            "sessionDate": session_date,
-            "doc_title": doc_title,
-        },
-        references={
-            "ofDoc": of_doc_uuid,
-            "characters": char_uuids,
-            "locations": location_uuids,
-            "organizations": organization_uuids,
-        },
-        vector=vec
-    )
-
-
-def scan_once() -> dict:
-    ensure_schema()
-    sync_characters()
-    sync_locations()
-    sync_organizations()
-
-    indexed_docs = 0
-    indexed_chunks = 0
-
-    # Process session files
+                 organization_uuids: list[str] = [],
+                 start_char: int = 0,
+                 end_char: Optional[int] = None,
+                 vector: Optional[list[float]] = None,
+                 writer: Optional[BulkWriter | LocalIndex] = None):
+    vec = vector if vector is not None else embed_texts([text])[0]
+    properties = {
+        "text": text,
+        "heading": heading or "",
+        "startChar": start_char,
+        "endChar": end_char if end_char is not None else start_char + len(text),
+        "sessionNo": session_no,
+        "sessionDate": session_date,
+        "doc_title": doc_title,
+    }
+    references = {
+        "ofDoc": of_doc_uuid,
+        "characters": char_uuids,
+        "locations": location_uuids,
+        "organizations": organization_uuids,
+    }
+    if writer is not None:
+        writer.add("Chunk", properties, references=references, vector=vec)
+        return
+
+    chunks = get_client().collections.get("Chunk")
+    chunks.data.insert(properties=properties, references=references, vector=vec)
+
+
+def iter_note_files():
+    # Yields (doc_type, path, title, session_no, session_date) for every note
     for fn in sorted(os.listdir(SESS_DIR)):
         if not fn.lower().endswith(".md"): continue
-        path = os.path.join(SESS_DIR, fn)
-        title = os.path.splitext(fn)[0]
         session_no, session_date = parse_session_filename(fn)
-        doc_uuid = upsert_document("session", title, path, session_no, session_date)
-        indexed_docs += 1
-        indexed_chunks += process_document_chunks(path, doc_uuid, title, session_no, session_date)
+        yield "session", os.path.join(SESS_DIR, fn), os.path.splitext(fn)[0], session_no, session_date
 
-    # Process character files
-    if os.path.exists(CHAR_DIR):
-        for fn in sorted(os.listdir(CHAR_DIR)):
-            if not fn.lower().endswith(".md"): continue
-            path = os.path.join(CHAR_DIR, fn)
-            title = f"{os.path.splitext(fn)[0]} Character"
-            doc_uuid = upsert_document("character", title, path, None, None)
-            indexed_docs += 1
-            indexed_chunks += process_document_chunks(path, doc_uuid, title, None, None)
-
-    # Process location files
-    if os.path.exists(LOC_DIR):
-        for fn in sorted(os.listdir(LOC_DIR)):
+    for doc_type, label, directory in (("character", "Character", CHAR_DIR),
+                                       ("location", "Location", LOC_DIR),
+                                       ("organization", "Organization", ORG_DIR)):
+        if not os.path.exists(directory):
+            continue
+        for fn in sorted(os.listdir(directory)):
             if not fn.lower().endswith(".md"): continue
-            path = os.path.join(LOC_DIR, fn)
-            title = f"{os.path.splitext(fn)[0]} Location"
-            doc_uuid = upsert_document("location", title, path, None, None)
-            indexed_docs += 1
-            indexed_chunks += process_document_chunks(path, doc_uuid, title, None, None)
-
-    # Process organization files
-    if os.path.exists(ORG_DIR):
-        for fn in sorted(os.listdir(ORG_DIR)):
-            if not fn.lower().endswith(".md"): continue
-            path = os.path.join(ORG_DIR, fn)
-            title = f"{os.path.splitext(fn)[0]} Organization"
-            doc_uuid = upsert_document("organization", title, path, None, None)
-            indexed_docs += 1
-            indexed_chunks += process_document_chunks(path, doc_uuid, title, None, None)
+            title = f"{os.path.splitext(fn)[0]} {label}"
+            yield doc_type, os.path.join(directory, fn), title, None, None
+
+
+def delete_legacy_objects() -> int:
+    """Delete Weaviate objects whose id is not the one ingest derives for them.
+
+    Indexes built before the manifest gave every object a random id, which
+    a scan would duplicate instead of overwrite. Objects with derived ids
+    are left alone. Returns how many objects were deleted (chunks excluded).
+    """
+    client = get_client()
+    deleted = 0
+    for collection_name in ("Character", "Location", "Organization"):
+        collection = client.collections.get(collection_name)
+        stale = [str(obj.uuid) for obj in collection.iterator(return_properties=["name"])
+                 if str(obj.uuid) != generate_uuid5((obj.properties.get("name") or "").strip(), collection_name)]
+        for uuid in stale:
+            collection.data.delete_by_id(uuid)
+            object_cache.discard(uuid)
+        deleted += len(stale)
+    documents = client.collections.get("Document")
+    stale = [str(obj.uuid) for obj in documents.iterator(return_properties=["path"])
+             if str(obj.uuid) != generate_uuid5(obj.properties.get("path") or "", "Document")]
+    for uuid in stale:
+        delete_document(uuid)
+    return deleted + len(stale)
+
+
+def manifest_signature() -> str:
+    # Unchanged notes must be re-chunked (not just skipped) when the chunking changes
+    return f"{embedder_signature()}|chunks:{chunk_token_limit()}:{settings.chunk_overlap_tokens}"
+
+
+def open_index(backend: str) -> BulkWriter | LocalIndex:
+    # Returns the writer for the backend, first forgetting the manifest if the index is new
+    if backend == "local":
+        index = get_local_index()
+        if index.is_new or index.embedder != embedder_signature():
+            # Vectors from another model can't share the matrix: start over
+            index.clear()
+            index.embedder = embedder_signature()
+            reset_manifest(backend)
+            _reset_entity_maps(backend)
+        writer = index
+    else:
+        created = ensure_schema()
+        if "Document" in created or "Chunk" in created:
+            # Fresh index: anything the manifest remembers is gone
+            reset_manifest(backend)
+            _reset_entity_maps(backend)
+        elif not os.path.exists(manifest_path(backend)):
+            # Possibly indexed before ids were derived from paths and names
+            delete_legacy_objects()
+        writer = BulkWriter()
+    if _entity_maps_backend != backend:
+        _reset_entity_maps(backend)
+    return writer
+
+
+class ScanProgress:
+    """Live counters of a running scan, and a flag asking it to stop early."""
+
+    def __init__(self):
+        self.files_total = 0
+        self.files_done = 0
+        self.chunks_embedded = 0
+        self.started: Optional[float] = None
+        self.cancelled = threading.Event()
+        self._lock = threading.Lock()
+
+    def add(self, files: int = 0, chunks: int = 0):
+        with self._lock:
+            self.files_done += files
+            self.chunks_embedded += chunks
+
+    def snapshot(self) -> dict:
+        elapsed = time.monotonic() - self.started if self.started else 0.0
+        rate = self.files_done / elapsed if elapsed else 0.0
+        remaining = max(self.files_total - self.files_done, 0)
+        return {
+            "files_total": self.files_total,
+            "files_done": self.files_done,
+            "chunks_embedded": self.chunks_embedded,
+            "files_per_sec": round(rate, 2),
+            "chunks_per_sec": round(self.chunks_embedded / elapsed, 1) if elapsed else 0.0,
+            "eta_seconds": round(remaining / rate, 1) if rate else None,
+        }
+
+
+# Scans share the entity maps, the manifest and the writer: one at a time
+_scan_lock = threading.Lock()
+
+
+def scan_once(backend: Optional[str] = None,
+              paths: Optional[Iterable[str]] = None,
+              progress: Optional[ScanProgress] = None) -> dict:
+    """Incremental scan of the notes into the index.
+
+    `paths` limits the work to those files (the watcher passes the ones it saw
+    change); files that no longer exist are deleted either way. A cancelled
+    `progress` stops queueing files; ones already queued are finished so the
+    index and manifest stay consistent.
+    """
+    with _scan_lock:
+        return _scan(backend or settings.retrieval_backend,
+                     set(paths) if paths is not None else None,
+                     progress or ScanProgress())
+
+
+def _scan(backend: str, paths: Optional[set[str]], progress: ScanProgress) -> dict:
+    progress.started = time.monotonic()
+    if paths is not None and not os.path.exists(manifest_path(backend)):
+        # Without a manifest there is no telling what the index holds: scan everything
+        paths = None
+    writer = open_index(backend)
+    sync_characters(writer)
+    sync_locations(writer)
+    sync_organizations(writer)
+
+    manifest = load_manifest(manifest_signature(), backend)
+    stats = {"indexed_docs": 0, "indexed_chunks": 0,
+             "added": 0, "updated": 0, "skipped": 0, "deleted": 0,
+             "embed_seconds": 0.0, "embed_chunks_per_sec": 0.0}
+    seen = set()
+    lock = threading.Lock()
+    cache = get_embedding_cache()
+    cache_before = cache.stats() if cache is not None else None
+
+    # Stage 1 (worker pool): read + split + resolve links, queue chunks
+    def parse(job):
+        doc_type, path, title, session_no, session_date, sha, stat, is_update = job
+        if progress.cancelled.is_set():
+            return []
+        doc_uuid = upsert_document(doc_type, title, path, session_no, session_date, writer)
+        chunks: list[dict] = []
+        chunk_count = process_document_chunks(path, doc_uuid, title, session_no, session_date, chunks)
+        with lock:
+            stats["updated" if is_update else "added"] += 1
+            stats["indexed_docs"] += 1
+            stats["indexed_chunks"] += chunk_count
+            manifest[path] = {
+                "sha": sha,
+                "mtime": stat.st_mtime,
+                "size": stat.st_size,
+                "doc_uuid": doc_uuid,
+                "chunks": chunk_count,
+            }
+        progress.add(files=1)
+        return chunks
+
+    # Stage 2 (single thread): batched, length-sorted embedding
+    def embed(chunks):
+        vectors = embed_texts([c["text"] for c in chunks], batch_size=settings.embed_batch_size)
+        progress.add(chunks=len(chunks))
+        return zip(chunks, vectors)
+
+    # Stage 3: hand embedded chunks to the bulk writer
+    def write(items):
+        for chunk, vec in items:
+            upsert_chunk(**chunk, vector=vec, writer=writer)
+
+    write_stage = Stage("write", write, maxsize=settings.ingest_queue_size, batch=settings.write_batch_size)
+    embed_stage = Stage("embed", embed, maxsize=settings.ingest_queue_size,
+                        batch=settings.ingest_flush_chunks, downstream=write_stage)
+    parse_stage = Stage("parse", parse, workers=settings.ingest_parse_workers,
+                        maxsize=settings.ingest_parse_workers * 2, downstream=embed_stage)
+    pipeline = Pipeline([parse_stage, embed_stage, write_stage])
+
+    files = list(iter_note_files())
+    progress.files_total = len(files) if paths is None else sum(1 for f in files if f[1] in paths)
+    try:
+        for doc_type, path, title, session_no, session_date in files:
+            seen.add(path)
+            if paths is not None and path not in paths:
+                continue
+            if progress.cancelled.is_set():
+                break
+            stat = os.stat(path)
+            entry = manifest.get(path)
+            if is_unchanged(entry, stat):
+                stats["skipped"] += 1
+                progress.add(files=1)
+                continue
+            sha = file_sha(path)
+            if entry and entry.get("sha") == sha:
+                # Touched but not edited
+                entry.update(mtime=stat.st_mtime, size=stat.st_size)
+                stats["skipped"] += 1
+                progress.add(files=1)
+                continue
+            pipeline.put((doc_type, path, title, session_no, session_date, sha, stat, entry is not None))
+        # Files that disappeared since the last scan (parse workers still update the manifest).
+        # After a cancel `seen` is incomplete, so nothing can be called removed.
+        with lock:
+            removed = [] if progress.cancelled.is_set() else [
+                (path, manifest.pop(path)) for path in sorted(set(manifest) - seen)]
+        for path, entry in removed:
+            writer.delete_document(entry["doc_uuid"])
+            object_cache.discard(entry["doc_uuid"])
+            stats["deleted"] += 1
+    finally:
+        try:
+            pipeline.close()
+        finally:
+            writer.close()
+
+    stage_stats = pipeline.stats()
+    stats["stages"] = stage_stats
+    stats["embed_seconds"] = stage_stats["embed"]["busy_seconds"]
+    if stats["embed_seconds"] > 0:
+        stats["embed_chunks_per_sec"] = round(stage_stats["embed"]["items"] / stats["embed_seconds"], 1)
+    if cache is not None:
+        cache_after = cache.stats()
+        stats["embed_cache_hits"] = cache_after["hits"] - cache_before["hits"]
+        stats["embed_cache_misses"] = cache_after["misses"] - cache_before["misses"]
+        stats["embed_cache_entries"] = cache_after["entries"]
+    stats.update(writer.report())
+    # Forget documents that did not fully land so the next scan retries them
+    failed_docs = writer.failed_doc_uuids()
+    for path in [p for p, e in manifest.items() if e.get("doc_uuid") in failed_docs]:
+        del manifest[path]
+
+    save_manifest(manifest, manifest_signature(), backend)
+    if stats["indexed_docs"] or stats["deleted"]:
+        bump_index_version()
+    stats["index_version"] = index_version()
+    stats["cancelled"] = progress.cancelled.is_set()
+    return stats
 
-    return {"indexed_docs": indexed_docs, "indexed_chunks": indexed_chunks}
 
 def process_document_chunks(path: str, 
                             doc_uuid: str, 
                             doc_title: str,
                             session_no: Optional[int], 
-                            session_date: Optional[str]) -> int:
-    """Process a document file and create chunks with entity links"""
+                            session_date: Optional[str],
+                            pending: Optional[list[dict]] = None) -> int:
+    """Process a document file and create chunks with entity links.
+
+    When `pending` is given, chunks are collected there for the pipeline's
+    embedding stage instead of being embedded and inserted one at a time."""
     chunk_count = 0
     
     with open(path, "r", encoding="utf-8") as f:
         md = f.read()
-        sections = split_into_sections(md)
-        if not sections:
-            sections = [(None, md)]
 
-    for heading, body in sections:
-        # favor heading-bounded chunks, but window if long
-        bodies = list(window_chunks(body, max_chars=2000, overlap=200))
+    limit = chunk_token_limit()
+    for heading, chunks in chunk_markdown(md, count_tokens, limit, min(settings.chunk_overlap_tokens, limit // 2)):
         char_uuids = []
         location_uuids = []
         organization_uuids = []
-        for chunk_text in bodies:
+        for chunk_text, start_char, end_char in chunks:
             # resolve [[links]] to characters, locations, and organizations
             wikilinks = extract_wikilinks(chunk_text)
             for wl in wikilinks:
@@ -249,7 +511,16 @@ def process_document_chunks(path: str,
                 entity_uuid = _organization_name_to_id[doc_title]
                 if entity_uuid not in organization_uuids:
                     organization_uuids.append(entity_uuid)
-            upsert_chunk(chunk_text, heading, doc_uuid, doc_title, session_no, session_date, char_uuids, location_uuids, organization_uuids)
+            chunk = dict(text=chunk_text, heading=heading, of_doc_uuid=doc_uuid, doc_title=doc_title,
+                         session_no=session_no, session_date=session_date,
+                         start_char=start_char, end_char=end_char,
+                         char_uuids=list(char_uuids),
+                         location_uuids=list(location_uuids),
+                         organization_uuids=list(organization_uuids))
+            if pending is not None:
+                pending.append(chunk)
+            else:
+                upsert_chunk(**chunk)
             chunk_count += 1
     
     return chunk_count
\ No newline at end of file
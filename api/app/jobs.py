@@ -0,0 +1,112 @@
+import time, uuid, threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Optional
+from app.ingest import scan_once, ScanProgress
+
+
+# Finished jobs kept for GET /ingest/jobs
+MAX_FINISHED_JOBS = 50
+
+
+class IngestJob:
+    def __init__(self, paths: Optional[set[str]] = None):
+        self.id = uuid.uuid4().hex[:12]
+        self.paths = paths
+        self.status = "queued"  # queued, running, succeeded, failed, cancelled
+        self.progress = ScanProgress()
+        self.result: Optional[dict] = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.future: Optional[Future] = None
+
+    @property
+    def done(self) -> bool:
+        return self.status in ("succeeded", "failed", "cancelled")
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "scope": "full" if self.paths is None else f"{len(self.paths)} files",
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "progress": self.progress.snapshot(),
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+class IngestJobs:
+    """Runs scans as background jobs on a dedicated single-thread executor.
+
+    One thread means one writer; scan_once's lock also keeps out callers
+    that bypass the queue. Keeping ingest off the request path's CPU pool
+    keeps /ask latency steady while a reindex runs.
+    """
+
+    def __init__(self):
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ingest")
+        self._jobs: OrderedDict[str, IngestJob] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, paths: Optional[set[str]] = None) -> IngestJob:
+        with self._lock:
+            if paths is None:
+                # A full scan already waiting will pick up everything this one would
+                for job in self._jobs.values():
+                    if job.status == "queued" and job.paths is None:
+                        return job
+            job = IngestJob(paths)
+            # Submitted before anyone can see the job, so cancel() always finds its future
+            job.future = self._executor.submit(self._run, job)
+            self._jobs[job.id] = job
+            self._prune()
+        return job
+
+    def _run(self, job: IngestJob):
+        if job.progress.cancelled.is_set():
+            job.status, job.finished_at = "cancelled", time.time()
+            return
+        job.status, job.started_at = "running", time.time()
+        try:
+            job.result = scan_once(paths=job.paths, progress=job.progress)
+            job.status = "cancelled" if job.result.get("cancelled") else "succeeded"
+        except Exception as e:
+            job.status, job.error = "failed", f"{type(e).__name__}: {e}"
+        finally:
+            job.finished_at = time.time()
+
+    def _prune(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.done]
+        for job_id in finished[:max(len(finished) - MAX_FINISHED_JOBS, 0)]:
+            del self._jobs[job_id]
+
+    def get(self, job_id: str) -> Optional[IngestJob]:
+        return self._jobs.get(job_id)
+
+    def list(self) -> list[IngestJob]:
+        with self._lock:
+            return list(reversed(self._jobs.values()))
+
+    def cancel(self, job_id: str) -> Optional[IngestJob]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.done:
+                return job
+            job.progress.cancelled.set()
+            if job.future.cancel():
+                # Never started
+                job.status, job.finished_at = "cancelled", time.time()
+        return job
+
+    def shutdown(self):
+        for job in list(self._jobs.values()):
+            job.progress.cancelled.set()
+        self._executor.shutdown(wait=True)
+
+
+ingest_jobs = IngestJobs()
\ No newline at end of file
@@ -0,0 +1,340 @@
+import os, re, json, time, threading
+import uuid as uuidlib
+from typing import Any, Optional
+import numpy as np
+from rank_bm25 import BM25Okapi
+from app.config import settings
+from app.filters import SearchFilters
+
+
+# Chunk reference name for each entity collection
+ENTITY_REFS = {"Character": "characters", "Location": "locations", "Organization": "organizations"}
+
+# Like Weaviate's hybrid, each sub-search contributes its own top results before fusion
+HYBRID_POOL = 100
+
+_TOKEN_RE = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> list[str]:
+    return _TOKEN_RE.findall(text.lower())
+
+
+def _top(scores: np.ndarray, n: int) -> np.ndarray:
+    if len(scores) <= n:
+        return np.argsort(-scores)
+    part = np.argpartition(-scores, n)[:n]
+    return part[np.argsort(-scores[part])]
+
+
+def _relative(scores: np.ndarray) -> np.ndarray:
+    # relativeScoreFusion: scale each result list to [0, 1] before mixing
+    if not len(scores):
+        return scores
+    lo, hi = float(scores.min()), float(scores.max())
+    if hi == lo:
+        return np.ones_like(scores)
+    return (scores - lo) / (hi - lo)
+
+
+class LocalIndex:
+    """In-process stand-in for the Weaviate collections.
+
+    Chunk vectors are a float32 matrix, memory-mapped from disk when loaded;
+    keyword search is BM25 over the chunk text, fused with cosine scores the
+    same way `hybrid_search` asks Weaviate to. Deleted chunks are only marked
+    dead until the next `save()` compacts the files.
+
+    It also implements the writer interface ingest feeds (`add`, the delete
+    methods, `close`, `report`), so a scan fills it just like Weaviate.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.embedder: Optional[str] = None
+        self._lock = threading.RLock()
+        self._chunks: list[dict] = []
+        self._documents: dict[str, dict] = {}
+        self._entities: dict[str, dict] = {}
+        self._vectors = np.zeros((0, 0), dtype=np.float32)
+        self._pending: list[np.ndarray] = []
+        self._alive: list[bool] = []
+        self._alive_rows = np.zeros(0, dtype=bool)
+        self._rows_by_doc: dict[str, list[int]] = {}
+        self._bm25: Optional[BM25Okapi] = None
+        self._bm25_rows = 0
+        self._stale = False
+        self.stats = {"searches": 0, "search_seconds": 0.0, "written": 0, "write_seconds": 0.0}
+        self.is_new = not os.path.exists(self._path("meta.json"))
+        if not self.is_new:
+            self._load()
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _load(self):
+        try:
+            with open(self._path("meta.json"), "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            with open(self._path("chunks.json"), "r", encoding="utf-8") as f:
+                chunks = json.load(f)
+            with open(self._path("objects.json"), "r", encoding="utf-8") as f:
+                objects = json.load(f)
+            rows, dim = meta["rows"], meta["dim"]
+            if len(chunks) != rows:
+                raise ValueError("chunk count does not match the vector file")
+            vectors = (np.memmap(self._path("vectors.f32"), dtype=np.float32, mode="r", shape=(rows, dim))
+                       if rows else np.zeros((0, dim), dtype=np.float32))
+        except (OSError, ValueError, KeyError):
+            # A damaged index only costs a full rescan
+            self.is_new = True
+            return
+        self.embedder = meta.get("embedder")
+        self._chunks = chunks
+        self._documents = objects.get("documents", {})
+        self._entities = objects.get("entities", {})
+        self._vectors = vectors
+        self._alive = [True] * rows
+        self._reindex_docs()
+        self._stale = True
+
+    def _reindex_docs(self):
+        self._rows_by_doc = {}
+        for row, chunk in enumerate(self._chunks):
+            self._rows_by_doc.setdefault(chunk["doc"], []).append(row)
+
+    def _consolidate(self):
+        # Fold rows added since the last search into the matrix and masks
+        if not self._stale:
+            return
+        if self._pending:
+            new = np.stack(self._pending)
+            self._vectors = np.concatenate([self._vectors, new]) if len(self._vectors) else new
+            self._pending = []
+        self._alive_rows = np.asarray(self._alive, dtype=bool)
+        self._stale = False
+
+    def _bm25_index(self) -> BM25Okapi:
+        if self._bm25 is None or self._bm25_rows != len(self._chunks):
+            self._bm25 = BM25Okapi([tokenize(c["properties"].get("text") or "") for c in self._chunks])
+            self._bm25_rows = len(self._chunks)
+        return self._bm25
+
+    def warm(self):
+        # Build the BM25 index ahead of the first query
+        with self._lock:
+            self._consolidate()
+            if self._chunks:
+                self._bm25_index()
+
+    # Writer interface (see BulkWriter)
+
+    def add(self, collection: str, properties: dict, uuid: Optional[str] = None,
+            references: Optional[dict] = None, vector: Optional[list[float]] = None):
+        t0 = time.perf_counter()
+        with self._lock:
+            if collection == "Chunk":
+                refs = references or {}
+                doc = str(refs["ofDoc"]) if refs.get("ofDoc") else None
+                vec = np.asarray(vector, dtype=np.float32)
+                norm = float(np.linalg.norm(vec))
+                self._rows_by_doc.setdefault(doc, []).append(len(self._chunks))
+                self._chunks.append({
+                    "id": str(uuid or uuidlib.uuid4()),
+                    "doc": doc,
+                    "properties": dict(properties),
+                    **{ref: [str(u) for u in refs.get(ref) or []] for ref in ENTITY_REFS.values()},
+                })
+                self._pending.append(vec / norm if norm else vec)
+                self._alive.append(True)
+                self._stale = True
+            elif collection == "Document":
+                self._documents[str(uuid)] = dict(properties)
+            else:
+                self._entities[str(uuid)] = {"collection": collection, **properties}
+            self.stats["written"] += 1
+            self.stats["write_seconds"] += time.perf_counter() - t0
+
+    def delete_document_chunks(self, doc_uuid: str):
+        with self._lock:
+            for row in self._rows_by_doc.pop(str(doc_uuid), []):
+                self._alive[row] = False
+            self._stale = True
+
+    def delete_document(self, doc_uuid: str):
+        with self._lock:
+            self.delete_document_chunks(doc_uuid)
+            self._documents.pop(str(doc_uuid), None)
+
+    def clear(self):
+        with self._lock:
+            self._chunks, self._documents, self._entities = [], {}, {}
+            self._vectors = np.zeros((0, 0), dtype=np.float32)
+            self._pending, self._alive, self._rows_by_doc = [], [], {}
+            self._bm25 = None
+            self._stale = True
+
+    def flush(self):
+        with self._lock:
+            self._consolidate()
+
+    def close(self):
+        self.save()
+
+    def report(self) -> dict:
+        return {
+            "write_seconds": round(self.stats["write_seconds"], 3),
+            "write_batches": 0,
+            "write_avg_batch_ms": 0.0,
+            "write_max_batch_ms": 0.0,
+            "write_retried": 0,
+            "write_failed": 0,
+            "write_errors": [],
+        }
+
+    def failed_doc_uuids(self) -> set[str]:
+        return set()
+
+    def save(self):
+        t0 = time.perf_counter()
+        with self._lock:
+            self._consolidate()
+            keep = np.flatnonzero(self._alive_rows)
+            dim = self._vectors.shape[1] if self._vectors.ndim == 2 else 0
+            vectors = np.ascontiguousarray(self._vectors[keep]) if len(keep) else np.zeros((0, dim), dtype=np.float32)
+            chunks = [self._chunks[i] for i in keep]
+            os.makedirs(self.directory, exist_ok=True)
+            # meta.json goes last; its row count guards against a save cut short
+            self._write(vectors.tofile, "vectors.f32")
+            self._write_json({"documents": self._documents, "entities": self._entities}, "objects.json")
+            self._write_json(chunks, "chunks.json")
+            self._write_json({"version": 1, "rows": len(chunks), "dim": int(dim), "embedder": self.embedder},
+                             "meta.json")
+
+            # Compacted: dead rows are gone, so BM25 is rebuilt on the next query
+            self._chunks, self._vectors = chunks, vectors
+            self._alive = [True] * len(chunks)
+            self._alive_rows = np.ones(len(chunks), dtype=bool)
+            self._reindex_docs()
+            self._bm25 = None
+            self.is_new = False
+            self.stats["write_seconds"] += time.perf_counter() - t0
+
+    def _write(self, writer, name: str):
+        tmp_path = self._path(name + ".tmp")
+        writer(tmp_path)
+        os.replace(tmp_path, self._path(name))
+
+    def _write_json(self, data: Any, name: str):
+        def dump(path):
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+        self._write(dump, name)
+
+    # Search
+
+    def search(self,
+               query: str,
+               query_vector: list[float],
+               k: int = 30,
+               alpha: float = 0.5,
+               filters: Optional[SearchFilters] = None,
+               include_vector: bool = False) -> list[dict[str, Any]]:
+        t0 = time.perf_counter()
+        with self._lock:
+            self._consolidate()
+            if not self._chunks or not len(self._vectors):
+                return []
+            rows = self._alive_rows
+            if filters is not None and not filters.is_empty():
+                # A chunk record holds its reference ids under the reference names
+                rows = rows & np.fromiter(
+                    (filters.matches(c["properties"], c, self._documents.get(c["doc"])) for c in self._chunks),
+                    dtype=bool, count=len(self._chunks))
+            candidates = np.flatnonzero(rows)
+            if not len(candidates):
+                return []
+
+            pool = max(k, HYBRID_POOL)
+            q = np.asarray(query_vector, dtype=np.float32)
+            q = q / (np.linalg.norm(q) or 1.0)
+            cosine = (self._vectors @ q)[candidates]
+            tokens = tokenize(query)
+            keyword = (self._bm25_index().get_scores(tokens)[candidates] if tokens
+                       else np.zeros(len(candidates)))
+
+            fused: dict[int, float] = {}
+            vec_top = _top(cosine, pool)
+            for pos, score in zip(vec_top, _relative(cosine[vec_top])):
+                fused[int(pos)] = alpha * float(score)
+            # Keyword search only returns chunks that contain a query term
+            kw_top = np.array([p for p in _top(keyword, pool) if keyword[p] > 0], dtype=int)
+            for pos, score in zip(kw_top, _relative(keyword[kw_top])):
+                fused[int(pos)] = fused.get(int(pos), 0.0) + (1 - alpha) * float(score)
+
+            ranked = sorted(fused.items(), key=lambda x: x[1], reverse=True)[:k]
+            results = [self._result(int(candidates[pos]), score, float(cosine[pos]), include_vector)
+                       for pos, score in ranked]
+            self.stats["searches"] += 1
+            self.stats["search_seconds"] += time.perf_counter() - t0
+            return results
+
+    def _result(self, row: int, score: float, cosine: float, include_vector: bool) -> dict[str, Any]:
+        # Same shape as retrieval._to_results: reference ids, resolved later
+        chunk = self._chunks[row]
+        props = chunk["properties"]
+        result = {
+            "text": props["text"],
+            "heading": props.get("heading"),
+            "startChar": props.get("startChar"),
+            "endChar": props.get("endChar"),
+            "sessionNo": props.get("sessionNo"),
+            "sessionDate": props.get("sessionDate"),
+            "doc_title": props.get("doc_title"),
+            "path": None,
+            "chunk_id": chunk["id"],
+            "score": score,
+            "distance": 1.0 - cosine,
+            "doc_id": chunk["doc"],
+            "refs": {ref: list(chunk[ref]) for ref in ENTITY_REFS.values()},
+        }
+        if include_vector:
+            result["vector"] = self._vectors[row].tolist()
+        return result
+
+    def objects(self, uuids: list[str]) -> dict[str, dict]:
+        # Documents and entities by id, for reference resolution
+        with self._lock:
+            out = {}
+            for uuid in uuids:
+                props = self._documents.get(uuid) or self._entities.get(uuid)
+                if props is not None:
+                    out[uuid] = props
+            return out
+
+    def info(self) -> dict:
+        with self._lock:
+            searches = self.stats["searches"]
+            return {
+                "directory": self.directory,
+                "chunks": sum(self._alive),
+                "dead_rows": len(self._alive) - sum(self._alive),
+                "documents": len(self._documents),
+                "entities": len(self._entities),
+                "searches": searches,
+                "avg_search_ms": round(self.stats["search_seconds"] * 1000 / searches, 2) if searches else 0.0,
+            }
+
+
+_index: Optional[LocalIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_local_index() -> LocalIndex:
+    # Loading maps the vector file and reads the chunk metadata, so do it once
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = LocalIndex(settings.local_index_dir or os.path.join(settings.cache_dir, "local_index"))
+    return _index
\ No newline at end of file
@@ -1,45 +1,121 @@
-from fastapi import FastAPI
-from app.models import AskRequest, AskResponse, Source
-from app.ingest import scan_once
-from app.retrieval import hybrid_search, maybe_rerank, assemble_context
+import json
+import time
+import math
+import asyncio
+from contextlib import asynccontextmanager, nullcontext
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse, JSONResponse
+from app.models import AskRequest, AskResponse, AskBatchRequest, Source
+from app.ingest import index_version, latest_session_no
+from app.retrieval import routed_search_async, maybe_rerank_async, assemble_context, resolve_context_async
 from app.config import settings
-from app.generator import generate_answer
-from weaviate.classes.query import Filter
+from app.generator import (generate_answer_async, generate_answer_stream_async, close_generator_provider,
+                           generation_scheduler, GenerationRejected)
+from app.context_packer import pack_context, prompt_token_count
+from app.embeddings import embed_query_async, embed_queries
+from app.answer_cache import AnswerCache
+from app.weaviate_client import close_async_client
+from app.filters import SearchFilters
+from app.local_index import get_local_index
+from app.entity_router import entity_router, group_by_ref
+from app.object_cache import object_cache
+from app.watcher import start_watcher, stop_watcher
+from app.jobs import ingest_jobs
+from app.conversations import Conversation, conversations
+from app.concurrency import cpu_executor, run_cpu
+from app import metrics
 
-app = FastAPI(title="Weaviate RPG RAG API")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if settings.retrieval_backend == "local":
+        # Map the index and build BM25 in the background; the first query waits only if it is early
+        asyncio.get_running_loop().run_in_executor(cpu_executor, lambda: get_local_index().warm())
+        metrics.register("local_index", lambda: get_local_index().info())
+    if settings.watch_notes:
+        metrics.register("watcher", start_watcher().info)
+    yield
+    stop_watcher()
+    # Cancelled scans finish the files already queued, then stop
+    await asyncio.to_thread(ingest_jobs.shutdown)
+    await close_generator_provider()
+    await close_async_client()
+
+
+app = FastAPI(title="Weaviate RPG RAG API", lifespan=lifespan)
+
+
+@app.exception_handler(GenerationRejected)
+async def generation_rejected(request, exc: GenerationRejected):
+    return JSONResponse({"detail": str(exc)}, status_code=429,
+                        headers={"Retry-After": str(max(1, math.ceil(exc.retry_after)))})
+
+answer_cache = AnswerCache(settings.answer_cache_threshold,
+                           settings.answer_cache_size,
+                           settings.answer_cache_ttl_seconds)
+metrics.register("answer_cache", answer_cache.stats)
+metrics.register("object_cache", object_cache.stats)
 
 @app.get("/health")
 def health():
     return {"ok": True}
 
 
-@app.post("/ingest/scan")
-def ingest_scan():
-    stats = scan_once()
-    return {"status": "ok", **stats}
+@app.get("/metrics")
+def get_metrics():
+    return metrics.snapshot()
 
 
-@app.post("/ask", response_model=AskResponse)
-def ask(req: AskRequest):
-    filters = None
-    if req.from_session or req.to_session:
-        if req.from_session and req.to_session:
-            filters = Filter.all_of([
-                Filter.by_property("sessionNo").greater_or_equal(req.from_session),
-                Filter.by_property("sessionNo").less_or_equal(req.to_session)
-            ])
-        elif req.from_session:
-            filters = Filter.by_property("sessionNo").greater_or_equal(req.from_session)
-        elif req.to_session:
-            filters = Filter.by_property("sessionNo").less_or_equal(req.to_session)
-
-    candidates = hybrid_search(req.query, k=req.k, filters=filters)
-    top_items = maybe_rerank(req.query, candidates, settings.max_context_chunks)
-    context = assemble_context(top_items, settings.max_context_chunks)
-
-    answer = generate_answer(req.query, context, max_tokens=400)
-
-    sources = [Source(
+@app.post("/ingest/scan", status_code=202)
+async def ingest_scan(wait: bool = False):
+    """Queue a scan and return its job. `?wait=true` blocks and returns the scan stats as before."""
+    job = ingest_jobs.submit()
+    if not wait:
+        return job.to_dict()
+    await asyncio.wait([asyncio.wrap_future(job.future)])
+    if job.status == "failed":
+        raise HTTPException(status_code=500, detail=job.error)
+    return JSONResponse({"status": "ok", **(job.result or {})}, status_code=200)
+
+
+@app.get("/ingest/jobs")
+def list_ingest_jobs():
+    return {"jobs": [job.to_dict() for job in ingest_jobs.list()]}
+
+
+@app.get("/ingest/jobs/{job_id}")
+def get_ingest_job(job_id: str):
+    job = ingest_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job")
+    return job.to_dict()
+
+
+@app.post("/ingest/jobs/{job_id}/cancel")
+def cancel_ingest_job(job_id: str):
+    job = ingest_jobs.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job")
+    return job.to_dict()
+
+
+def build_filters(req: AskRequest) -> SearchFilters:
+    filters = SearchFilters.from_request(req)
+    if req.recent_only:
+        latest = latest_session_no()
+        if latest is not None:
+            start = latest - settings.recent_sessions + 1
+            filters.from_session = max(filters.from_session or start, start)
+    if req.entities:
+        found, unknown = entity_router.resolve(req.entities)
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown entities: {', '.join(unknown)}")
+        filters.entities = group_by_ref(found)
+    return filters
+
+
+def build_sources(context: list[dict]) -> list[Source]:
+    return [Source(
         doc_title=c.get("doc_title") or "Unknown Document", 
         session_no=c.get("sessionNo"),
         heading=c.get("heading"), 
@@ -47,4 +123,244 @@ def ask(req: AskRequest):
         chunk_id=c.get("chunk_id") or ""
     ) for c in context]
 
-    return AskResponse(answer=answer, sources=sources, context=context)
+
+def cache_scope(req: AskRequest) -> tuple:
+    # Only reuse answers given under identical request options
+    return tuple(sorted(req.model_dump(exclude={"query"}).items()))
+
+
+async def retrieve_context(req: AskRequest, query_vector: list[float],
+                           conv: Conversation | None = None) -> list[dict]:
+    # Lists the sessions dir and may rebuild the entity matcher: keep it off the event loop
+    query, filters = req.query, await run_cpu(build_filters, req)
+    if conv is not None:
+        query, query_vector = conv.search_query(query), conv.search_vector(query_vector)
+    candidates = await routed_search_async(query, k=req.k, filters=filters, query_vector=query_vector)
+    if conv is not None:
+        # Chunks from earlier turns are already in the history: only new ones are reranked and sent
+        seen = conv.seen_chunk_ids()
+        candidates = [c for c in candidates if c["chunk_id"] not in seen]
+    # Reranking is batched with other requests on the reranker thread
+    top_items = await maybe_rerank_async(query, candidates, settings.max_context_chunks,
+                                         query_vector=query_vector, budget_ms=req.rerank_budget_ms)
+    if settings.context_token_budget > 0:
+        context = await run_cpu(pack_context, query, top_items,
+                                settings.context_token_budget, settings.max_context_chunks)
+    else:
+        context = assemble_context(top_items, settings.max_context_chunks)
+    return await resolve_context_async(context)
+
+
+def get_conversation(req: AskRequest) -> Conversation | None:
+    if req.conversation_id is None:
+        return None
+    conv = conversations.get(req.conversation_id)
+    if conv is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired conversation")
+    return conv
+
+
+@app.post("/conversations")
+def create_conversation():
+    return {"conversation_id": conversations.create().id}
+
+
+@app.get("/conversations/{conversation_id}")
+def get_conversation_turns(conversation_id: str):
+    conv = conversations.get(conversation_id)
+    if conv is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired conversation")
+    return conv.to_dict()
+
+
+@app.delete("/conversations/{conversation_id}", status_code=204)
+def delete_conversation(conversation_id: str):
+    conversations.delete(conversation_id)
+
+
+async def count_prompt_tokens(query: str, context: list[dict], history: list[dict] | None = None) -> int:
+    tokens = await run_cpu(prompt_token_count, query, context, history)
+    metrics.inc("ask.prompt_tokens", tokens)
+    metrics.inc("ask.prompts")
+    return tokens
+
+
+@app.post("/ask", response_model=AskResponse)
+async def ask(req: AskRequest):
+    get_conversation(req)  # 404 before doing any work
+    return await answer_request(req, await embed_query_async(req.query))
+
+
+async def answer_request(req: AskRequest, query_vector: list[float],
+                         retrieve_slots: asyncio.Semaphore | None = None,
+                         generate_slots: asyncio.Semaphore | None = None,
+                         priority: str = "interactive") -> AskResponse:
+    # The slots bound how many requests of a batch retrieve/generate at once
+    conv = get_conversation(req)
+    if conv is not None:
+        return await ask_in_conversation(req, conv, query_vector, retrieve_slots, generate_slots, priority)
+    scope = cache_scope(req)
+    version = index_version()
+    if settings.answer_cache_enabled:
+        hit = answer_cache.lookup(query_vector, scope, version)
+        if hit is not None:
+            return hit.model_copy(update={"cached": True})
+
+    # Turn the request away now rather than after retrieval if the generator is backed up
+    generation_scheduler.admit(priority)
+    t0 = time.perf_counter()
+    async with retrieve_slots or nullcontext():
+        context = await retrieve_context(req, query_vector)
+        prompt_tokens = await count_prompt_tokens(req.query, context)
+    t1 = time.perf_counter()
+    async with generate_slots or nullcontext():
+        answer = await generate_answer_async(req.query, context, max_tokens=400, priority=priority)
+    metrics.observe("ask.retrieve", t1 - t0)
+    metrics.observe("ask.generate", time.perf_counter() - t1)
+
+    response = AskResponse(answer=answer, sources=build_sources(context), context=context,
+                           prompt_tokens=prompt_tokens)
+    if settings.answer_cache_enabled:
+        answer_cache.store(query_vector, scope, version, response)
+    return response
+
+
+async def ask_in_conversation(req: AskRequest, conv: Conversation, query_vector: list[float],
+                              retrieve_slots: asyncio.Semaphore | None = None,
+                              generate_slots: asyncio.Semaphore | None = None,
+                              priority: str = "interactive") -> AskResponse:
+    # Conversation turns skip the answer cache: the answer depends on the history
+    generation_scheduler.admit(priority)
+    async with conv.lock:
+        t0 = time.perf_counter()
+        async with retrieve_slots or nullcontext():
+            context = await retrieve_context(req, query_vector, conv)
+            history = conv.history()
+            prompt_tokens = await count_prompt_tokens(req.query, context, history)
+        t1 = time.perf_counter()
+        async with generate_slots or nullcontext():
+            answer = await generate_answer_async(req.query, context, max_tokens=400, history=history,
+                                                 priority=priority)
+        metrics.observe("ask.retrieve", t1 - t0)
+        metrics.observe("ask.generate", time.perf_counter() - t1)
+        await run_cpu(conv.add_turn, req.query, query_vector, context, answer)
+        conversations.touch(conv)
+    return AskResponse(answer=answer, sources=build_sources(context), context=context,
+                       prompt_tokens=prompt_tokens, conversation_id=conv.id)
+
+
+@app.post("/ask/batch")
+async def ask_batch(batch: AskBatchRequest):
+    """Answer many requests; streams NDJSON lines `{"index", "response"}` or `{"index", "error"}` as each finishes.
+
+    All queries are embedded in one call. Retrieval runs BATCH_RETRIEVE_CONCURRENCY
+    requests at a time, so their searches overlap and their rerank pairs
+    merge into shared cross-encoder batches; generation runs
+    BATCH_GENERATE_CONCURRENCY at a time. One failing request does not
+    affect the others.
+    """
+    requests = batch.requests
+    vectors = await run_cpu(embed_queries, [req.query for req in requests])
+    retrieve_slots = asyncio.Semaphore(settings.batch_retrieve_concurrency)
+    generate_slots = asyncio.Semaphore(settings.batch_generate_concurrency)
+    metrics.inc("ask_batch.requests", len(requests))
+
+    async def one(index: int) -> dict:
+        try:
+            response = await answer_request(requests[index], vectors[index], retrieve_slots, generate_slots,
+                                            priority="batch")
+            return {"index": index, "response": response.model_dump(mode="json")}
+        except GenerationRejected as e:
+            return {"index": index, "error": str(e), "status_code": 429}
+        except HTTPException as e:
+            return {"index": index, "error": e.detail, "status_code": e.status_code}
+        except Exception as e:
+            metrics.inc("ask_batch.errors")
+            return {"index": index, "error": f"{type(e).__name__}: {e}", "status_code": 500}
+
+    async def lines():
+        tasks = [asyncio.create_task(one(i)) for i in range(len(requests))]
+        try:
+            for done in asyncio.as_completed(tasks):
+                yield json.dumps(await done) + "\n"
+        finally:
+            # Client went away: stop the remaining work
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+# Stop proxies (nginx) from buffering the event stream
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+
+def sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.post("/ask/stream")
+async def ask_stream(req: AskRequest):
+    """Server-Sent Events: `sources` first, then `token` events, then `done`."""
+    conv = get_conversation(req)
+    query_vector = await embed_query_async(req.query)
+    if conv is not None:
+        await run_cpu(build_filters, req)  # reject bad filters before the stream starts
+        generation_scheduler.admit()
+        return StreamingResponse(conversation_events(req, conv, query_vector),
+                                 media_type="text/event-stream", headers=SSE_HEADERS)
+    scope = cache_scope(req)
+    version = index_version()
+    hit = answer_cache.lookup(query_vector, scope, version) if settings.answer_cache_enabled else None
+
+    if hit is not None:
+        async def cached_events():
+            yield sse("sources", {"sources": [s.model_dump() for s in hit.sources]})
+            yield sse("token", {"text": hit.answer})
+            yield sse("done", {"answer": hit.answer, "cached": True})
+        return StreamingResponse(cached_events(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+    generation_scheduler.admit()
+    context = await retrieve_context(req, query_vector)
+    prompt_tokens = await count_prompt_tokens(req.query, context)
+    sources = build_sources(context)
+
+    async def events():
+        yield sse("sources", {"sources": [s.model_dump() for s in sources]})
+        parts = []
+        try:
+            async for token in generate_answer_stream_async(req.query, context, max_tokens=400):
+                parts.append(token)
+                yield sse("token", {"text": token})
+        except Exception as e:
+            yield sse("error", {"detail": str(e)})
+            return
+        answer = "".join(parts).strip()
+        yield sse("done", {"answer": answer, "cached": False, "prompt_tokens": prompt_tokens})
+        if settings.answer_cache_enabled:
+            answer_cache.store(query_vector, scope, version,
+                               AskResponse(answer=answer, sources=sources, context=context,
+                                           prompt_tokens=prompt_tokens))
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+
+async def conversation_events(req: AskRequest, conv: Conversation, query_vector: list[float]):
+    async with conv.lock:
+        context = await retrieve_context(req, query_vector, conv)
+        history = conv.history()
+        prompt_tokens = await count_prompt_tokens(req.query, context, history)
+        yield sse("sources", {"sources": [s.model_dump() for s in build_sources(context)]})
+        parts = []
+        try:
+            async for token in generate_answer_stream_async(req.query, context, max_tokens=400, history=history):
+                parts.append(token)
+                yield sse("token", {"text": token})
+        except Exception as e:
+            yield sse("error", {"detail": str(e)})
+            return
+        answer = "".join(parts).strip()
+        await run_cpu(conv.add_turn, req.query, query_vector, context, answer)
+        conversations.touch(conv)
+        yield sse("done", {"answer": answer, "cached": False, "prompt_tokens": prompt_tokens,
+                           "conversation_id": conv.id})
@@ -0,0 +1,54 @@
+import os, json
+from app.config import settings
+
+
+MANIFEST_PATH = os.path.join(settings.cache_dir, "ingest_manifest.json")
+
+
+def manifest_path(backend: str = "weaviate") -> str:
+    # Each retrieval backend is its own index, so each gets its own manifest
+    if backend == "weaviate":
+        return MANIFEST_PATH
+    return os.path.join(settings.cache_dir, f"ingest_manifest.{backend}.json")
+
+
+def load_manifest(embedder: str | None = None, backend: str = "weaviate") -> dict[str, dict]:
+    # path -> {"sha", "mtime", "size", "doc_uuid", "chunks"}
+    path = manifest_path(backend)
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        # A corrupt manifest only costs us a full rescan
+        return {}
+    files = data.get("files", {})
+    stored = data.get("embedder")
+    if embedder is not None and stored is not None and stored != embedder:
+        # Index was embedded by another model/backend: keep the entries (so
+        # removed files are still deleted) but force every file to re-embed
+        for entry in files.values():
+            entry.pop("sha", None)
+            entry.pop("mtime", None)
+    return files
+
+
+def save_manifest(files: dict[str, dict], embedder: str | None = None, backend: str = "weaviate"):
+    path = manifest_path(backend)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"version": 1, "embedder": embedder, "files": files}, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def reset_manifest(backend: str = "weaviate"):
+    path = manifest_path(backend)
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def is_unchanged(entry: dict | None, stat: os.stat_result) -> bool:
+    # Cheap check before hashing: same mtime and size as last scan
+    return bool(entry) and entry.get("mtime") == stat.st_mtime and entry.get("size") == stat.st_size
\ No newline at end of file
@@ -0,0 +1,43 @@
+import threading
+from collections import defaultdict
+from typing import Callable
+
+
+# Process-local metrics, served as JSON by GET /metrics.
+# Counters and timings are recorded inline; components that already keep
+# their own stats (caches, batchers) register a collector instead.
+
+_lock = threading.Lock()
+_counters: dict[str, float] = defaultdict(float)
+_timings: dict[str, dict[str, float]] = {}
+_collectors: dict[str, Callable[[], dict]] = {}
+
+
+def inc(name: str, value: float = 1):
+    with _lock:
+        _counters[name] += value
+
+
+def observe(name: str, seconds: float):
+    with _lock:
+        t = _timings.setdefault(name, {"count": 0, "total_ms": 0.0, "max_ms": 0.0})
+        ms = seconds * 1000
+        t["count"] += 1
+        t["total_ms"] += ms
+        t["max_ms"] = max(t["max_ms"], ms)
+
+
+def register(name: str, collector: Callable[[], dict]):
+    _collectors[name] = collector
+
+
+def snapshot() -> dict:
+    with _lock:
+        counters = dict(_counters)
+        timings = {name: {**t, "avg_ms": round(t["total_ms"] / t["count"], 2) if t["count"] else 0.0}
+                   for name, t in _timings.items()}
+    return {
+        "counters": counters,
+        "timings": timings,
+        **{name: collector() for name, collector in _collectors.items()},
+    }
\ No newline at end of file
@@ -1,13 +1,24 @@
-from pydantic import BaseModel
-from typing import List, Optional, Dict, Any
+import datetime
+from pydantic import BaseModel, Field
+from typing import List, Optional, Dict, Any, Literal
 
 
 class AskRequest(BaseModel):
     query: str
     k: int = 30
-    recent_only: bool = False
+    recent_only: bool = False  # only the last RECENT_SESSIONS sessions
     from_session: Optional[int] = None
     to_session: Optional[int] = None
+    from_date: Optional[datetime.date] = None  # on sessionDate, inclusive
+    to_date: Optional[datetime.date] = None
+    doc_types: Optional[List[Literal["session", "character", "location", "organization"]]] = None
+    entities: Optional[List[str]] = None  # character/location/organization names; chunks must link one
+    rerank_budget_ms: Optional[float] = None  # cap on cross-encoder time (cascade mode)
+    conversation_id: Optional[str] = None  # from POST /conversations; makes this a follow-up turn
+
+
+class AskBatchRequest(BaseModel):
+    requests: List[AskRequest] = Field(min_length=1, max_length=1000)
 
 
 class Source(BaseModel):
@@ -21,4 +32,7 @@ class Source(BaseModel):
 class AskResponse(BaseModel):
     answer: str
     sources: List[Source]
-    context: List[Dict[str, Any]]
\ No newline at end of file
+    context: List[Dict[str, Any]]
+    prompt_tokens: Optional[int] = None  # estimated with the embedding tokenizer
+    cached: bool = False
+    conversation_id: Optional[str] = None
\ No newline at end of file
@@ -0,0 +1,47 @@
+import threading
+from typing import Iterable
+
+
+class ObjectCache:
+    """Process-local uuid -> properties for Documents and entities.
+
+    Ingest writes every Document and entity it upserts here (and drops
+    deleted Documents), so the request path can turn the reference ids that
+    searches return into titles, names and paths without asking Weaviate to
+    expand references. Misses are filled by the caller.
+    """
+
+    def __init__(self):
+        self._data: dict[str, dict] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def put(self, uuid: str, properties: dict):
+        with self._lock:
+            self._data[str(uuid)] = properties
+
+    def discard(self, uuid: str):
+        with self._lock:
+            self._data.pop(str(uuid), None)
+
+    def get_many(self, uuids: Iterable[str]) -> tuple[dict[str, dict], list[str]]:
+        found, missing = {}, []
+        with self._lock:
+            for uuid in dict.fromkeys(uuids):
+                props = self._data.get(uuid)
+                if props is None:
+                    missing.append(uuid)
+                else:
+                    found[uuid] = props
+            self.hits += len(found)
+            self.misses += len(missing)
+        return found, missing
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {"size": len(self._data), "hits": self.hits, "misses": self.misses,
+                "hit_ratio": round(self.hits / total, 3) if total else 0.0}
+
+
+object_cache = ObjectCache()
\ No newline at end of file
@@ -0,0 +1,123 @@
+import time, queue, threading
+from typing import Any, Callable, Iterable, Optional
+
+
+_STOP = object()
+
+
+class Stage:
+    """One step of a producer/consumer pipeline.
+
+    Items are pulled from a bounded queue by `workers` threads and passed to
+    `fn`, which returns the items to hand to `downstream`. A full queue blocks
+    `put`, so a slow stage throttles the ones feeding it. With `batch > 1` a
+    worker drains up to that many queued items and passes them to `fn` as a list.
+    """
+
+    def __init__(self,
+                 name: str,
+                 fn: Callable[[Any], Optional[Iterable[Any]]],
+                 workers: int = 1,
+                 maxsize: int = 0,
+                 batch: int = 1,
+                 downstream: Optional["Stage"] = None):
+        self.name = name
+        self.fn = fn
+        self.batch = batch
+        self.downstream = downstream
+        self.queue: queue.Queue = queue.Queue(maxsize)
+        self.error: Optional[BaseException] = None
+        self._lock = threading.Lock()
+        self._items = 0
+        self._busy = 0.0
+        self._blocked = 0.0
+        self._max_depth = 0
+        self._depth_sum = 0
+        self._puts = 0
+        self._started = time.perf_counter()
+        self._threads = [threading.Thread(target=self._run, name=f"{name}-{i}", daemon=True)
+                         for i in range(workers)]
+        for t in self._threads:
+            t.start()
+
+    def put(self, item: Any):
+        self.queue.put(item)
+        depth = self.queue.qsize()
+        with self._lock:
+            self._puts += 1
+            self._depth_sum += depth
+            self._max_depth = max(self._max_depth, depth)
+
+    def _take(self) -> list:
+        items = [self.queue.get()]
+        while len(items) < self.batch and items[-1] is not _STOP:
+            try:
+                items.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return items
+
+    def _run(self):
+        while True:
+            items = self._take()
+            stop = items[-1] is _STOP
+            if stop:
+                items.pop()
+            if items and self.error is None:
+                t0 = time.perf_counter()
+                t1 = None
+                try:
+                    out = list(self.fn(items if self.batch > 1 else items[0]) or ())
+                    t1 = time.perf_counter()
+                    for result in out:
+                        self.downstream.put(result)
+                except BaseException as e:
+                    # Keep draining so upstream never blocks on a dead stage
+                    self.error = self.error or e
+                t2 = time.perf_counter()
+                with self._lock:
+                    self._busy += (t1 or t2) - t0
+                    self._blocked += t2 - (t1 or t2)
+                    self._items += len(items)
+            if stop:
+                return
+
+    def close(self):
+        for _ in self._threads:
+            self.queue.put(_STOP)
+        for t in self._threads:
+            t.join()
+
+    def stats(self) -> dict:
+        wall = time.perf_counter() - self._started
+        with self._lock:
+            return {
+                "workers": len(self._threads),
+                "items": self._items,
+                "busy_seconds": round(self._busy, 3),
+                "blocked_seconds": round(self._blocked, 3),  # waiting on a full downstream queue
+                "utilization": round(self._busy / (wall * len(self._threads)), 3) if wall else 0.0,
+                "queue_depth": self.queue.qsize(),
+                "max_queue_depth": self._max_depth,
+                "avg_queue_depth": round(self._depth_sum / self._puts, 1) if self._puts else 0.0,
+            }
+
+
+class Pipeline:
+    """Stages chained head to tail; closing drains them in order."""
+
+    def __init__(self, stages: list[Stage]):
+        self.stages = stages
+
+    def put(self, item: Any):
+        self.stages[0].put(item)
+
+    def close(self):
+        for stage in self.stages:
+            stage.close()
+        for stage in self.stages:
+            if stage.error is not None:
+                raise stage.error
+
+    def stats(self) -> dict:
+        return {stage.name: stage.stats() for stage in self.stages}
\ No newline at end of file
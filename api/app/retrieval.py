@@ -1,49 +1,144 @@
+import dataclasses
 from typing import List, Dict, Any
-from app.weaviate_client import get_client
-from app.embeddings import embed_texts, get_reranker
+import numpy as np
+from app.weaviate_client import get_client, get_async_client
+from app.embeddings import (embed_query, embed_query_async, get_reranker, rerank_scores_async,
+                            cached_rerank_scores, rerank_ms_per_pair, get_embedding_cache)
+from app.concurrency import run_cpu
 from app.config import settings
-from weaviate.classes.query import Filter, QueryReference
+from app.filters import SearchFilters
+from app.local_index import get_local_index
+from app.entity_router import EntityMatch, match_entities, group_by_ref
+from app.object_cache import object_cache
+from app import metrics
+from weaviate.classes.query import QueryReference
 
 
-def hybrid_search(query: str, k: int = 30, filters: Filter | None = None) -> List[Dict[str, Any]]:
+# First-pass weights for cascade reranking
+CASCADE_WEIGHTS = {"hybrid": 0.5, "cosine": 0.4, "entity": 0.1}
+
+
+def _cascade_enabled() -> bool:
+    return settings.enable_reranker and settings.rerank_mode == "cascade"
+
+
+def _vectors_needed() -> bool:
+    # The cascade's cosine feature uses chunk vectors. The context packer's
+    # near-duplicate check reads them from the embedding cache, so search
+    # only returns them for it when that cache is off.
+    if _cascade_enabled():
+        return True
+    return (settings.context_token_budget > 0 and settings.context_dedupe_similarity > 0
+            and get_embedding_cache() is None)
+
+
+# Weight of the vector score against BM25 in hybrid fusion (both backends)
+HYBRID_ALPHA = 0.5
+
+# Searches return these Chunk properties plus reference ids; titles, names and
+# paths are looked up later, only for the chunks that end up in the context
+CHUNK_PROPERTIES = ["text", "heading", "startChar", "endChar", "sessionNo", "sessionDate", "doc_title"]
+REF_COLLECTIONS = {"ofDoc": "Document", "characters": "Character",
+                   "locations": "Location", "organizations": "Organization"}
+ENTITY_REFS = ("characters", "locations", "organizations")
+
+
+def _hybrid_args(query: str, query_vector: List[float], k: int, filters: SearchFilters | None) -> Dict[str, Any]:
+    return dict(
+        query=query,
+        vector=query_vector,
+        limit=k,
+        alpha=HYBRID_ALPHA,
+        filters=filters.to_weaviate() if filters else None,
+        include_vector=_vectors_needed(),
+        return_metadata=["score", "distance"],
+        return_properties=CHUNK_PROPERTIES,
+        # Ids only: no properties of the referenced objects
+        return_references=[QueryReference(link_on=ref, return_properties=[]) for ref in REF_COLLECTIONS]
+    )
+
+
+def _local_search(query: str, query_vector: List[float], k: int,
+                  filters: SearchFilters | None) -> List[Dict[str, Any]]:
+    return get_local_index().search(query, query_vector, k, alpha=HYBRID_ALPHA, filters=filters,
+                                    include_vector=_vectors_needed())
+
+
+def hybrid_search(query: str,
+                  k: int = 30,
+                  filters: SearchFilters | None = None,
+                  query_vector: List[float] | None = None,
+                  backend: str | None = None) -> List[Dict[str, Any]]:
+    if query_vector is None:
+        query_vector = embed_query(query)
+    if (backend or settings.retrieval_backend) == "local":
+        return _local_search(query, query_vector, k, filters)
     client = get_client()
     chunks = client.collections.get("Chunk")
-    query_vector = embed_texts([query])[0]
-    
-    if filters:
-        response = chunks.query.hybrid(
-            query=query,
-            vector=query_vector,
-            limit=k,
-            alpha=0.5,
-            return_metadata=["score", "distance"],
-            return_references=[
-                QueryReference(link_on="ofDoc"),
-                QueryReference(link_on="characters"),
-                QueryReference(link_on="locations"),
-                QueryReference(link_on="organizations")
-            ]
-        ).where(filters)
-    else:
-        response = chunks.query.hybrid(
-            query=query,
-            vector=query_vector,
-            limit=k,
-            alpha=0.5,
-            return_metadata=["score", "distance"],
-            return_references=[
-                QueryReference(link_on="ofDoc"),
-                QueryReference(link_on="characters"),
-                QueryReference(link_on="locations"),
-                QueryReference(link_on="organizations")
-            ]
-        )
-    
+    response = chunks.query.hybrid(**_hybrid_args(query, query_vector, k, filters))
+    return _to_results(response)
+
+
+async def hybrid_search_async(query: str,
+                              k: int = 30,
+                              filters: SearchFilters | None = None,
+                              query_vector: List[float] | None = None,
+                              backend: str | None = None) -> List[Dict[str, Any]]:
+    if query_vector is None:
+        query_vector = await embed_query_async(query)
+    if (backend or settings.retrieval_backend) == "local":
+        # Scoring is NumPy/BM25 work, so it goes to the CPU pool like embedding
+        return await run_cpu(_local_search, query, query_vector, k, filters)
+    client = await get_async_client()
+    chunks = client.collections.get("Chunk")
+    response = await chunks.query.hybrid(**_hybrid_args(query, query_vector, k, filters))
+    return _to_results(response)
+
+
+async def routed_search_async(query: str,
+                              k: int = 30,
+                              filters: SearchFilters | None = None,
+                              query_vector: List[float] | None = None) -> List[Dict[str, Any]]:
+    """hybrid_search_async, narrowed or reordered by the entities the query names."""
+    matched = match_entities(query) if settings.entity_routing != "off" else []
+    if not matched:
+        return await hybrid_search_async(query, k, filters, query_vector)
+    metrics.inc("entity_routing.matched")
+    if settings.entity_routing == "filter" and not (filters and filters.entities):
+        scoped = dataclasses.replace(filters or SearchFilters(), entities=group_by_ref(matched))
+        items = await hybrid_search_async(query, k, scoped, query_vector)
+        if len(items) >= settings.entity_filter_min_results:
+            return items
+        # Few chunks link the entity (named without a [[link]]): search without it
+        metrics.inc("entity_routing.fallback")
+    return boost_entities(await hybrid_search_async(query, k, filters, query_vector), matched)
+
+
+def boost_entities(items: List[Dict[str, Any]], matched: List[EntityMatch]) -> List[Dict[str, Any]]:
+    # Chunks linking a named entity move up
+    matched_ids = {m.id for m in matched}
+    for it in items:
+        if any(matched_ids.intersection(ids) for ids in it["refs"].values()):
+            it["score"] = (it.get("score") or 0.0) + settings.entity_boost
+    return sorted(items, key=lambda it: it.get("score") or 0.0, reverse=True)
+
+
+def _ref_ids(ref) -> List[str]:
+    if not ref:
+        return []
+    return [str(o.uuid) for o in ref.objects]
+
+
+def _to_results(response) -> List[Dict[str, Any]]:
     results = []
     for obj in response.objects:
+        refs = obj.references or {}
+        doc_ids = _ref_ids(refs.get("ofDoc"))
         result = {
             "text": obj.properties["text"],
             "heading": obj.properties["heading"],
+            "startChar": obj.properties.get("startChar"),
+            "endChar": obj.properties.get("endChar"),
             "sessionNo": obj.properties["sessionNo"],
             "sessionDate": obj.properties["sessionDate"],
             "doc_title": obj.properties.get("doc_title"),
@@ -51,80 +146,122 @@ def hybrid_search(query: str, k: int = 30, filters: Filter | None = None) -> Lis
             "chunk_id": str(obj.uuid),
             "score": obj.metadata.score if obj.metadata else None,
             "distance": obj.metadata.distance if obj.metadata else None,
-            "characters": [],
-            "locations": [],
-            "organizations": []
+            "doc_id": doc_ids[0] if doc_ids else None,
+            "refs": {ref: _ref_ids(refs.get(ref)) for ref in ENTITY_REFS},
         }
-        
-        # Handle references - they are returned as objects with properties
-        if hasattr(obj, 'references') and obj.references:
-            # Document reference
-            if "ofDoc" in obj.references and obj.references["ofDoc"]:
-                doc_obj = obj.references["ofDoc"]
-                if hasattr(doc_obj, 'properties'):
-                    result["doc_title"] = doc_obj.properties.get("title")
-                    result["path"] = doc_obj.properties.get("path")
-            
-            # Character references
-            if "characters" in obj.references:
-                chars = obj.references["characters"]
-                if chars:
-                    # Handle both single objects and lists
-                    char_list = chars if isinstance(chars, list) else [chars]
-                    for char in char_list:
-                        if hasattr(char, 'properties'):
-                            result["characters"].append({
-                                "name": char.properties.get("name"),
-                                "path": char.properties.get("path")
-                            })
-            
-            # Location references
-            if "locations" in obj.references:
-                locs = obj.references["locations"]
-                if locs:
-                    # Handle both single objects and lists
-                    loc_list = locs if isinstance(locs, list) else [locs]
-                    for loc in loc_list:
-                        if hasattr(loc, 'properties'):
-                            result["locations"].append({
-                                "name": loc.properties.get("name"),
-                                "path": loc.properties.get("path")
-                            })
-            
-            # Organization references
-            if "organizations" in obj.references:
-                orgs = obj.references["organizations"]
-                if orgs:
-                    # Handle both single objects and lists
-                    org_list = orgs if isinstance(orgs, list) else [orgs]
-                    for org in org_list:
-                        if hasattr(org, 'properties'):
-                            result["organizations"].append({
-                                "name": org.properties.get("name"),
-                                "path": org.properties.get("path")
-                            })
-        
+        if obj.vector:
+            result["vector"] = obj.vector.get("default")
         results.append(result)
-    
     return results
 
 
-def maybe_rerank(query: str, items: List[Dict[str, Any]], top_n: int) -> List[Dict[str, Any]]:
-    reranker = get_reranker()
+async def _fetch_objects_async(collection: str, ids: List[str]) -> Dict[str, dict]:
+    if settings.retrieval_backend == "local":
+        return await run_cpu(lambda: get_local_index().objects(ids))
+    client = await get_async_client()
+    response = await client.collections.get(collection).query.fetch_objects_by_ids(ids, limit=len(ids))
+    return {str(o.uuid): o.properties for o in response.objects}
+
+
+async def resolve_context_async(context: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Replace reference ids with document titles/paths and entity names."""
+    wanted = {}
+    for c in context:
+        if c.get("doc_id"):
+            wanted[c["doc_id"]] = "Document"
+        for ref, ids in c.get("refs", {}).items():
+            wanted.update((u, REF_COLLECTIONS[ref]) for u in ids)
+    found, missing = object_cache.get_many(wanted)
+    by_collection: Dict[str, List[str]] = {}
+    for u in missing:
+        by_collection.setdefault(wanted[u], []).append(u)
+    for collection, ids in by_collection.items():
+        for u, props in (await _fetch_objects_async(collection, ids)).items():
+            object_cache.put(u, props)
+            found[u] = props
+
+    for c in context:
+        doc = found.get(c.pop("doc_id", None))
+        if doc:
+            c["doc_title"] = doc.get("title") or c["doc_title"]
+            c["path"] = doc.get("path")
+        refs = c.pop("refs", {})
+        for ref in ENTITY_REFS:
+            c[ref] = [{"name": found[u].get("name"), "path": found[u].get("path")}
+                      for u in refs.get(ref, []) if u in found]
+    return context
+
+
+async def maybe_rerank_async(query: str,
+                             items: List[Dict[str, Any]],
+                             top_n: int,
+                             query_vector: List[float] | None = None,
+                             budget_ms: float | None = None) -> List[Dict[str, Any]]:
+    # Loading the model on first use is slow, so do that off the event loop
+    reranker = await run_cpu(get_reranker)
     if not reranker or not items:
         return items[:top_n]
-    pairs = [(query, it.get("text", "")) for it in items]
-    scores = reranker.predict(pairs)
+    if _cascade_enabled() and query_vector is not None:
+        return await cascade_rerank_async(query, query_vector, items, top_n, budget_ms)
+    scores = await rerank_scores_async(query, [(it["chunk_id"], it.get("text", "")) for it in items])
     ranked = sorted(zip(items, scores), key=lambda x: x[1], reverse=True)
     return [it for it, _ in ranked[:top_n]]
 
 
+def first_pass_scores(query: str, query_vector: List[float], items: List[Dict[str, Any]]) -> List[float]:
+    # Cheap relevance estimate: normalized hybrid score, cosine to the query
+    # vector, and whether the query names an entity the chunk links to
+    hybrid = [it.get("score") or 0.0 for it in items]
+    top = max(hybrid) or 1.0
+    q = np.asarray(query_vector, dtype=np.float32)
+    named = {m.id for m in match_entities(query)}
+    scores = []
+    for it, h in zip(items, hybrid):
+        vec = it.get("vector")
+        cosine = float(np.dot(q, np.asarray(vec, dtype=np.float32))) if vec else 0.0
+        entity = 1.0 if any(named.intersection(ids) for ids in it["refs"].values()) else 0.0
+        scores.append(CASCADE_WEIGHTS["hybrid"] * h / top
+                      + CASCADE_WEIGHTS["cosine"] * cosine
+                      + CASCADE_WEIGHTS["entity"] * entity)
+    return scores
+
+
+async def cascade_rerank_async(query: str,
+                               query_vector: List[float],
+                               items: List[Dict[str, Any]],
+                               top_n: int,
+                               budget_ms: float | None = None) -> List[Dict[str, Any]]:
+    first = first_pass_scores(query, query_vector, items)
+    order = sorted(range(len(items)), key=lambda i: first[i], reverse=True)
+    shortlist = order[:max(settings.cascade_top_n, top_n)]
+    chunks = [(items[i]["chunk_id"], items[i].get("text", "")) for i in shortlist]
+    cached = cached_rerank_scores(query, chunks)
+
+    # Cached scores are free; the budget only caps pairs the model must score
+    budget_ms = settings.rerank_budget_ms if budget_ms is None else budget_ms
+    max_uncached = int(budget_ms // rerank_ms_per_pair()) if budget_ms else len(shortlist)
+    selected, uncached = [], 0
+    for pos, score in enumerate(cached):
+        if score is None:
+            if uncached >= max_uncached:
+                continue
+            uncached += 1
+        selected.append(pos)
+
+    scores = await rerank_scores_async(query, [chunks[p] for p in selected], [cached[p] for p in selected])
+    reranked = [shortlist[p] for p, _ in sorted(zip(selected, scores), key=lambda x: x[1], reverse=True)]
+    chosen = set(reranked)
+    # Whatever the cross-encoder did not see keeps its first-pass order below the reranked chunks
+    ranked = reranked + [i for i in order if i not in chosen]
+    return [items[i] for i in ranked[:top_n]]
+
+
 def assemble_context(items: List[Dict[str, Any]], max_chunks: int) -> List[Dict[str, Any]]:
     # Coalesce by document+heading to encourage diversity
     seen = set()
     out = []
     for item in items:
-        key = (item["doc_title"], item["heading"])
+        key = (item.get("doc_id") or item["doc_title"], item["heading"])
         if key in seen:
             continue
         seen.add(key)
@@ -136,6 +273,9 @@ def assemble_context(items: List[Dict[str, Any]], max_chunks: int) -> List[Dict[
             "sessionNo": item["sessionNo"],
             "sessionDate": item["sessionDate"],
             "chunk_id": item["chunk_id"],
+            # Resolved to titles and names by resolve_context_async
+            "doc_id": item.get("doc_id"),
+            "refs": item.get("refs", {}),
         })
         if len(out) >= max_chunks:
             break
@@ -1,5 +1,4 @@
 import os, re, hashlib
-from typing import List, Tuple
 
 
 WIKILINK_RE = re.compile(r"\[\[([^\]]+)\]\]")
@@ -35,28 +34,3 @@ def extract_wikilinks(text: str) -> list[str]:
         
         links.append(filename)
     return links
-
-
-def split_into_sections(md_text: str) -> List[Tuple[str, str]]:
-    # Returns list of (heading, section_text). Uses H2+ as chunk boundaries
-    matches = list(HEADING_RE.finditer(md_text))
-    if not matches:
-        return [(None, md_text)]
-    sections = []
-    for i, m in enumerate(matches):
-        start = m.end()
-        end = matches[i+1].start() if i+1 < len(matches) else len(md_text)
-        heading = m.group(2).strip()
-        body = md_text[start:end].strip()
-        sections.append((heading, body))
-    return sections
-
-
-def window_chunks(text: str, max_chars: int = 2000, overlap: int = 200):
-    if len(text) <= max_chars:
-        yield text
-        return
-    i = 0
-    while i < len(text):
-        yield text[i:i+max_chars]
-        i = max(0, i + max_chars - overlap)
\ No newline at end of file
@@ -0,0 +1,118 @@
+import os, time, threading
+from concurrent.futures import wait
+from typing import Optional
+from app.config import settings
+from app.jobs import IngestJob, ingest_jobs
+
+
+class NotesWatcher:
+    """Background thread that re-ingests notes as they change.
+
+    Every `interval` seconds it stats the .md files in the notes
+    directories (no reads) and compares mtime and size with the previous
+    poll. Polling rather than inotify keeps it working on bind mounts and
+    network shares. Changes collect until nothing has changed for `debounce`
+    seconds, since sync tools write in bursts; then only the touched paths
+    are scanned. A steady stream of edits still flushes after 10x `debounce`.
+    """
+
+    def __init__(self, directories: list[str], interval: float, debounce: float):
+        self.directories = directories
+        self.interval = interval
+        self.debounce = debounce
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._job: Optional[IngestJob] = None
+        self._snapshot: dict[str, tuple[float, int]] = {}
+        self._pending: set[str] = set()
+        self._first_change = 0.0
+        self._last_change = 0.0
+        self.stats = {"polls": 0, "scans": 0, "files_scanned": 0, "last_scan": None, "last_error": None}
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="notes-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._job is not None:
+            ingest_jobs.cancel(self._job.id)
+        if self._thread is not None:
+            self._thread.join()
+
+    def _poll(self) -> dict[str, tuple[float, int]]:
+        snapshot = {}
+        for directory in self.directories:
+            if not os.path.isdir(directory):
+                continue
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.is_file() and entry.name.lower().endswith(".md"):
+                        st = entry.stat()
+                        snapshot[entry.path] = (st.st_mtime, st.st_size)
+        return snapshot
+
+    def _run(self):
+        # Catch up on whatever changed while the API was down (incremental, so cheap)
+        self._scan(None)
+        self._snapshot = self._poll()
+        while not self._stop.wait(self.interval):
+            snapshot = self._poll()
+            self.stats["polls"] += 1
+            changed = {p for p, sig in snapshot.items() if self._snapshot.get(p) != sig}
+            changed |= set(self._snapshot) - set(snapshot)
+            self._snapshot = snapshot
+            now = time.monotonic()
+            if changed:
+                if not self._pending:
+                    self._first_change = now
+                self._pending |= changed
+                self._last_change = now
+            if self._pending and (now - self._last_change >= self.debounce
+                                  or now - self._first_change >= self.debounce * 10):
+                paths, self._pending = self._pending, set()
+                self._scan(paths)
+
+    def _scan(self, paths: Optional[set[str]]):
+        # Runs as a regular ingest job, so it queues behind (and shows up next to) API scans
+        if self._stop.is_set():
+            return
+        job = self._job = ingest_jobs.submit(paths)
+        wait([job.future])
+        self._job = None
+        if job.status != "succeeded":
+            # Reported in /metrics; the thread keeps watching
+            self.stats["last_error"] = job.error or job.status
+            # Retry these files after another debounce period
+            if paths:
+                self._pending |= paths
+                self._first_change = self._last_change = time.monotonic()
+            return
+        self.stats["scans"] += 1
+        self.stats["files_scanned"] += len(paths) if paths is not None else 0
+        self.stats["last_error"] = None
+        self.stats["last_scan"] = {key: job.result.get(key) for key in
+                                   ("added", "updated", "deleted", "indexed_chunks", "index_version")}
+
+    def info(self) -> dict:
+        return {**self.stats, "pending": len(self._pending), "watched_files": len(self._snapshot)}
+
+
+_watcher: Optional[NotesWatcher] = None
+
+
+def start_watcher() -> NotesWatcher:
+    global _watcher
+    if _watcher is None:
+        _watcher = NotesWatcher([settings.sessions_dir, settings.characters_dir,
+                                 settings.locations_dir, settings.organizations_dir],
+                                settings.watch_interval_seconds, settings.watch_debounce_seconds)
+        _watcher.start()
+    return _watcher
+
+
+def stop_watcher():
+    global _watcher
+    if _watcher is not None:
+        _watcher.stop()
+        _watcher = None
\ No newline at end of file
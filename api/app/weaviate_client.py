@@ -1,3 +1,4 @@
+import asyncio
 from app.config import settings
 import weaviate
 from weaviate.classes.config import Configure, Property, DataType, ReferenceProperty, VectorDistances
@@ -6,23 +7,51 @@ from weaviate.classes.config import Configure, Property, DataType, ReferenceProp
 _client = None
 
 
+def _host_port() -> tuple[str, int]:
+    return settings.weaviate_url.replace("http://", "").split(":")[0], int(settings.weaviate_url.split(":")[-1])
+
+
 def get_client() -> weaviate.WeaviateClient:
     global _client
     if _client is None:
-        _client = weaviate.connect_to_local(
-            host=settings.weaviate_url.replace("http://", "").split(":")[0],
-            port=int(settings.weaviate_url.split(":")[-1])
-        )
+        host, port = _host_port()
+        _client = weaviate.connect_to_local(host=host, port=port)
     return _client
 
 
+_async_client = None
+_async_lock = asyncio.Lock()
+
+
+async def get_async_client() -> weaviate.WeaviateAsyncClient:
+    # Used by the request path; connects lazily so the API starts before Weaviate is up
+    global _async_client
+    if _async_client is None:
+        async with _async_lock:
+            if _async_client is None:
+                host, port = _host_port()
+                client = weaviate.use_async_with_local(host=host, port=port)
+                await client.connect()
+                _async_client = client
+    return _async_client
+
+
+async def close_async_client():
+    global _async_client
+    if _async_client is not None:
+        await _async_client.close()
+        _async_client = None
+
+
 
 def ensure_schema():
     client = get_client()
     existing_collections = set(client.collections.list_all().keys())
+    created = set()
     
     # Create Character collection
     if "Character" not in existing_collections:
+        created.add("Character")
         client.collections.create(
             name="Character",
             properties=[
@@ -34,6 +63,7 @@ def ensure_schema():
     
     # Create Location collection
     if "Location" not in existing_collections:
+        created.add("Location")
         client.collections.create(
             name="Location",
             properties=[
@@ -45,6 +75,7 @@ def ensure_schema():
     
     # Create Organization collection
     if "Organization" not in existing_collections:
+        created.add("Organization")
         client.collections.create(
             name="Organization",
             properties=[
@@ -56,6 +87,7 @@ def ensure_schema():
     
     # Create Document collection
     if "Document" not in existing_collections:
+        created.add("Document")
         client.collections.create(
             name="Document",
             properties=[
@@ -69,6 +101,7 @@ def ensure_schema():
     
     # Create Chunk collection with references and vector config
     if "Chunk" not in existing_collections:
+        created.add("Chunk")
         client.collections.create(
             name="Chunk",
             properties=[
@@ -91,4 +124,5 @@ def ensure_schema():
                     distance_metric=VectorDistances.COSINE
                 )
             )
-        )
\ No newline at end of file
+        )
+    return created
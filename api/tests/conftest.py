@@ -0,0 +1,11 @@
+import pytest
+
+
+def _count_words(texts: list[str]) -> list[int]:
+    return [len(t.split()) for t in texts]
+
+
+@pytest.fixture
+def count_words():
+    """Whitespace token counter, so tests never load the embedding model."""
+    return _count_words
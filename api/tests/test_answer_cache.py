@@ -0,0 +1,41 @@
+from app import answer_cache
+from app.answer_cache import AnswerCache
+
+
+def test_hit_above_threshold_only():
+    cache = AnswerCache(threshold=0.9, maxsize=10, ttl=60)
+    cache.store([1.0, 0.0], "scope", 1, "answer")
+    assert cache.lookup([0.995, 0.0998], "scope", 1) == "answer"
+    assert cache.lookup([0.0, 1.0], "scope", 1) is None
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_scope_must_match():
+    cache = AnswerCache(threshold=0.9, maxsize=10, ttl=60)
+    cache.store([1.0, 0.0], ("k", 5), 1, "answer")
+    assert cache.lookup([1.0, 0.0], ("k", 8), 1) is None
+
+
+def test_new_index_version_drops_entries():
+    cache = AnswerCache(threshold=0.9, maxsize=10, ttl=60)
+    cache.store([1.0, 0.0], "scope", 1, "answer")
+    assert cache.lookup([1.0, 0.0], "scope", 2) is None
+    assert cache.stats()["size"] == 0
+    assert cache.lookup([1.0, 0.0], "scope", 1) is None
+
+
+def test_entries_expire(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(answer_cache.time, "monotonic", lambda: now[0])
+    cache = AnswerCache(threshold=0.9, maxsize=10, ttl=30)
+    cache.store([1.0, 0.0], "scope", 1, "answer")
+    now[0] += 31
+    assert cache.lookup([1.0, 0.0], "scope", 1) is None
+
+
+def test_oldest_entries_evicted_past_maxsize():
+    cache = AnswerCache(threshold=0.9, maxsize=2, ttl=60)
+    for i, vec in enumerate(([1.0, 0.0], [0.0, 1.0], [-1.0, 0.0])):
+        cache.store(vec, "scope", 1, i)
+    assert cache.lookup([1.0, 0.0], "scope", 1) is None
+    assert cache.lookup([-1.0, 0.0], "scope", 1) == 2
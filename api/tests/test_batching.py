@@ -0,0 +1,59 @@
+import asyncio
+import pytest
+from app.batching import MicroBatcher
+
+
+def _double(items):
+    return [2 * x for x in items]
+
+
+def test_merges_concurrent_items():
+    batcher = MicroBatcher(_double, max_batch=8, max_wait_ms=100, name="test-merge")
+    futures = [batcher.submit(i) for i in range(3)]
+    assert [f.result(timeout=2) for f in futures] == [0, 2, 4]
+    assert batcher.stats()["batches"] == 1
+
+
+def test_cancelled_waiter_does_not_stop_the_worker():
+    calls = []
+    batcher = MicroBatcher(lambda items: calls.append(items) or _double(items),
+                           max_batch=8, max_wait_ms=100, name="test-cancel")
+    kept, dropped = batcher.submit(1), batcher.submit(2)
+    assert dropped.cancel()
+    assert kept.result(timeout=2) == 2
+    assert calls == [[1]]
+    assert batcher.submit(3).result(timeout=2) == 6
+    assert batcher._thread.is_alive()
+
+
+def test_cancelled_async_waiters():
+    # /ask/batch cancels tasks awaiting wrap_future(submit(...)) when the client disconnects
+    batcher = MicroBatcher(_double, max_batch=8, max_wait_ms=50, name="test-async")
+
+    async def main():
+        waiters = [asyncio.wrap_future(batcher.submit(i)) for i in range(4)]
+        await asyncio.sleep(0)
+        waiters[1].cancel()
+        waiters[3].cancel()
+        done = await asyncio.wait_for(asyncio.gather(*waiters, return_exceptions=True), 2)
+        later = await asyncio.wait_for(asyncio.wrap_future(batcher.submit(5)), 2)
+        return done, later
+
+    done, later = asyncio.run(main())
+    assert done[0] == 0 and done[2] == 4
+    assert isinstance(done[1], asyncio.CancelledError) and isinstance(done[3], asyncio.CancelledError)
+    assert later == 10
+
+
+def test_errors_reach_every_waiter_and_worker_survives():
+    def fail_on_negative(items):
+        if any(x < 0 for x in items):
+            raise ValueError("negative")
+        return _double(items)
+
+    batcher = MicroBatcher(fail_on_negative, max_batch=8, max_wait_ms=100, name="test-error")
+    futures = [batcher.submit(1), batcher.submit(-1)]
+    for f in futures:
+        with pytest.raises(ValueError):
+            f.result(timeout=2)
+    assert batcher.submit(4).result(timeout=2) == 8
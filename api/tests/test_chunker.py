@@ -0,0 +1,58 @@
+from app.chunker import chunk_markdown, sections, sentence_spans
+
+
+NOTE = """Intro line before any heading.
+
+## The Docks
+Mira met the harbourmaster. He wanted gold. She refused.
+
+The ship sailed at dawn.
+
+## Aftermath
+- Mira lost her lute
+- Torren found a map
+"""
+
+
+def test_sections_split_on_h2():
+    found = sections(NOTE)
+    assert [h for h, _, _ in found] == [None, "The Docks", "Aftermath"]
+    assert NOTE[found[0][1]:found[0][2]] == "Intro line before any heading."
+
+
+def test_chunks_carry_offsets(count_words):
+    for _, chunks in chunk_markdown(NOTE, count_words, 8):
+        for chunk in chunks:
+            assert NOTE[chunk.start:chunk.end] == chunk.text
+
+
+def test_chunks_respect_token_limit(count_words):
+    long_note = "## Long\n" + " ".join(f"word{i}" for i in range(50))
+    (heading, chunks), = chunk_markdown(long_note, count_words, 8)
+    assert heading == "Long"
+    assert all(len(c.text.split()) <= 8 for c in chunks)
+    assert " ".join(c.text for c in chunks).split() == long_note.split()[2:]
+
+
+def test_paragraphs_kept_whole_when_they_fit(count_words):
+    chunks = dict(chunk_markdown(NOTE, count_words, 100))["The Docks"]
+    assert len(chunks) == 1
+    assert chunks[0].text.startswith("Mira met") and chunks[0].text.endswith("at dawn.")
+
+
+def test_sentences_split_before_words(count_words):
+    chunks = dict(chunk_markdown(NOTE, count_words, 5))["The Docks"]
+    assert [c.text for c in chunks] == ["Mira met the harbourmaster.", "He wanted gold. She refused.",
+                                       "The ship sailed at dawn."]
+
+
+def test_overlap_repeats_trailing_units(count_words):
+    chunks = dict(chunk_markdown(NOTE, count_words, 7, overlap_tokens=3))["The Docks"]
+    assert len(chunks) > 1
+    for prev, chunk in zip(chunks, chunks[1:]):
+        assert chunk.start < prev.end
+
+
+def test_sentence_spans_include_list_lines():
+    text = "- one\n- two\nA sentence. Another one!"
+    assert [text[s:e] for s, e in sentence_spans(text)] == ["- one", "- two", "A sentence.", "Another one!"]
@@ -0,0 +1,80 @@
+import pytest
+from app import context_packer
+from app.config import settings
+from app.context_packer import (merge_overlapping, drop_near_duplicates, trim_to_sentences, pack_context,
+                                with_cached_vectors)
+from app.embedding_cache import EmbeddingCache
+
+
+NOTE = "Mira met the harbourmaster. He wanted gold. She refused. The ship sailed at dawn."
+
+
+def _item(chunk_id, start, end, text=None, doc_id="d1", vector=None, **extra):
+    return {"chunk_id": chunk_id, "text": NOTE[start:end] if text is None else text, "heading": "Docks",
+            "doc_title": "Session 3", "path": "s3.md", "sessionNo": 3, "sessionDate": None,
+            "startChar": start, "endChar": end, "doc_id": doc_id, "refs": {}, "vector": vector, **extra}
+
+
+@pytest.fixture(autouse=True)
+def word_tokens(monkeypatch, count_words):
+    monkeypatch.setattr(context_packer, "count_tokens", count_words)
+    monkeypatch.setattr(context_packer, "get_embedding_cache", lambda: None)
+
+
+def test_merges_overlapping_windows():
+    blocks = merge_overlapping([_item("a", 0, 44), _item("b", 28, 57), _item("c", 0, 27, doc_id="d2")])
+    assert [b["chunk_id"] for b in blocks] == ["a", "c"]
+    assert blocks[0]["text"] == NOTE[0:57]
+    assert (blocks[0]["startChar"], blocks[0]["endChar"]) == (0, 57)
+
+
+def test_does_not_merge_disjoint_or_mismatched_windows():
+    disjoint = merge_overlapping([_item("a", 0, 27), _item("b", 44, 57)])
+    mismatched = merge_overlapping([_item("a", 0, 44), _item("b", 28, 57, text="Something else entirely.")])
+    assert len(disjoint) == 2 and len(mismatched) == 2
+
+
+def test_drops_near_duplicates():
+    blocks = [{"vector": [1.0, 0.0]}, {"vector": [0.99, 0.01]}, {"vector": [0.0, 1.0]}, {"vector": None}]
+    assert drop_near_duplicates(blocks, 0.95) == [blocks[0], blocks[2], blocks[3]]
+    assert drop_near_duplicates(blocks, 0) == blocks
+
+
+def test_trim_prefers_sentences_matching_the_query():
+    assert trim_to_sentences("what gold did he want", NOTE, 4) == "He wanted gold."
+    assert trim_to_sentences("gold dawn", NOTE, 9) == "He wanted gold. … The ship sailed at dawn."
+    assert trim_to_sentences("gold", NOTE, 1) is None
+
+
+def test_pack_fits_budget_and_trims(monkeypatch):
+    monkeypatch.setattr(settings, "context_full_chunks", 1)
+    monkeypatch.setattr(settings, "context_trim_tokens", 6)
+    monkeypatch.setattr(settings, "context_dedupe_similarity", 0)
+    first = _item("a", 0, 27, doc_id="d1")
+    second = _item("b", 28, len(NOTE), doc_id="d2")
+    packed = pack_context("when did the ship sail", [first, second], budget=30, max_chunks=5)
+    assert [b["chunk_id"] for b in packed] == ["a", "b"]
+    assert packed[0]["trimmed"] is False and packed[1]["trimmed"] is True
+    assert packed[1]["text"] == "The ship sailed at dawn."
+    assert all("vector" not in b for b in packed)
+
+
+def test_pack_skips_blocks_past_the_budget(monkeypatch):
+    monkeypatch.setattr(settings, "context_dedupe_similarity", 0)
+    packed = pack_context("harbourmaster", [_item("a", 0, len(NOTE))], budget=3, max_chunks=5)
+    assert packed == []
+
+
+def test_cached_vectors_feed_dedupe(monkeypatch, tmp_path):
+    cache = EmbeddingCache(str(tmp_path), "test-model", 100)
+    cache.put_many(["Mira met the harbourmaster.", "Mira met the harbour master."], [[1.0, 0.0], [0.99, 0.01]])
+    monkeypatch.setattr(context_packer, "get_embedding_cache", lambda: cache)
+    items = [_item("a", 0, 27, doc_id="d1"), _item("b", 0, 28, text="Mira met the harbour master.", doc_id="d2")]
+    assert [it["vector"] for it in with_cached_vectors(items)] == [[1.0, 0.0], pytest.approx([0.99, 0.01])]
+    assert items[0]["vector"] is None
+    # Query-time reads must not show up in ingest's embed_cache_hits/misses
+    assert cache.stats()["hits"] == 0 and cache.stats()["misses"] == 0
+
+    monkeypatch.setattr(settings, "context_dedupe_similarity", 0.95)
+    packed = pack_context("harbourmaster", items, budget=100, max_chunks=5)
+    assert [b["chunk_id"] for b in packed] == ["a"]
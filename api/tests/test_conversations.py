@@ -0,0 +1,43 @@
+import pytest
+from app import conversations
+from app.config import settings
+from app.conversations import Conversation
+
+
+@pytest.fixture(autouse=True)
+def word_tokens(monkeypatch):
+    monkeypatch.setattr(conversations, "count_tokens", lambda texts: [len(t.split()) for t in texts])
+
+
+def _block(chunk_id: str, text: str) -> dict:
+    return {"chunk_id": chunk_id, "text": text, "heading": "", "doc_title": "Note", "path": "note.md",
+            "sessionNo": None, "sessionDate": None, "refs": {}}
+
+
+def test_turn_keeps_only_new_blocks():
+    conv = Conversation()
+    conv.add_turn("who is Mira?", [1.0, 0.0], [_block("a", "Mira is a bard.")], "A bard.")
+    conv.add_turn("and her lute?", [0.0, 1.0], [_block("a", "Mira is a bard."), _block("b", "Her lute is old.")],
+                  "It is old.")
+    assert conv.turns[1]["chunk_ids"] == ["b"]
+    assert "Mira is a bard." not in conv.turns[1]["messages"][0]["content"]
+    assert conv.seen_chunk_ids() == {"a", "b"}
+
+
+def test_history_capped_by_tokens(monkeypatch):
+    monkeypatch.setattr(settings, "conversation_history_tokens", 60)
+    conv = Conversation()
+    for i in range(4):
+        conv.add_turn(f"question {i}", [1.0], [_block(f"c{i}", "word " * 20)], "answer")
+    assert [t["query"] for t in conv.turns][-1] == "question 3"
+    assert 0 < len(conv.turns) < 4
+    assert conv.history_tokens() <= 60
+    assert len(conv.history()) == 2 * len(conv.turns)
+
+
+def test_history_capped_by_turns(monkeypatch):
+    monkeypatch.setattr(settings, "conversation_max_turns", 2)
+    conv = Conversation()
+    for i in range(3):
+        conv.add_turn(f"q{i}", [1.0], [], "a")
+    assert [t["query"] for t in conv.turns] == ["q1", "q2"]
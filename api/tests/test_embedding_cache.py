@@ -0,0 +1,71 @@
+import pytest
+from app.embedding_cache import EmbeddingCache
+
+
+def _vec(i: int) -> list[float]:
+    return [float(i), 1.0]
+
+
+def _put(cache: EmbeddingCache, ids):
+    cache.put_many([f"t{i}" for i in ids], [_vec(i) for i in ids])
+
+
+def test_roundtrip_and_reload(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), "m", 100)
+    _put(cache, range(3))
+    assert cache.get_many(["t1", "nope"]) == [_vec(1), None]
+    reloaded = EmbeddingCache(str(tmp_path), "m", 100)
+    assert len(reloaded) == 3 and reloaded.get_many(["t2"]) == [_vec(2)]
+
+
+def test_other_model_starts_empty(tmp_path):
+    _put(EmbeddingCache(str(tmp_path), "m", 100), range(3))
+    assert len(EmbeddingCache(str(tmp_path), "other", 100)) == 0
+
+
+def test_compaction_keeps_half(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), "m", 10)
+    _put(cache, range(10))
+    _put(cache, [10])
+    assert len(cache) == 6
+    assert cache.get_many(["t4", "t5", "t10"]) == [None, _vec(5), _vec(10)]
+
+
+def test_large_batch_does_not_wipe_cache(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), "m", 10)
+    _put(cache, range(8))
+    _put(cache, range(100, 107))
+    assert len(cache) == 10
+    assert cache.get_many(["t4", "t5", "t7", "t100", "t106"]) == [None, _vec(5), _vec(7), _vec(100), _vec(106)]
+
+
+def test_oversized_batch_keeps_its_tail(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), "m", 4)
+    _put(cache, range(6))
+    assert len(cache) == 4
+    assert cache.get_many(["t1", "t2", "t5"]) == [None, _vec(2), _vec(5)]
+
+
+def test_recently_used_rows_survive_compaction(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), "m", 10)
+    _put(cache, range(10))
+    cache.get_many(["t0", "t1"])
+    _put(cache, [10])
+    assert cache.get_many(["t0", "t1", "t2", "t9"]) == [_vec(0), _vec(1), None, _vec(9)]
+    reloaded = EmbeddingCache(str(tmp_path), "m", 10)
+    assert reloaded.get_many(["t0", "t10"]) == [_vec(0), _vec(10)]
+
+
+@pytest.mark.parametrize("max_entries", [1, 3])
+def test_never_exceeds_max_entries(tmp_path, max_entries):
+    cache = EmbeddingCache(str(tmp_path), "m", max_entries)
+    for start in range(0, 20, 3):
+        _put(cache, range(start, start + 3))
+        assert len(cache) <= max_entries
+
+
+def test_uncounted_reads_leave_stats_alone(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), "m", 10)
+    _put(cache, range(2))
+    assert cache.get_many(["t0", "nope"], count=False) == [_vec(0), None]
+    assert cache.stats()["hits"] == 0 and cache.stats()["misses"] == 0
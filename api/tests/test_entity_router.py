@@ -0,0 +1,49 @@
+import pytest
+from app import entity_router as er
+from app.entity_router import AhoCorasick, EntityRouter, EntityMatch, group_by_ref
+
+
+ENTITIES = {
+    "characters": {"Mira": "c-mira", "Torren": "c-torren"},
+    "locations": {"Ice": "l-ice", "Ice Village": "l-ice-village"},
+    "organizations": {"The Order": "o-order"},
+}
+
+
+@pytest.fixture
+def router(monkeypatch):
+    # No scan has run, so the router falls back to names read from the notes
+    for name in ("_char_name_to_id", "_location_name_to_id", "_organization_name_to_id"):
+        monkeypatch.setattr(er, name, {})
+    monkeypatch.setattr(er, "entity_ids_from_notes", lambda: {ref: dict(m) for ref, m in ENTITIES.items()})
+    return EntityRouter()
+
+
+def test_aho_corasick_finds_overlapping_patterns():
+    matcher = AhoCorasick([("he", 1), ("she", 2), ("hers", 3)])
+    assert sorted(matcher.find("ushers")) == [(1, 4, 2), (2, 4, 1), (2, 6, 3)]
+
+
+def test_match_prefers_leftmost_longest(router):
+    matches = router.match("What happened to mira in the ice village?")
+    assert [m.id for m in matches] == ["c-mira", "l-ice-village"]
+
+
+def test_match_needs_word_boundaries(router):
+    assert router.match("Admiral Icefang met Torrens") == []
+
+
+def test_match_reports_each_entity_once(router):
+    assert [m.id for m in router.match("Mira, Torren and Mira again")] == ["c-mira", "c-torren"]
+
+
+def test_resolve_splits_known_and_unknown(router):
+    found, unknown = router.resolve([" the order ", "Nobody"])
+    assert found == [EntityMatch("organizations", "o-order", "The Order")]
+    assert unknown == ["Nobody"]
+
+
+def test_group_by_ref():
+    matches = [EntityMatch("characters", "a", "A"), EntityMatch("locations", "b", "B"),
+               EntityMatch("characters", "c", "C")]
+    assert group_by_ref(matches) == {"characters": ["a", "c"], "locations": ["b"]}
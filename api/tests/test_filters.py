@@ -0,0 +1,218 @@
+import asyncio
+import datetime
+from types import SimpleNamespace
+import pytest
+from fastapi import HTTPException
+from weaviate.collections.classes.filters import _FilterAnd, _FilterOr, _FilterValue
+from app import main, retrieval
+from app import entity_router as er
+from app.config import settings
+from app.entity_router import EntityRouter
+from app.filters import SearchFilters
+from app.local_index import LocalIndex
+from app.models import AskRequest
+
+
+MIRA = "3f2a1c4e-5b6d-5e7f-8a9b-0c1d2e3f4a5b"
+DOCKS = "7c9e6679-7425-50de-944b-e07fc1f90ae7"
+
+
+def _ops(f) -> list[tuple]:
+    # (target, operator, value) of every leaf filter, flattened
+    if isinstance(f, (_FilterAnd, _FilterOr)):
+        return [op for sub in f.filters for op in _ops(sub)]
+    target = f.target if isinstance(f.target, str) else (f.target.link_on, f.target.target)
+    return [(target, f.operator.name, f.value)]
+
+
+def test_empty_filters():
+    assert SearchFilters().is_empty()
+    assert SearchFilters().to_weaviate() is None
+
+
+def test_single_condition_is_not_wrapped():
+    f = SearchFilters(from_session=3).to_weaviate()
+    assert isinstance(f, _FilterValue)
+    assert _ops(f) == [("sessionNo", "GREATER_THAN_EQUAL", 3)]
+
+
+def test_to_weaviate_combines_all_conditions():
+    f = SearchFilters(from_session=2, to_session=5, from_date="2024-04-01", to_date="2024-05-01",
+                      doc_types=["session", "character"], entities={"characters": [MIRA]}).to_weaviate()
+    assert isinstance(f, _FilterAnd) and len(f.filters) == 6
+    assert isinstance(f.filters[4], _FilterOr)
+    utc = datetime.timezone.utc
+    assert _ops(f) == [
+        ("sessionNo", "GREATER_THAN_EQUAL", 2),
+        ("sessionNo", "LESS_THAN_EQUAL", 5),
+        ("sessionDate", "GREATER_THAN_EQUAL", datetime.datetime(2024, 4, 1, tzinfo=utc)),
+        # to_date is inclusive: before the start of the next day
+        ("sessionDate", "LESS_THAN", datetime.datetime(2024, 5, 2, tzinfo=utc)),
+        (("ofDoc", "type"), "EQUAL", "session"),
+        (("ofDoc", "type"), "EQUAL", "character"),
+        (("characters", "_id"), "CONTAINS_ANY", [MIRA]),
+    ]
+
+
+def test_entities_across_refs_match_any():
+    f = SearchFilters(entities={"characters": [MIRA], "locations": [DOCKS]}).to_weaviate()
+    assert isinstance(f, _FilterOr)
+    assert [op[0] for op in _ops(f)] == [("characters", "_id"), ("locations", "_id")]
+
+
+@pytest.mark.parametrize("filters, props, refs, doc, expected", [
+    (SearchFilters(from_session=2, to_session=4), {"sessionNo": 3}, None, None, True),
+    (SearchFilters(from_session=2), {"sessionNo": 1}, None, None, False),
+    (SearchFilters(to_session=4), {"sessionNo": None}, None, None, False),
+    (SearchFilters(from_date="2024-05-01", to_date="2024-05-01"),
+     {"sessionDate": "2024-05-01T00:00:00Z"}, None, None, True),
+    (SearchFilters(to_date="2024-04-30"), {"sessionDate": "2024-05-01T00:00:00Z"}, None, None, False),
+    (SearchFilters(from_date="2024-01-01"), {"sessionDate": None}, None, None, False),
+    (SearchFilters(doc_types=["character"]), {}, None, {"type": "character"}, True),
+    (SearchFilters(doc_types=["character"]), {}, None, {"type": "session"}, False),
+    (SearchFilters(doc_types=["character"]), {}, None, None, False),
+    (SearchFilters(entities={"characters": [MIRA]}), {}, {"characters": [MIRA]}, None, True),
+    (SearchFilters(entities={"characters": [MIRA]}), {}, {"locations": [MIRA]}, None, False),
+    (SearchFilters(), {}, None, None, True),
+])
+def test_matches(filters, props, refs, doc, expected):
+    assert filters.matches(props, refs, doc) is expected
+
+
+@pytest.fixture
+def router(monkeypatch):
+    for name in ("_char_name_to_id", "_location_name_to_id", "_organization_name_to_id"):
+        monkeypatch.setattr(er, name, {})
+    monkeypatch.setattr(er, "entity_ids_from_notes",
+                        lambda: {"characters": {"Mira": MIRA}, "locations": {"The Docks": DOCKS},
+                                 "organizations": {}})
+    router = EntityRouter()
+    monkeypatch.setattr(main, "entity_router", router)
+    return router
+
+
+def test_build_filters_ranges_and_types(router):
+    req = AskRequest(query="q", from_session=2, to_session=6, from_date="2024-04-01", to_date="2024-05-01",
+                     doc_types=["session"])
+    assert main.build_filters(req) == SearchFilters(from_session=2, to_session=6, from_date="2024-04-01",
+                                                    to_date="2024-05-01", doc_types=["session"])
+
+
+def test_build_filters_recent_only(monkeypatch, router):
+    monkeypatch.setattr(main, "latest_session_no", lambda: 10)
+    monkeypatch.setattr(settings, "recent_sessions", 3)
+    assert main.build_filters(AskRequest(query="q", recent_only=True)).from_session == 8
+    # An explicit later start wins; an earlier one is narrowed
+    assert main.build_filters(AskRequest(query="q", recent_only=True, from_session=9)).from_session == 9
+    assert main.build_filters(AskRequest(query="q", recent_only=True, from_session=2)).from_session == 8
+
+
+def test_build_filters_recent_only_without_sessions(monkeypatch, router):
+    monkeypatch.setattr(main, "latest_session_no", lambda: None)
+    assert main.build_filters(AskRequest(query="q", recent_only=True)).is_empty()
+
+
+def test_build_filters_entities(router):
+    filters = main.build_filters(AskRequest(query="q", entities=["mira", "The Docks"]))
+    assert filters.entities == {"characters": [MIRA], "locations": [DOCKS]}
+
+
+def test_build_filters_unknown_entity(router):
+    with pytest.raises(HTTPException) as exc:
+        main.build_filters(AskRequest(query="q", entities=["Mira", "Nobody"]))
+    assert exc.value.status_code == 400
+    assert "Nobody" in exc.value.detail
+
+
+class FakeQuery:
+    def __init__(self):
+        self.calls = []
+
+    def hybrid(self, **kwargs):
+        self.calls.append(kwargs)
+        return SimpleNamespace(objects=[])
+
+
+class FakeAsyncQuery(FakeQuery):
+    async def hybrid(self, **kwargs):
+        return FakeQuery.hybrid(self, **kwargs)
+
+
+def _fake_client(query):
+    chunks = SimpleNamespace(query=query)
+    return SimpleNamespace(collections=SimpleNamespace(get=lambda name: chunks))
+
+
+@pytest.fixture
+def weaviate_backend(monkeypatch):
+    monkeypatch.setattr(settings, "retrieval_backend", "weaviate")
+    monkeypatch.setattr(settings, "enable_reranker", False)
+    monkeypatch.setattr(retrieval, "get_embedding_cache", lambda: None)
+
+
+def test_filters_reach_hybrid_query(monkeypatch, weaviate_backend):
+    query = FakeQuery()
+    monkeypatch.setattr(retrieval, "get_client", lambda: _fake_client(query))
+    retrieval.hybrid_search("docks", k=5, filters=SearchFilters(to_session=4), query_vector=[1.0, 0.0])
+    retrieval.hybrid_search("docks", k=5, query_vector=[1.0, 0.0])
+    assert _ops(query.calls[0]["filters"]) == [("sessionNo", "LESS_THAN_EQUAL", 4)]
+    assert query.calls[0]["limit"] == 5
+    assert query.calls[1]["filters"] is None
+
+
+def test_entity_routing_scopes_async_query(monkeypatch, weaviate_backend):
+    query = FakeAsyncQuery()
+
+    async def get_async_client():
+        return _fake_client(query)
+
+    monkeypatch.setattr(retrieval, "get_async_client", get_async_client)
+    monkeypatch.setattr(retrieval, "match_entities", lambda q: [er.EntityMatch("characters", MIRA, "Mira")])
+    monkeypatch.setattr(settings, "entity_routing", "filter")
+    monkeypatch.setattr(settings, "entity_filter_min_results", 1)
+    asyncio.run(retrieval.routed_search_async("what did mira do", k=5, filters=SearchFilters(from_session=2),
+                                              query_vector=[1.0, 0.0]))
+    # Scoped to the entity first; no results, so it falls back to the request's own filters
+    assert _ops(query.calls[0]["filters"]) == [("sessionNo", "GREATER_THAN_EQUAL", 2),
+                                               (("characters", "_id"), "CONTAINS_ANY", [MIRA])]
+    assert _ops(query.calls[1]["filters"]) == [("sessionNo", "GREATER_THAN_EQUAL", 2)]
+
+
+@pytest.fixture
+def local_index(tmp_path, monkeypatch):
+    index = LocalIndex(str(tmp_path))
+    index.add("Document", {"type": "session", "title": "Session 1"}, uuid="doc-s1")
+    index.add("Document", {"type": "character", "title": "Mira Character"}, uuid="doc-mira")
+    chunks = [
+        ("c1", "doc-s1", 1, "2024-04-01T00:00:00Z", [MIRA], "Mira reached the docks at night."),
+        ("c2", "doc-s1", 2, "2024-04-08T00:00:00Z", [], "The docks burned while the crew slept."),
+        ("c3", "doc-mira", None, None, [], "Mira is a bard who hates the docks."),
+    ]
+    for chunk_id, doc, session_no, date, chars, text in chunks:
+        index.add("Chunk", {"text": text, "heading": "", "sessionNo": session_no, "sessionDate": date,
+                            "doc_title": doc}, uuid=chunk_id,
+                  references={"ofDoc": doc, "characters": chars}, vector=[1.0, 0.0])
+    monkeypatch.setattr(settings, "enable_reranker", False)
+    monkeypatch.setattr(retrieval, "get_embedding_cache", lambda: None)
+    monkeypatch.setattr(retrieval, "get_local_index", lambda: index)
+    return index
+
+
+@pytest.mark.parametrize("filters, expected", [
+    (None, {"c1", "c2", "c3"}),
+    (SearchFilters(from_session=2), {"c2"}),
+    (SearchFilters(to_date="2024-04-01"), {"c1"}),
+    (SearchFilters(doc_types=["character"]), {"c3"}),
+    (SearchFilters(entities={"characters": [MIRA]}), {"c1"}),
+    (SearchFilters(from_session=2, entities={"characters": [MIRA]}), set()),
+])
+def test_local_index_applies_filters(local_index, filters, expected):
+    results = retrieval.hybrid_search("docks", k=10, filters=filters, query_vector=[1.0, 0.0], backend="local")
+    assert {r["chunk_id"] for r in results} == expected
+
+
+def test_build_filters_off_the_event_loop(router):
+    # The async handlers run it on the CPU pool; the 400 must still come through
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(main.run_cpu(main.build_filters, AskRequest(query="q", entities=["Nobody"])))
+    assert exc.value.status_code == 400
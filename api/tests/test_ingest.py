@@ -0,0 +1,93 @@
+import os
+import uuid as uuidlib
+from types import SimpleNamespace
+import pytest
+from weaviate.util import generate_uuid5
+from app import embeddings, ingest
+from app.config import settings
+from app.embedding_cache import EmbeddingCache
+from app.local_index import LocalIndex
+from app.manifest import manifest_path
+
+
+@pytest.fixture
+def notes(tmp_path, monkeypatch, count_words):
+    """A small notes tree scanned into a local index, with a fresh cache dir and no model."""
+    dirs = {name: tmp_path / "notes" / name for name in ("sessions", "characters", "locations", "organizations")}
+    for d in dirs.values():
+        d.mkdir(parents=True)
+    (dirs["sessions"] / "Session 1 - 2024-04-01.md").write_text("## Docks\nMira met [[Torren]] at the docks.\n")
+    (dirs["sessions"] / "Session 2 - 2024-04-08.md").write_text("## Fire\nThe docks burned.\n")
+    (dirs["characters"] / "Torren.md").write_text("Torren is a smuggler.\n")
+    monkeypatch.setattr(ingest, "SESS_DIR", str(dirs["sessions"]))
+    monkeypatch.setattr(ingest, "CHAR_DIR", str(dirs["characters"]))
+    monkeypatch.setattr(ingest, "LOC_DIR", str(dirs["locations"]))
+    monkeypatch.setattr(ingest, "ORG_DIR", str(dirs["organizations"]))
+    monkeypatch.setattr(settings, "cache_dir", str(tmp_path / "cache"))
+
+    cache = EmbeddingCache(str(tmp_path / "cache" / "embeddings"), "test-model", 1000)
+    monkeypatch.setattr(embeddings, "get_embedding_cache", lambda: cache)
+    monkeypatch.setattr(ingest, "get_embedding_cache", lambda: cache)
+    monkeypatch.setattr(embeddings, "_encode", lambda texts, batch_size=None: [[1.0, float(len(t))] for t in texts])
+    monkeypatch.setattr(ingest, "count_tokens", count_words)
+    monkeypatch.setattr(ingest, "chunk_token_limit", lambda: 50)
+
+    index = LocalIndex(str(tmp_path / "index"))
+    monkeypatch.setattr(ingest, "get_local_index", lambda: index)
+    ingest._reset_entity_maps(None)
+    return dirs
+
+
+def test_first_scan_with_empty_cache(notes):
+    stats = ingest.scan_once("local")
+    assert stats["indexed_docs"] == 3
+    assert stats["embed_cache_hits"] == 0
+    assert stats["embed_cache_misses"] == stats["indexed_chunks"] == 3
+    assert os.path.exists(manifest_path("local"))
+
+    again = ingest.scan_once("local")
+    assert again["skipped"] == 3 and again["indexed_docs"] == 0
+
+
+def test_partial_scan_without_manifest_scans_everything(notes):
+    one = str(notes["sessions"] / "Session 2 - 2024-04-08.md")
+    stats = ingest.scan_once("local", paths=[one])
+    assert stats["indexed_docs"] == 3
+
+    (notes["sessions"] / "Session 2 - 2024-04-08.md").write_text("## Fire\nThe docks burned twice.\n")
+    stats = ingest.scan_once("local", paths=[one])
+    assert stats["indexed_docs"] == 1 and stats["updated"] == 1
+
+
+class FakeCollection:
+    def __init__(self, objects):
+        self.objects = {str(o.uuid): o for o in objects}
+        self.data = SimpleNamespace(delete_by_id=lambda uuid: self.objects.pop(str(uuid)))
+
+    def iterator(self, return_properties=None):
+        return iter(list(self.objects.values()))
+
+
+def _obj(uuid, **props):
+    return SimpleNamespace(uuid=uuidlib.UUID(str(uuid)), properties=props)
+
+
+def test_delete_legacy_objects(monkeypatch):
+    derived_char = generate_uuid5("Torren", "Character")
+    derived_doc = generate_uuid5("/notes/sessions/Session 1.md", "Document")
+    legacy_char, legacy_doc = uuidlib.uuid4(), uuidlib.uuid4()
+    collections = {
+        "Character": FakeCollection([_obj(derived_char, name="Torren"), _obj(legacy_char, name="Torren")]),
+        "Location": FakeCollection([]),
+        "Organization": FakeCollection([]),
+        "Document": FakeCollection([_obj(derived_doc, path="/notes/sessions/Session 1.md"),
+                                    _obj(legacy_doc, path="/notes/sessions/Session 1.md")]),
+    }
+    client = SimpleNamespace(collections=SimpleNamespace(get=lambda name: collections[name]))
+    monkeypatch.setattr(ingest, "get_client", lambda: client)
+    deleted_docs = []
+    monkeypatch.setattr(ingest, "delete_document", deleted_docs.append)
+
+    assert ingest.delete_legacy_objects() == 2
+    assert list(collections["Character"].objects) == [derived_char]
+    assert deleted_docs == [str(legacy_doc)]
@@ -0,0 +1,106 @@
+import asyncio
+import pytest
+from app import generator
+from app.generator import GenerationScheduler, GenerationRejected
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+async def _job(scheduler, name, priority, order, seconds=0.02):
+    try:
+        async with scheduler.slot(priority):
+            order.append(name)
+            await asyncio.sleep(seconds)
+    except GenerationRejected:
+        order.append(f"{name}:rejected")
+
+
+def test_interactive_jumps_queued_batch():
+    async def main():
+        s = GenerationScheduler(1, 5, {"interactive": 5, "batch": 5}, 0.01)
+        order = []
+        tasks = [asyncio.create_task(_job(s, "b1", "batch", order))]
+        await asyncio.sleep(0)
+        tasks += [asyncio.create_task(_job(s, "b2", "batch", order)),
+                  asyncio.create_task(_job(s, "b3", "batch", order))]
+        await asyncio.sleep(0)
+        tasks.append(asyncio.create_task(_job(s, "i1", "interactive", order)))
+        await asyncio.gather(*tasks)
+        return order, s.info()
+
+    order, info = run(main())
+    assert order == ["b1", "i1", "b2", "b3"]
+    assert info["running"] == 0 and info["queued"] == 0
+
+
+def test_rejects_when_queue_full():
+    async def main():
+        s = GenerationScheduler(1, 1, {"interactive": 100, "batch": 100}, 0.01)
+        order = []
+        await asyncio.gather(*(_job(s, f"i{i}", "interactive", order) for i in range(3)))
+        return order, s.info()
+
+    order, info = run(main())
+    assert order.count("i2:rejected") == 1
+    assert info["rejected"] == 1 and info["running"] == 0
+
+
+def test_rejects_on_estimated_wait():
+    s = GenerationScheduler(1, 10, {"interactive": 1, "batch": 1}, 5.0)
+    s._running = 1
+    with pytest.raises(GenerationRejected) as exc:
+        s.admit("interactive")
+    assert exc.value.retry_after == pytest.approx(5.0)
+
+
+def test_times_out_in_queue():
+    async def main():
+        s = GenerationScheduler(1, 5, {"interactive": 0.05, "batch": 1}, 0.01)
+        order = []
+        await asyncio.gather(_job(s, "long", "interactive", order, 0.3),
+                             _job(s, "waiter", "interactive", order))
+        return order, s.info()
+
+    order, info = run(main())
+    assert order == ["long", "waiter:rejected"]
+    assert info["timed_out"] == 1 and info["running"] == 0 and info["queued"] == 0
+
+
+def test_timeout_racing_release(monkeypatch):
+    # The running generation finishes (release pops the already-cancelled
+    # entry) between the waiter's timeout and its cleanup
+    s = GenerationScheduler(1, 5, {"interactive": 1, "batch": 1}, 0.01)
+
+    async def racing_wait_for(fut, timeout):
+        fut.cancel()
+        s.release(0.01)
+        raise asyncio.TimeoutError
+
+    async def main():
+        await s.acquire("interactive")
+        monkeypatch.setattr(generator.asyncio, "wait_for", racing_wait_for)
+        with pytest.raises(GenerationRejected):
+            await s.acquire("interactive")
+
+    run(main())
+    assert s.info()["running"] == 0 and s.info()["queued"] == 0
+    assert s.stats["timed_out"] == 1
+
+
+def test_cancelled_waiter_leaves_queue():
+    async def main():
+        s = GenerationScheduler(1, 5, {"interactive": 5, "batch": 5}, 0.01)
+        order = []
+        first = asyncio.create_task(_job(s, "a", "batch", order, 0.05))
+        await asyncio.sleep(0)
+        second = asyncio.create_task(_job(s, "b", "batch", order))
+        await asyncio.sleep(0.01)
+        second.cancel()
+        await asyncio.gather(first, second, return_exceptions=True)
+        return order, s.info()
+
+    order, info = run(main())
+    assert order == ["a"]
+    assert info["running"] == 0 and info["queued"] == 0